@@ -0,0 +1,181 @@
+"""
+Persistent HTTP response cache for Chess.com archive downloads.
+
+Each cached URL is stored as two files named after the SHA-1 of the URL:
+    <key>.meta.json   url, ETag, Last-Modified, fetch time, completeness flag
+    <key>.body.gz     the response body, gzip-compressed
+
+Month archives (`.../games/YYYY/MM`) whose month had already ended when they
+were fetched are marked complete and are never requested again. Everything
+else (the current month, the per-player archive lists) is revalidated with
+If-None-Match / If-Modified-Since so unchanged responses cost a 304.
+"""
+
+import calendar
+import gzip
+import hashlib
+import json
+import os
+import re
+import time
+from typing import IO, Dict, Iterator, Optional
+
+CACHE_DIR = "assets/chess_com_archive_cache"
+
+# Treat a month as complete only once it has been over for this long, so late
+# games finishing around midnight UTC still make it into the cached body.
+COMPLETE_GRACE_SECONDS = 24 * 3600
+
+_MONTH_URL_RE = re.compile(r"/games/(\d{4})/(\d{2})/?$")
+
+
+def archive_month(url: str) -> Optional[tuple]:
+    """Returns (year, month) for a month archive URL, or None for other URLs."""
+    match = _MONTH_URL_RE.search(url)
+    if not match:
+        return None
+    return int(match.group(1)), int(match.group(2))
+
+
+def is_completed_month(url: str, at: Optional[float] = None) -> bool:
+    """True if the archive's month had fully ended (plus grace period) at time `at`."""
+    month = archive_month(url)
+    if month is None:
+        return False
+    year, mon = month
+    last_day = calendar.monthrange(year, mon)[1]
+    month_end = calendar.timegm((year, mon, last_day, 23, 59, 59, 0, 0, 0)) + 1
+    return (at if at is not None else time.time()) >= month_end + COMPLETE_GRACE_SECONDS
+
+
+class CacheWriter:
+    """Streams a response body into the cache; the entry only appears on commit()."""
+
+    def __init__(self, cache: "ArchiveCache", url: str):
+        self.cache = cache
+        self.url = url
+        self.meta_path, self.body_path = cache.paths(url)
+        self.tmp_path = f"{self.body_path}.{os.getpid()}.tmp"
+        self._raw = open(self.tmp_path, "wb")
+        self._gz = gzip.GzipFile(fileobj=self._raw, mode="wb", compresslevel=6)
+        self.size = 0
+
+    def write(self, chunk: bytes):
+        self._gz.write(chunk)
+        self.size += len(chunk)
+
+    def commit(self, headers):
+        self._gz.close()
+        self._raw.close()
+        os.replace(self.tmp_path, self.body_path)
+        fetched_at = time.time()
+        meta = {
+            "url": self.url,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "fetched_at": fetched_at,
+            "size": self.size,
+            "complete": is_completed_month(self.url, fetched_at),
+        }
+        self.cache.write_meta(self.url, meta)
+
+    def abort(self):
+        self._gz.close()
+        self._raw.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        return False
+
+
+class ArchiveCache:
+    def __init__(self, cache_dir: str = CACHE_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def paths(self, url: str) -> tuple:
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self.cache_dir, key)
+        return f"{base}.meta.json", f"{base}.body.gz"
+
+    def load_meta(self, url: str) -> Optional[dict]:
+        meta_path, body_path = self.paths(url)
+        if not (os.path.exists(meta_path) and os.path.exists(body_path)):
+            return None
+        try:
+            with open(meta_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write_meta(self, url: str, meta: dict):
+        meta_path, _ = self.paths(url)
+        tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+
+    def has(self, url: str) -> bool:
+        return self.load_meta(url) is not None
+
+    def is_fresh(self, url: str) -> bool:
+        """True if the cached body can be used without contacting the server at all."""
+        meta = self.load_meta(url)
+        return bool(meta and meta.get("complete"))
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        meta = self.load_meta(url)
+        headers = {}
+        if not meta:
+            return headers
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def mark_revalidated(self, url: str):
+        """Records a 304 response: the body is unchanged, possibly now complete."""
+        meta = self.load_meta(url)
+        if meta is None:
+            return
+        meta["fetched_at"] = time.time()
+        meta["complete"] = is_completed_month(url, meta["fetched_at"])
+        self.write_meta(url, meta)
+
+    def writer(self, url: str) -> CacheWriter:
+        return CacheWriter(self, url)
+
+    def store(self, url: str, body: bytes, headers):
+        with self.writer(url) as w:
+            w.write(body)
+            w.commit(headers)
+
+    def open_body(self, url: str) -> IO[bytes]:
+        _, body_path = self.paths(url)
+        return gzip.open(body_path, "rb")
+
+    def read_body(self, url: str) -> bytes:
+        with self.open_body(url) as f:
+            return f.read()
+
+    def iter_urls(self, months_only: bool = False) -> Iterator[str]:
+        """Yields every cached URL (optionally only month archives), for offline replay."""
+        for name in sorted(os.listdir(self.cache_dir)):
+            if not name.endswith(".meta.json"):
+                continue
+            try:
+                with open(os.path.join(self.cache_dir, name)) as f:
+                    url = json.load(f)["url"]
+            except (OSError, ValueError, KeyError):
+                continue
+            if months_only and archive_month(url) is None:
+                continue
+            if self.has(url):
+                yield url
@@ -1,78 +1,219 @@
-import aiohttp
+"""
+Downloads the chess.com board styles and piece sets into boards/ and pieces/.
+
+Every request goes through one pooled aiohttp session with a connection
+limit, transient failures (429/5xx, dropped connections) are retried with
+exponential backoff, and images are streamed to disk while being hashed.
+`theme_manifest.json` records each fetched URL with its file, size, sha256
+and validators, so a refresh only downloads theme URLs that are new or whose
+file is missing or has a different size; --revalidate also re-checks known
+URLs with conditional requests.
+
+Usage (from assets/):
+    python chess_dot_com_scrapper.py
+    python chess_dot_com_scrapper.py --revalidate
+    python chess_dot_com_scrapper.py --api-base http://127.0.0.1:8000/rpc --boards-only
+"""
+
+import argparse
 import asyncio
+import hashlib
+import json
 import os
+import random
+import sys
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chess_com_async import RETRYABLE_STATUSES, RetryableHTTPError
 
 ALLOW_3D = False
 BOARDS_PATH = 'boards'
 PIECES_PATH = 'pieces'
+MANIFEST_PATH = 'theme_manifest.json'
+API_BASE = 'https://www.chess.com/rpc/chesscom.themes.v1.ThemesService'
+
+MAX_CONNECTIONS = 16
+MAX_RETRIES = 4
+BACKOFF_BASE_SECONDS = 0.5
+CHUNK_SIZE = 64 * 1024
+
+
+class ThemeScraper:
+    def __init__(self, session, manifest_path=MANIFEST_PATH, api_base=API_BASE, revalidate=False,
+                 max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE_SECONDS):
+        self.session = session
+        self.api_base = api_base
+        self.revalidate = revalidate
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.manifest_path = manifest_path
+        self.manifest = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                self.manifest = json.load(f)
+        self.stats = {"downloaded": 0, "unchanged": 0, "skipped": 0, "failed": 0}
+
+    def save_manifest(self):
+        with open(f"{self.manifest_path}.tmp", "w") as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.replace(f"{self.manifest_path}.tmp", self.manifest_path)
+
+    async def _with_retries(self, method, url, handler, **kwargs):
+        """Runs `handler(response)` for one request, retrying transient failures with backoff."""
+        attempt = 0
+        while True:
+            try:
+                async with self.session.request(method, url, **kwargs) as response:
+                    if response.status in RETRYABLE_STATUSES:
+                        retry_after = response.headers.get("Retry-After")
+                        raise RetryableHTTPError(
+                            response.status,
+                            float(retry_after) if retry_after and retry_after.isdigit() else None,
+                        )
+                    if response.status != 304:
+                        response.raise_for_status()
+                    return await handler(response)
+            except (RetryableHTTPError, aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff_base * (2 ** attempt) * (1 + random.random() * 0.25)
+                if isinstance(e, RetryableHTTPError) and e.retry_after is not None:
+                    delay = max(delay, e.retry_after)
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def fetch_data(self, method, json_data):
+        async def handler(response):
+            return await response.json(content_type=None)
+
+        return await self._with_retries("POST", f"{self.api_base}/{method}", handler, json=json_data)
+
+    def _is_current(self, url, path):
+        entry = self.manifest.get(url)
+        return (
+            entry is not None
+            and entry["path"] == path
+            and os.path.exists(path)
+            and os.path.getsize(path) == entry["bytes"]
+        )
+
+    async def download_image(self, url, path):
+        headers = {}
+        if self._is_current(url, path):
+            if not self.revalidate:
+                self.stats["skipped"] += 1
+                return
+            entry = self.manifest[url]
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        async def handler(response):
+            if response.status == 304:
+                self.stats["unchanged"] += 1
+                return
+            digest = hashlib.sha256()
+            size = 0
+            with open(f"{path}.tmp", "wb") as f:
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+            os.replace(f"{path}.tmp", path)
+            self.manifest[url] = {
+                "path": path,
+                "bytes": size,
+                "sha256": digest.hexdigest(),
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }
+            self.stats["downloaded"] += 1
+
+        try:
+            await self._with_retries("GET", url, handler, headers=headers)
+        except (aiohttp.ClientError, asyncio.TimeoutError, RetryableHTTPError) as e:
+            print(f"Failed to download {url}: {e}")
+            self.stats["failed"] += 1
+            if os.path.exists(f"{path}.tmp"):
+                os.remove(f"{path}.tmp")
+
+    # boardStyles[n]["name"  | "image"]
+    async def fetch_board_styles(self):
+        json_data = {
+            'platform': 'WEB',
+            'boardSize': 99999,
+        }
+        return await self.fetch_data('ListBoardStyles', json_data)
+
+    # pieceSets[n]["name"  | "images"] images = dict
+    async def fetch_pieces_sets(self):
+        json_data = {
+            'platform': 'WEB',
+            'piecesSize': 99999,
+        }
+        return await self.fetch_data('ListPieceSets', json_data)
+
+    async def save_board_styles(self):
+        board_styles = await self.fetch_board_styles()
+        os.makedirs(BOARDS_PATH, exist_ok=True)
+        tasks = []
+        for board_style in board_styles["boardStyles"]:
+            light = board_style['coordinateColorLight'].replace("#", "")
+            dark = board_style['coordinateColorDark'].replace("#", "")
+            board_name = f"{board_style['name']}_{light}_{dark}".lower()
+
+            board_image = board_style['image']
+            tasks.append(self.download_image(board_image, f"{BOARDS_PATH}/{board_name}.png"))
+
+        await asyncio.gather(*tasks)
+
+    async def save_pieces_styles(self):
+        pieces_styles = await self.fetch_pieces_sets()
+        tasks = []
+        for piece_style in pieces_styles["pieceSets"]:
+            if piece_style["perspective"] != "TOP_DOWN" and not ALLOW_3D:
+                continue
+
+            set_name = piece_style['name']
+            os.makedirs(f"{PIECES_PATH}/{set_name}", exist_ok=True)
+
+            piece_images = piece_style['images']
+            for piece_name, piece_image in piece_images.items():
+                # converts piece_name from blackKnight -> bK
+                color = piece_name[:5]  # 'black' or 'white'
+                piece = piece_name[5:]  # 'Knight', 'Rook', etc.
+                short_color = 'b' if color == 'black' else 'w'
+                short_piece = piece[0].upper() if piece != 'Knight' else 'N'
+                piece_name = short_color + short_piece
+
+                tasks.append(self.download_image(piece_image, f"{PIECES_PATH}/{set_name}/{piece_name}.png"))
+        await asyncio.gather(*tasks)
+
+
+async def main(api_base=API_BASE, revalidate=False, boards=True, pieces=True, max_connections=MAX_CONNECTIONS):
+    connector = aiohttp.TCPConnector(limit=max_connections)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        scraper = ThemeScraper(session, api_base=api_base, revalidate=revalidate)
+        try:
+            if boards:
+                await scraper.save_board_styles()
+            if pieces:
+                await scraper.save_pieces_styles()
+        finally:
+            scraper.save_manifest()
+    print(f"Done: {scraper.stats}")
 
-async def download_image(url, path):
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            with open(path, 'wb') as f:
-                f.write(await response.read())
-
-async def fetch_data(url, json_data):
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, json=json_data) as response:
-            return await response.json()
-
-# boardStyles[n]["name"  | "image"]
-async def fetch_board_styles():
-    json_data = {
-        'platform': 'WEB',
-        'boardSize': 99999,
-    }
-    url = 'https://www.chess.com/rpc/chesscom.themes.v1.ThemesService/ListBoardStyles'
-    return await fetch_data(url, json_data)
-
-# pieceSets[n]["name"  | "images"] images = dict
-async def fetch_pieces_sets():
-    json_data = {
-        'platform': 'WEB',
-        'piecesSize': 99999,
-    }
-    url = 'https://www.chess.com/rpc/chesscom.themes.v1.ThemesService/ListPieceSets'
-    return await fetch_data(url, json_data)
-
-async def save_board_styles():
-    board_styles = await fetch_board_styles()
-    tasks = []
-    for board_style in board_styles["boardStyles"]:
-        light = board_style['coordinateColorLight'].replace("#", "")
-        dark = board_style['coordinateColorDark'].replace("#", "")
-        board_name = f"{board_style['name']}_{light}_{dark}".lower()
-        
-        board_image = board_style['image']
-        tasks.append(download_image(board_image, f"{BOARDS_PATH}/{board_name}.png"))
-
-    await asyncio.gather(*tasks)
-
-async def save_pieces_styles():
-    pieces_styles = await fetch_pieces_sets()
-    tasks = []
-    for piece_style in pieces_styles["pieceSets"]:
-        if piece_style["perspective"] != "TOP_DOWN" and not ALLOW_3D:
-            continue
-        
-        set_name = piece_style['name']
-        os.makedirs(f"{PIECES_PATH}/{set_name}", exist_ok=True)
-
-        piece_images = piece_style['images']
-        for piece_name, piece_image in piece_images.items():
-            # converts piece_name from blackKnight -> bK
-            color = piece_name[:5]  # 'black' or 'white'
-            piece = piece_name[5:]  # 'Knight', 'Rook', etc.
-            short_color = 'b' if color == 'black' else 'w'
-            short_piece = piece[0].upper() if piece != 'Knight' else 'N'
-            piece_name = short_color + short_piece
-
-            tasks.append(download_image(piece_image, f"{PIECES_PATH}/{set_name}/{piece_name}.png"))
-    await asyncio.gather(*tasks)
-
-async def main():
-    await save_board_styles()
-    await save_pieces_styles()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--api-base", default=API_BASE, help="Themes RPC endpoint (e.g. a local mock server)")
+    parser.add_argument("--revalidate", action="store_true", help="Re-check known URLs with conditional requests")
+    parser.add_argument("--boards-only", action="store_true", help="Only refresh board styles")
+    parser.add_argument("--pieces-only", action="store_true", help="Only refresh piece sets")
+    parser.add_argument("--max-connections", type=int, default=MAX_CONNECTIONS, help="Connection pool size")
+    args = parser.parse_args()
+    asyncio.run(main(args.api_base, args.revalidate, not args.pieces_only, not args.boards_only, args.max_connections))
@@ -1,29 +1,152 @@
+"""
+Rasterizes the lichess SVG piece sets in `raw_pieces_lichess` to PNGs.
+
+Every set is written at 300x300 to `pieces/<set>/`, and with --tile-sizes also
+straight at the tile size the generator draws with (`pieces_tiles/<size>/<set>/`,
+size = BOARD_SIZE // 8), so `generate_datasets.load_pieces` doesn't have to
+resize anything. Each tile size directory gets a `bboxes.json` with the alpha
+bounding box of every tile as rasterized at that size, which load_pieces
+attaches to the tiles for piece scaling and labels.
+
+Conversions run across a process pool and outputs newer than their SVG are
+skipped; their bboxes are kept from the existing bboxes.json (only tiles that
+were re-rasterized, or have no entry yet, are opened and measured).
+
+Usage (from assets/):
+    python convert_lichess_pieces.py
+    python convert_lichess_pieces.py --tile-sizes 80
+    python convert_lichess_pieces.py --force
+"""
+
+import argparse
+import json
+import multiprocessing
 import os
+from typing import Dict, List, Optional, Tuple
+
 import cairosvg
+from PIL import Image
 
 # Define source and target directories
 source_dir = "raw_pieces_lichess"
 output_dir = "pieces"
+tiles_dir = "pieces_tiles"
+
+OUTPUT_SIZE = 300
+TILE_SIZES = [80]  # BOARD_SIZE // 8 in generate_datasets.py; only the size matching it is read
+
+Job = Tuple[str, str, int]  # (svg path, png path, size)
+BBoxes = Dict[str, Dict[str, Optional[List[int]]]]  # {set: {piece: [x1, y1, x2, y2] or None}}
+
+
+def is_up_to_date(svg_path: str, png_path: str) -> bool:
+    return os.path.exists(png_path) and os.path.getmtime(png_path) >= os.path.getmtime(svg_path)
+
+
+def convert_one(args) -> Tuple[str, bool, Optional[List[int]]]:
+    """
+    Pool worker: rasterizes one SVG unless its PNG is up to date; returns (png, converted, bbox).
+    `known` is (bbox, bboxes.json mtime) of a tile output (None for the 300 px outputs, whose
+    bbox is None); a tile is only measured when it is newer than that entry or has none.
+    """
+    (svg_path, png_path, size), force, known = args
+    converted = False
+    if force or not is_up_to_date(svg_path, png_path):
+        # Convert SVG to PNG using CairoSVG (keeping transparency)
+        cairosvg.svg2png(url=svg_path, write_to=f"{png_path}.tmp", output_width=size, output_height=size)
+        os.replace(f"{png_path}.tmp", png_path)
+        converted = True
+    if known is None:
+        return png_path, converted, None
+    bbox, recorded = known
+    if not converted and recorded is not None and os.path.getmtime(png_path) <= recorded:
+        return png_path, converted, bbox
+    with Image.open(png_path) as img:
+        bbox = img.convert("RGBA").getbbox()
+    return png_path, converted, list(bbox) if bbox else None
+
+
+def collect_jobs(tile_sizes: List[int]) -> List[Job]:
+    jobs = []
+    targets = [(output_dir, OUTPUT_SIZE)] + [(os.path.join(tiles_dir, str(size)), size) for size in tile_sizes]
+    for subdir in sorted(os.listdir(source_dir)):
+        subdir_path = os.path.join(source_dir, subdir)
+        if not os.path.isdir(subdir_path):
+            continue
+        for target_dir, size in targets:
+            os.makedirs(os.path.join(target_dir, subdir), exist_ok=True)
+        for filename in sorted(os.listdir(subdir_path)):
+            if not filename.endswith(".svg"):
+                continue
+            svg_path = os.path.join(subdir_path, filename)
+            for target_dir, size in targets:
+                png_path = os.path.join(target_dir, subdir, filename.replace(".svg", ".png"))
+                jobs.append((svg_path, png_path, size))
+    return jobs
+
+
+def _bboxes_path(size: int) -> str:
+    return os.path.join(tiles_dir, str(size), "bboxes.json")
+
+
+def load_bboxes(size: int) -> Tuple[BBoxes, Optional[float]]:
+    """(bboxes.json of a tile size, its mtime), ({}, None) when there is none."""
+    path = _bboxes_path(size)
+    if not os.path.exists(path):
+        return {}, None
+    with open(path) as f:
+        return json.load(f), os.path.getmtime(path)
+
+
+def known_bbox(job: Job, recorded: Dict[int, Tuple[BBoxes, Optional[float]]]):
+    """The `known` argument of convert_one for a job: None unless it renders a tile size."""
+    _, png_path, size = job
+    if os.path.dirname(os.path.dirname(png_path)) != os.path.join(tiles_dir, str(size)):
+        return None
+    bboxes, mtime = recorded[size]
+    piece_set = os.path.basename(os.path.dirname(png_path))
+    piece = os.path.splitext(os.path.basename(png_path))[0]
+    if piece not in bboxes.get(piece_set, {}):
+        return None, None
+    return bboxes[piece_set][piece], mtime
+
 
-# Ensure the output directory exists
-os.makedirs(output_dir, exist_ok=True)
+def write_bboxes(tile_sizes: List[int], results: List[Tuple[str, bool, Optional[List[int]]]]):
+    """Writes pieces_tiles/<size>/bboxes.json as {set: {piece: [x1, y1, x2, y2]}}."""
+    for size in tile_sizes:
+        size_dir = os.path.join(tiles_dir, str(size))
+        bboxes = {}
+        for png_path, _, bbox in results:
+            if os.path.dirname(os.path.dirname(png_path)) != size_dir:
+                continue
+            piece_set = os.path.basename(os.path.dirname(png_path))
+            piece = os.path.splitext(os.path.basename(png_path))[0]
+            bboxes.setdefault(piece_set, {})[piece] = bbox
+        with open(f"{_bboxes_path(size)}.tmp", "w") as f:
+            json.dump(bboxes, f, sort_keys=True)
+        os.replace(f"{_bboxes_path(size)}.tmp", _bboxes_path(size))
 
-# Loop through each subdirectory in the source directory
-for subdir in os.listdir(source_dir):
-    subdir_path = os.path.join(source_dir, subdir)
-    target_subdir = os.path.join(output_dir, subdir)
 
-    if os.path.isdir(subdir_path):
-        os.makedirs(target_subdir, exist_ok=True)
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tile-sizes", default=None, help=f"Comma-separated tile sizes to also rasterize at (e.g. {','.join(map(str, TILE_SIZES))})")
+    parser.add_argument("--force", action="store_true", help="Re-rasterize even if the PNG is newer than its SVG")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: cpu count)")
+    args = parser.parse_args()
 
-        for filename in os.listdir(subdir_path):
-            if filename.endswith(".svg"):
-                svg_path = os.path.join(subdir_path, filename)
-                png_path = os.path.join(target_subdir, filename.replace(".svg", ".png"))
+    tile_sizes = [int(s) for s in args.tile_sizes.split(",")] if args.tile_sizes else []
+    jobs = collect_jobs(tile_sizes)
+    recorded = {size: load_bboxes(size) for size in tile_sizes}
+    num_workers = args.workers or max(1, multiprocessing.cpu_count())
+    with multiprocessing.Pool(num_workers) as pool:
+        tasks = [(job, args.force, known_bbox(job, recorded)) for job in jobs]
+        results = pool.map(convert_one, tasks, chunksize=16)
 
-                print(f"Converting {svg_path} to PNG...")
+    if tile_sizes:
+        write_bboxes(tile_sizes, results)
+    converted = sum(1 for _, was_converted, _ in results if was_converted)
+    print(f"Conversion completed: {converted} converted, {len(results) - converted} up to date.")
 
-                # Convert SVG to PNG using CairoSVG (300x300, keeping transparency)
-                cairosvg.svg2png(url=svg_path, write_to=png_path, output_width=300, output_height=300)
 
-print("Conversion completed.")
+if __name__ == "__main__":
+    main()
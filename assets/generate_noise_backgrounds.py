@@ -1,20 +1,27 @@
 import os
-import random
-from PIL import Image
+import sys
 from multiprocessing import Pool, cpu_count
 
-BOARDS_DIR = "boards"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from procedural_backgrounds import ProceduralBackgroundSource
+
 BACKGROUND_DIR = "random_noise_backgrounds"
-NUM_IMAGES = len(os.listdir(BACKGROUND_DIR))
+# rewrite as many backgrounds as the directory holds, DEFAULT_NUM_IMAGES when it is new or empty
+DEFAULT_NUM_IMAGES = 1000
+NUM_IMAGES = (len(os.listdir(BACKGROUND_DIR)) if os.path.isdir(BACKGROUND_DIR) else 0) or DEFAULT_NUM_IMAGES
+SEED = None  # None: different backgrounds on every run; set to write the same ones every time
 
-os.makedirs(BACKGROUND_DIR, exist_ok=True)
+# generate_datasets.py can also draw these on the fly (PROCEDURAL_BACKGROUNDS) without writing them out
+source = ProceduralBackgroundSource(640, SEED)
 
-def create_color_image(index):
-    color = tuple(random.randint(0, 255) for _ in range(3))
+
+def create_background_image(index):
     filename = f"background_{index}.jpg"
-    img = Image.new("RGB", (640, 640), color)
-    img.save(os.path.join(BACKGROUND_DIR, filename))
+    source.generate(source.rng_for(index)).save(os.path.join(BACKGROUND_DIR, filename))
+
 
 if __name__ == "__main__":
+    os.makedirs(BACKGROUND_DIR, exist_ok=True)
     with Pool(cpu_count()) as pool:
-        pool.map(create_color_image, range(NUM_IMAGES))
+        pool.map(create_background_image, range(NUM_IMAGES))
@@ -0,0 +1,130 @@
+"""
+Process-pool decode stage shared by the background downloaders.
+
+The async fetchers hand raw downloaded bytes to `ImageSink.submit`, which
+dedupes them by content hash and puts them on a bounded queue; consumer tasks
+feed the queue into a process pool that decodes, resizes and re-encodes each
+image, so the event loop only ever does network I/O. When the queue is full,
+`submit` waits, which holds the fetcher's semaphore slot and throttles
+downloads to the decode rate.
+
+Every processed image (or failed decode) is appended to a JSONL manifest, one
+record per line: {"url", "hash", "path", "width", "height", "bytes"} or
+{"url", "hash", "error"}. Re-runs load it to skip URLs and content hashes
+already handled.
+"""
+
+import asyncio
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import Optional, Tuple
+
+import xxhash
+from PIL import Image
+
+QUEUE_SIZE = 64
+JPEG_QUALITY = 90
+
+
+def decode_resize_save(data: bytes, path: str, size: Optional[int] = None) -> Tuple[int, int]:
+    """
+    Pool worker: decodes `data` and saves it as a square JPEG, `size` x `size`
+    or min(width, height) square when size is None. Returns the source size.
+    """
+    with Image.open(BytesIO(data)) as img:
+        source_size = img.size
+        img = img.convert("RGB")
+        side = size or min(img.size)
+        img = img.resize((side, side))
+    img.save(f"{path}.tmp", "JPEG", quality=JPEG_QUALITY)
+    os.replace(f"{path}.tmp", path)
+    return source_size
+
+
+class ImageSink:
+    def __init__(
+        self,
+        output_dir: str,
+        manifest_path: str,
+        size: Optional[int] = None,
+        workers: Optional[int] = None,
+        queue_size: int = QUEUE_SIZE,
+    ):
+        self.output_dir = output_dir
+        self.manifest_path = manifest_path
+        self.size = size
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.urls = set()
+        self.hashes = set()
+        self.stats = {"saved": 0, "duplicates": 0, "skipped_urls": 0, "failed": 0}
+        self._load_manifest()
+
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return
+        with open(self.manifest_path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # torn last line from an interrupted run
+                self.urls.add(record["url"])
+                self.hashes.add(record["hash"])
+
+    def seen_url(self, url: str) -> bool:
+        """True if a previous (or this) run already handled `url`; callers skip the download."""
+        if url in self.urls:
+            self.stats["skipped_urls"] += 1
+            return True
+        return False
+
+    async def __aenter__(self):
+        self._pool = ProcessPoolExecutor(self.workers)
+        self._queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        self._manifest = open(self.manifest_path, "a")
+        # one consumer per pool slot keeps every worker busy without queuing more in the pool
+        self._consumers = [asyncio.create_task(self._consume()) for _ in range(self.workers)]
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._queue.join()
+        for consumer in self._consumers:
+            consumer.cancel()
+        await asyncio.gather(*self._consumers, return_exceptions=True)
+        self._pool.shutdown()
+        self._manifest.close()
+
+    async def submit(self, url: str, data: bytes):
+        """Queues downloaded bytes for decoding unless their content was seen before."""
+        self.urls.add(url)
+        file_hash = xxhash.xxh32(data).hexdigest()
+        if file_hash in self.hashes:
+            self.stats["duplicates"] += 1
+            self._write_record({"url": url, "hash": file_hash, "duplicate": True})
+            return
+        self.hashes.add(file_hash)
+        await self._queue.put((url, file_hash, data))
+
+    def _write_record(self, record: dict):
+        self._manifest.write(json.dumps(record) + "\n")
+        self._manifest.flush()
+
+    async def _consume(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            url, file_hash, data = await self._queue.get()
+            path = os.path.join(self.output_dir, f"{file_hash}.jpg")
+            try:
+                width, height = await loop.run_in_executor(self._pool, decode_resize_save, data, path, self.size)
+                self._write_record(
+                    {"url": url, "hash": file_hash, "path": path, "width": width, "height": height, "bytes": len(data)}
+                )
+                self.stats["saved"] += 1
+            except Exception as e:
+                self._write_record({"url": url, "hash": file_hash, "error": str(e)})
+                self.stats["failed"] += 1
+            finally:
+                self._queue.task_done()
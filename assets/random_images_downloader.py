@@ -1,3 +1,17 @@
+"""
+Downloads background photos from Pixabay search pages into random_noise_backgrounds/.
+
+By default downloaded bytes are decoded, resized and re-encoded in a process
+pool behind a bounded queue (image_sink.py), deduped by content hash and
+recorded in a manifest so re-runs skip known images; --inline-decode keeps
+the old decode-in-the-coroutine path.
+
+Usage:
+    python random_images_downloader.py
+    python random_images_downloader.py --pages 10 --base-url http://127.0.0.1:8000/photos/search
+"""
+
+import argparse
 import asyncio
 import json
 import os
@@ -8,9 +22,12 @@ import aiohttp
 import xxhash
 from PIL import Image
 
+from image_sink import ImageSink
+
 # Constants
 PAGES_TO_DOWNLOAD = 500
 OUTPUT_PATH = "random_noise_backgrounds"
+MANIFEST_PATH = "random_noise_backgrounds.manifest.jsonl"  # kept outside OUTPUT_PATH, which must hold only images
 BASE_URL = "https://pixabay.com/photos/search"
 MAX_CONCURRENT_REQUESTS = 5  # Limit concurrent requests
 
@@ -43,7 +60,9 @@ async def fetch_json(session, url, params):
             else:
                 print(f"Failed to fetch {url}: HTTP {response.status}")
 
-async def download_image(session, url, resize=True):
+async def download_image(session, url, resize=True, sink=None):
+    if sink is not None and sink.seen_url(url):
+        return
     async with semaphore:  # Ensure we don't exceed 50 concurrent downloads
         async with session.get(url) as response:
             if response.status != 200:
@@ -51,6 +70,11 @@ async def download_image(session, url, resize=True):
                 return
 
             data = await response.read()
+            if sink is not None:
+                # decoded in the sink's process pool; waits here while its queue is full
+                await sink.submit(url, data)
+                return
+
             file_hash = xxhash.xxh32(data).hexdigest()
             path = os.path.join(OUTPUT_PATH, f"{file_hash}.jpg")
 
@@ -65,13 +89,13 @@ async def download_image(session, url, resize=True):
 
             print(f"Downloaded: {url} -> {path}")
 
-async def download_page(session, page):
+async def download_page(session, page, base_url=BASE_URL, sink=None):
     params = {
         "order": "ec",
         "pagi": str(page),
     }
 
-    data = await fetch_json(session, BASE_URL, params)
+    data = await fetch_json(session, base_url, params)
     if not data or "page" not in data or "results" not in data["page"]:
         return
 
@@ -82,16 +106,29 @@ async def download_page(session, page):
             img_url = item.get("sources", {}).get("2x")
 
             if img_url and width > 640 and height > 640:
-                tasks.append(download_image(session, img_url))
+                tasks.append(download_image(session, img_url, sink=sink))
         except KeyError:
             continue
 
     await asyncio.gather(*tasks)
 
-async def main():
+async def main(pages=PAGES_TO_DOWNLOAD, base_url=BASE_URL, inline_decode=False, decode_workers=None):
     async with aiohttp.ClientSession() as session:
-        tasks = [download_page(session, i) for i in range(PAGES_TO_DOWNLOAD)]
-        await asyncio.gather(*tasks)
+        if inline_decode:
+            tasks = [download_page(session, i, base_url) for i in range(pages)]
+            await asyncio.gather(*tasks)
+            return
+
+        async with ImageSink(OUTPUT_PATH, MANIFEST_PATH, workers=decode_workers) as sink:
+            tasks = [download_page(session, i, base_url, sink) for i in range(pages)]
+            await asyncio.gather(*tasks)
+        print(f"Done: {sink.stats}")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=PAGES_TO_DOWNLOAD, help="Search result pages to download")
+    parser.add_argument("--base-url", default=BASE_URL, help="Search endpoint (e.g. a local stub for testing)")
+    parser.add_argument("--inline-decode", action="store_true", help="Decode inside the coroutines instead of the process pool")
+    parser.add_argument("--decode-workers", type=int, default=None, help="Decode processes (default: cpu count)")
+    args = parser.parse_args()
+    asyncio.run(main(args.pages, args.base_url, args.inline_decode, args.decode_workers))
@@ -1,3 +1,16 @@
+"""
+Downloads the randomwordgenerator.com picture set into random_noise_backgrounds/.
+
+Decoding and resizing to 640x640 run in a process pool behind a bounded queue
+(image_sink.py) with content-hash dedupe and a manifest that lets re-runs skip
+known images; --inline-decode keeps the old decode-in-the-coroutine path.
+
+Usage:
+    python random_images_downloader2.py
+    python random_images_downloader2.py --base-url http://127.0.0.1:8000
+"""
+
+import argparse
 import asyncio
 import json
 import os
@@ -8,8 +21,11 @@ import aiohttp
 import xxhash
 from PIL import Image
 
+from image_sink import ImageSink
+
 # Constants
 OUTPUT_PATH = "random_noise_backgrounds"
+MANIFEST_PATH = "random_noise_backgrounds.manifest.jsonl"  # kept outside OUTPUT_PATH, which must hold only images
 BASE_URL = "https://randomwordgenerator.com"
 MAX_CONCURRENT_REQUESTS = 100  # Limit concurrent requests
 
@@ -18,14 +34,21 @@ os.makedirs(OUTPUT_PATH, exist_ok=True)
 semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
 
 
-async def download_image(session, url, resize=True):
+async def download_image(session, url, resize=True, base_url=BASE_URL, sink=None):
+    if sink is not None and sink.seen_url(url):
+        return
     async with semaphore:
-        async with session.get(BASE_URL + url) as response:
+        async with session.get(base_url + url) as response:
             if response.status != 200:
                 print(f"Failed to download image: {url}")
                 return
 
             data = await response.read()
+            if sink is not None:
+                # decoded in the sink's process pool; waits here while its queue is full
+                await sink.submit(url, data)
+                return
+
             file_hash = xxhash.xxh32(data).hexdigest()
             path = os.path.join(OUTPUT_PATH, f"{file_hash}.jpg")
 
@@ -40,18 +63,31 @@ async def download_image(session, url, resize=True):
             # print(f"Downloaded: {url} -> {path}")
 
 
-async def main():
+async def main(base_url=BASE_URL, inline_decode=False, decode_workers=None):
     async with aiohttp.ClientSession() as session:
         async with session.get(
-            BASE_URL + "/json/pictures.php?category=all"
+            base_url + "/json/pictures.php?category=all"
         ) as response:
             if response.status != 200:
                 print("Failed to fetch images")
                 return
             data = json.loads(await response.text())
-            tasks = [download_image(session, img["image_url"]) for img in data["data"]]
+
+        if inline_decode:
+            tasks = [download_image(session, img["image_url"], base_url=base_url) for img in data["data"]]
+            await asyncio.gather(*tasks)
+            return
+
+        async with ImageSink(OUTPUT_PATH, MANIFEST_PATH, size=640, workers=decode_workers) as sink:
+            tasks = [download_image(session, img["image_url"], base_url=base_url, sink=sink) for img in data["data"]]
             await asyncio.gather(*tasks)
+        print(f"Done: {sink.stats}")
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default=BASE_URL, help="Site root (e.g. a local stub for testing)")
+    parser.add_argument("--inline-decode", action="store_true", help="Decode inside the coroutines instead of the process pool")
+    parser.add_argument("--decode-workers", type=int, default=None, help="Decode processes (default: cpu count)")
+    args = parser.parse_args()
+    asyncio.run(main(args.base_url, args.inline_decode, args.decode_workers))
@@ -0,0 +1,240 @@
+"""
+Concurrent Chess.com archive fetcher.
+
+Uses one pooled aiohttp session for every request, a bounded number of
+in-flight requests, a per-host request rate limit, and retries with
+exponential backoff. Month archives are parsed as they stream in, one game
+object at a time, so a large month is never held fully in memory.
+
+With an `ArchiveCache`, completed months are read from disk without any
+request and other URLs are revalidated with conditional requests.
+
+`fetch_chess_com_fens.build_chess_com_fen_database` uses this module when
+aiohttp is installed and falls back to the sequential urllib path otherwise.
+Pass `base_url` to point the fetcher at a local stub server.
+"""
+
+import asyncio
+import codecs
+import json
+import random
+import time
+from typing import Dict, Iterable, List, Optional, Set
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from archive_cache import ArchiveCache
+from fetch_chess_com_fens import (
+    API_BASE_URL,
+    STREAM_CHUNK_SIZE,
+    USER_AGENT,
+    GamesStreamParser,
+    extract_game_fens,
+    iter_archive_games,
+)
+
+MAX_CONCURRENT_REQUESTS = 8
+REQUESTS_PER_SECOND_PER_HOST = 4.0
+MAX_RETRIES = 4
+BACKOFF_BASE_SECONDS = 0.5
+REQUEST_TIMEOUT_SECONDS = 30
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RetryableHTTPError(Exception):
+    def __init__(self, status: int, retry_after: Optional[float] = None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+class HostRateLimiter:
+    """Spaces out request start times so each host sees at most `rate` requests per second."""
+
+    def __init__(self, rate: float = REQUESTS_PER_SECOND_PER_HOST):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot: Dict[str, float] = {}
+        self._lock = asyncio.Lock()
+
+    async def wait(self, url: str):
+        if not self.interval:
+            return
+        host = urlsplit(url).netloc
+        async with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class ChessComAsyncFetcher:
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        concurrency: int = MAX_CONCURRENT_REQUESTS,
+        rate: float = REQUESTS_PER_SECOND_PER_HOST,
+        max_retries: int = MAX_RETRIES,
+        backoff_base: float = BACKOFF_BASE_SECONDS,
+        cache: Optional[ArchiveCache] = None,
+    ):
+        self.session = session
+        self.cache = cache
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.limiter = HostRateLimiter(rate)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+
+    async def _with_retries(self, url: str, handler, headers: Optional[Dict[str, str]] = None):
+        """Runs `handler(response)` for a GET of `url`, retrying transient failures."""
+        attempt = 0
+        while True:
+            try:
+                async with self.semaphore:
+                    await self.limiter.wait(url)
+                    async with self.session.get(url, headers=headers) as response:
+                        if response.status in RETRYABLE_STATUSES:
+                            retry_after = response.headers.get("Retry-After")
+                            raise RetryableHTTPError(
+                                response.status,
+                                float(retry_after) if retry_after and retry_after.isdigit() else None,
+                            )
+                        response.raise_for_status()
+                        return await handler(response)
+            except (RetryableHTTPError, aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff_base * (2 ** attempt) * (1 + random.random() * 0.25)
+                if isinstance(e, RetryableHTTPError) and e.retry_after is not None:
+                    delay = max(delay, e.retry_after)
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def _cached_get(self, url: str, consume):
+        """
+        GETs `url` through the cache. `consume(chunks)` receives an async iterator
+        of body chunks, either from the network (teed into the cache) or from disk.
+        """
+        cache = self.cache
+        if cache is not None and cache.is_fresh(url):
+            return await consume(_iter_cached_body(cache, url))
+
+        async def handler(response):
+            if response.status == 304 and cache is not None and cache.has(url):
+                cache.mark_revalidated(url)
+                return await consume(_iter_cached_body(cache, url))
+            if cache is None:
+                return await consume(response.content.iter_chunked(STREAM_CHUNK_SIZE))
+
+            with cache.writer(url) as writer:
+                async def tee():
+                    async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                        writer.write(chunk)
+                        yield chunk
+
+                result = await consume(tee())
+                writer.commit(response.headers)
+            return result
+
+        headers = cache.conditional_headers(url) if cache is not None else None
+        return await self._with_retries(url, handler, headers)
+
+    async def fetch_archive_urls(self, username: str, base_url: str = API_BASE_URL) -> List[str]:
+        async def consume(chunks):
+            body = b"".join([chunk async for chunk in chunks])
+            return json.loads(body.decode("utf-8")).get("archives", [])
+
+        return await self._cached_get(f"{base_url}/player/{username}/games/archives", consume)
+
+    async def fetch_month_fens(self, url: str) -> Set[str]:
+        """Streams one month archive and extracts FENs game by game."""
+        cache = self.cache
+        if cache is not None and cache.is_fresh(url):
+            # completed month: parse straight from disk off the event loop
+            return await asyncio.to_thread(_fens_from_cache, cache, url)
+
+        async def consume(chunks):
+            fens = set()
+            parser = GamesStreamParser()
+            decoder = codecs.getincrementaldecoder("utf-8")()
+            async for chunk in chunks:
+                for game in parser.feed(decoder.decode(chunk)):
+                    fens.update(extract_game_fens(game))
+            for game in parser.feed(decoder.decode(b"", final=True)):
+                fens.update(extract_game_fens(game))
+            return fens
+
+        return await self._cached_get(url, consume)
+
+    async def fetch_player_fens(self, username: str, max_months: int = 3, base_url: str = API_BASE_URL) -> Set[str]:
+        try:
+            archive_urls = await self.fetch_archive_urls(username, base_url)
+        except Exception as e:
+            print(f"Failed to fetch archives for {username}: {e}")
+            return set()
+
+        results = await asyncio.gather(
+            *(self.fetch_month_fens(url) for url in archive_urls[-max_months:]),
+            return_exceptions=True,
+        )
+        fens = set()
+        for url, result in zip(archive_urls[-max_months:], results):
+            if isinstance(result, Exception):
+                print(f"Error fetching {url}: {result}")
+                continue
+            fens.update(result)
+        return fens
+
+
+async def _iter_cached_body(cache: ArchiveCache, url: str):
+    with cache.open_body(url) as body:
+        while True:
+            chunk = body.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def _fens_from_cache(cache: ArchiveCache, url: str) -> Set[str]:
+    fens = set()
+    with cache.open_body(url) as body:
+        for game in iter_archive_games(body):
+            fens.update(extract_game_fens(game))
+    return fens
+
+
+async def fetch_players_fens_async(
+    players: Iterable[str],
+    max_months: int = 3,
+    base_url: str = API_BASE_URL,
+    concurrency: int = MAX_CONCURRENT_REQUESTS,
+    rate: float = REQUESTS_PER_SECOND_PER_HOST,
+    max_retries: int = MAX_RETRIES,
+    backoff_base: float = BACKOFF_BASE_SECONDS,
+    cache: Optional[ArchiveCache] = None,
+) -> Dict[str, Set[str]]:
+    """Fetches FENs for all players concurrently over a single pooled session."""
+    players = list(players)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT_SECONDS)
+    async with aiohttp.ClientSession(
+        connector=connector, timeout=timeout, headers={"User-Agent": USER_AGENT}
+    ) as session:
+        fetcher = ChessComAsyncFetcher(session, concurrency, rate, max_retries, backoff_base, cache)
+        results = await asyncio.gather(
+            *(fetcher.fetch_player_fens(p, max_months, base_url) for p in players)
+        )
+    return dict(zip(players, results))
+
+
+def fetch_players_fens(players: Iterable[str], max_months: int = 3, **kwargs) -> Set[str]:
+    """Synchronous entry point: returns the union of FENs of all players."""
+    per_player = asyncio.run(fetch_players_fens_async(players, max_months, **kwargs))
+    all_fens = set()
+    for player, fens in per_player.items():
+        print(f"  '{player}': {len(fens)} unique FENs")
+        all_fens.update(fens)
+    return all_fens
@@ -0,0 +1,174 @@
+"""
+Sample file layout of a dataset split directory and its ID allocator.
+
+A split directory (e.g. `datasets/images/train`) is either flat,
+`<split_dir>/<id>.jpg`, or nested, `<split_dir>/ab/cd/<id>.jpg` where `ab/cd`
+comes from a hash of the id. A nested split is marked by a `.nested` file in
+it, so a path is resolved from the id alone without listing any directory.
+Each nested leaf directory holds only a few dozen files even at
+millions of samples. The image extension of a split (the generator's
+OUTPUT_EXT) is recorded in its `.image_ext` file; splits without one hold .jpg.
+
+Image ids come from a `.next_id` counter file in the images split directory.
+`IdAllocator.reserve(n)` hands out a contiguous range under a file lock, so
+start-up never lists the split and concurrent runs get disjoint ranges. The
+counter is seeded once from the highest id on disk the first time a split is
+used.
+"""
+
+import fcntl
+import json
+import os
+import zlib
+from contextlib import contextmanager
+from typing import Dict, Iterator, Sequence, Tuple, Union
+
+NESTED_MARKER = ".nested"
+IMAGE_EXT_MARKER = ".image_ext"
+ID_COUNTER = ".next_id"
+DEFAULT_IMAGE_EXT = "jpg"
+IMAGE_EXTS = ("jpg", "jpeg", "png", "webp")
+
+_NESTED_CACHE: Dict[str, bool] = {}
+_IMAGE_EXT_CACHE: Dict[str, str] = {}
+
+
+def fan_out(image_id) -> str:
+    """Two-level hex fan-out directory of an id, e.g. '3f/a0'."""
+    h = zlib.crc32(str(image_id).encode())
+    return f"{h & 0xFF:02x}/{(h >> 8) & 0xFF:02x}"
+
+
+def is_nested(split_dir: str) -> bool:
+    nested = _NESTED_CACHE.get(split_dir)
+    if nested is None:
+        nested = os.path.exists(os.path.join(split_dir, NESTED_MARKER))
+        _NESTED_CACHE[split_dir] = nested
+    return nested
+
+
+def sample_path(split_dir: str, image_id, ext: str) -> str:
+    """Path of sample `image_id` with extension `ext` ('jpg' / 'txt') in a split directory."""
+    if is_nested(split_dir):
+        return f"{split_dir}/{fan_out(image_id)}/{image_id}.{ext}"
+    return f"{split_dir}/{image_id}.{ext}"
+
+
+def image_ext(split_dir: str) -> str:
+    """Extension of the images of a split: the one recorded by set_image_ext, else 'jpg'."""
+    ext = _IMAGE_EXT_CACHE.get(split_dir)
+    if ext is None:
+        ext = DEFAULT_IMAGE_EXT
+        marker = os.path.join(split_dir, IMAGE_EXT_MARKER)
+        if os.path.exists(marker):
+            with open(marker) as f:
+                ext = f.read().strip() or DEFAULT_IMAGE_EXT
+        _IMAGE_EXT_CACHE[split_dir] = ext
+    return ext
+
+
+def set_image_ext(split_dir: str, ext: str):
+    """Records the extension new images of a split are written with."""
+    if image_ext(split_dir) == ext:
+        return
+    os.makedirs(split_dir, exist_ok=True)
+    with open(os.path.join(split_dir, IMAGE_EXT_MARKER), "w") as f:
+        f.write(ext)
+    _IMAGE_EXT_CACHE[split_dir] = ext
+
+
+def image_path(split_dir: str, image_id) -> str:
+    """
+    Path of the image of sample `image_id`: with the split's extension, or with another
+    image extension when only that file exists (a split whose OUTPUT_EXT was changed).
+    """
+    path = sample_path(split_dir, image_id, image_ext(split_dir))
+    if not os.path.exists(path):
+        for ext in IMAGE_EXTS:
+            other = sample_path(split_dir, image_id, ext)
+            if os.path.exists(other):
+                return other
+    return path
+
+
+def ensure_sample_dir(split_dir: str, image_id):
+    """Creates the fan-out directory of a sample in a nested split (no-op for flat splits)."""
+    if is_nested(split_dir):
+        os.makedirs(f"{split_dir}/{fan_out(image_id)}", exist_ok=True)
+
+
+def iter_sample_entries(split_dir: str, ext: Union[str, Sequence[str]]) -> Iterator[Tuple[int, os.DirEntry]]:
+    """
+    Yields (id, DirEntry) of every `<id>.<ext>` file of a split, flat or nested; `ext` may
+    be a tuple of extensions (e.g. IMAGE_EXTS for the images whatever their codec).
+    """
+    if not os.path.isdir(split_dir):
+        return
+    exts = (ext,) if isinstance(ext, str) else tuple(ext)
+    stack = [(split_dir, 0)]
+    while stack:
+        directory, depth = stack.pop()
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if depth < 2 and len(entry.name) == 2 and entry.is_dir():
+                    stack.append((entry.path, depth + 1))
+                    continue
+                name, dot, file_ext = entry.name.partition(".")
+                if file_ext in exts and name.isdigit():
+                    yield int(name), entry
+
+
+def set_layout(split_dir: str, nested: bool) -> bool:
+    """
+    Makes a new split directory nested. A split that already holds flat samples
+    keeps its layout; returns whether the split ends up nested.
+    """
+    os.makedirs(split_dir, exist_ok=True)
+    if not nested or is_nested(split_dir):
+        return is_nested(split_dir)
+    with os.scandir(split_dir) as entries:
+        if any(entry.name.partition(".")[0].isdigit() for entry in entries):
+            return False
+    open(os.path.join(split_dir, NESTED_MARKER), "w").close()
+    _NESTED_CACHE[split_dir] = True
+    return True
+
+
+class IdAllocator:
+    def __init__(self, split_dir: str):
+        os.makedirs(split_dir, exist_ok=True)
+        self.path = os.path.join(split_dir, ID_COUNTER)
+        self.split_dir = split_dir
+
+    @contextmanager
+    def _locked(self):
+        with open(f"{self.path}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read(self) -> int:
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                return json.load(f)["next_id"]
+        # first use of this split: seed from the files already on disk
+        ids = [image_id for image_id, _ in iter_sample_entries(self.split_dir, IMAGE_EXTS)]
+        return max(ids) + 1 if ids else 1
+
+    def _write(self, next_id: int):
+        with open(f"{self.path}.tmp", "w") as f:
+            json.dump({"next_id": next_id}, f)
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def peek(self) -> int:
+        with self._locked():
+            return self._read()
+
+    def reserve(self, n: int) -> int:
+        """Reserves ids [start, start + n) and returns start."""
+        with self._locked():
+            start = self._read()
+            self._write(start + n)
+        return start
@@ -0,0 +1,154 @@
+"""
+Dry-run estimate of a generation run: sample counts, wall-clock time and disk use.
+
+`python generate_datasets.py --dry-run` splits the assets and lays out the tasks
+exactly like the real run (including --shard and --incremental), but instead of
+generating it:
+  - counts the samples each split and stage would get (exact);
+  - renders a small stratified sample on this machine: DRY_RUN_SAMPLES spread
+    over the (split, stage) strata in proportion to their size, at least
+    MIN_PER_STRATUM each, timing plan + render + encode + write and measuring
+    the encoded image and label bytes;
+  - extrapolates each stratum: bytes = samples * mean bytes, and seconds =
+    mean time * the samples on the longest worker: each generate call's tasks
+    (one per piece set for boards, one per background for scenes) are handed
+    to the workers in order as they free up, and the calls run one after
+    another. With fewer tasks than workers, or tasks that don't split evenly
+    into rounds, that is more than samples / workers. The 95% interval comes
+    from the spread of the measured times.
+The estimate is printed and written as JSON (ESTIMATE_JSON). Samples are timed
+in one process, so the wall-clock figure assumes a busy worker renders as fast
+as that process; dedupe resampling is not included.
+"""
+
+import heapq
+import json
+import math
+import os
+import random
+import statistics
+import tempfile
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+DRY_RUN_SAMPLES = 48
+MIN_PER_STRATUM = 4
+ESTIMATE_JSON = "datasets/run_estimate.json"
+
+
+def allocate(sizes: Dict[Tuple[str, str], int], total: int, minimum: int = MIN_PER_STRATUM) -> Dict[Tuple[str, str], int]:
+    """Measured samples per stratum: proportional to its size, at least `minimum`, at most the stratum itself."""
+    grand = sum(sizes.values())
+    return {
+        key: min(size, max(minimum, round(total * size / grand)))
+        for key, size in sizes.items()
+        if size
+    }
+
+
+def longest_worker(task_samples: Sequence[int], workers: int) -> int:
+    """Samples rendered by the busiest worker when tasks of these sizes go, in order, to the first free worker."""
+    if len(task_samples) <= workers:
+        return max(task_samples, default=0)
+    finish = [0] * workers
+    for samples in task_samples:
+        heapq.heappush(finish, heapq.heappop(finish) + samples)
+    return max(finish)
+
+
+def estimate_run(
+    jobs: Sequence[dict],
+    time_sample: Callable[[dict, str], Tuple[float, int, int]],
+    workers: int,
+    samples: int = DRY_RUN_SAMPLES,
+) -> dict:
+    """
+    `jobs` are the generate calls the run would make, in order, each with its "split", "stage",
+    exact "samples" and "task_samples" (the samples of each of its pool tasks);
+    `time_sample(job, directory)` renders one random sample of a job into `directory` and returns
+    (seconds, image bytes, label bytes).
+    """
+    sizes: Dict[Tuple[str, str], int] = {}
+    tasks: Dict[Tuple[str, str], int] = {}
+    critical: Dict[Tuple[str, str], int] = {}  # samples on the busiest worker, summed over the calls
+    for job in jobs:
+        key = (job["split"], job["stage"])
+        sizes[key] = sizes.get(key, 0) + job["samples"]
+        tasks[key] = tasks.get(key, 0) + len(job["task_samples"])
+        critical[key] = critical.get(key, 0) + longest_worker(job["task_samples"], workers)
+
+    strata = []
+    with tempfile.TemporaryDirectory() as directory:
+        for (split, stage), measured in allocate(sizes, samples).items():
+            stratum_jobs = [job for job in jobs if (job["split"], job["stage"]) == (split, stage)]
+            weights = [job["samples"] for job in stratum_jobs]
+            times, image_bytes, label_bytes = [], [], []
+            for _ in range(measured):
+                seconds, image_size, label_size = time_sample(random.choices(stratum_jobs, weights)[0], directory)
+                times.append(seconds)
+                image_bytes.append(image_size)
+                label_bytes.append(label_size)
+            count, path = sizes[(split, stage)], critical[(split, stage)]
+            mean_time = statistics.fmean(times)
+            spread = statistics.stdev(times) if len(times) > 1 else 0.0
+            strata.append({
+                "split": split,
+                "stage": stage,
+                "samples": count,
+                "tasks": tasks[(split, stage)],
+                "samples_per_worker": path,
+                "measured": measured,
+                "seconds_per_sample": mean_time,
+                "image_bytes_per_sample": statistics.fmean(image_bytes),
+                "label_bytes_per_sample": statistics.fmean(label_bytes),
+                "seconds": path * mean_time,
+                # variance of the extrapolated total: path^2 * var / measured
+                "seconds_variance": path**2 * spread**2 / measured,
+                "bytes": round(count * (statistics.fmean(image_bytes) + statistics.fmean(label_bytes))),
+            })
+
+    seconds = sum(stratum["seconds"] for stratum in strata)
+    margin = 1.96 * math.sqrt(sum(stratum.pop("seconds_variance") for stratum in strata))
+    splits: Dict[str, int] = {}
+    for (split, _), count in sizes.items():
+        splits[split] = splits.get(split, 0) + count
+    return {
+        "workers": workers,
+        "measured": sum(stratum["measured"] for stratum in strata),
+        "samples": sum(sizes.values()),
+        "splits": splits,
+        "seconds": seconds,
+        "seconds_ci95": [max(0.0, seconds - margin), seconds + margin],
+        "bytes": sum(stratum["bytes"] for stratum in strata),
+        "strata": strata,
+    }
+
+
+def _duration(seconds: float) -> str:
+    hours, rest = divmod(int(round(seconds)), 3600)
+    return f"{hours}h{rest // 60:02d}m{rest % 60:02d}s"
+
+
+def print_estimate(estimate: dict):
+    for stratum in estimate["strata"]:
+        print(
+            f"{stratum['split']:>5} {stratum['stage']:<6}: {stratum['samples']:>9} samples in {stratum['tasks']:>6} tasks "
+            f"({stratum['samples_per_worker']} on the busiest worker), "
+            f"{stratum['seconds_per_sample'] * 1000:7.1f} ms and "
+            f"{(stratum['image_bytes_per_sample'] + stratum['label_bytes_per_sample']) / 1024:6.1f} KiB per sample "
+            f"({stratum['measured']} measured)"
+        )
+    low, high = estimate["seconds_ci95"]
+    print(f"Samples: {estimate['samples']} ({', '.join(f'{s}: {n}' for s, n in estimate['splits'].items())})")
+    print(
+        f"Wall clock on {estimate['workers']} workers: ~{_duration(estimate['seconds'])}"
+        f" (95%: {_duration(low)} - {_duration(high)})"
+    )
+    print(f"Disk: ~{estimate['bytes'] / 1e9:.2f} GB")
+
+
+def write_estimate(estimate: dict, path: Optional[str] = None) -> str:
+    path = path or ESTIMATE_JSON
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(estimate, f, indent=1)
+    return path
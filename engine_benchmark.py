@@ -0,0 +1,136 @@
+"""
+Benchmarks the generator's worker engines (WORKER_ENGINE) on this machine.
+
+Runs the same small generation (--assets, --variations per pair) once
+per engine, each in a fresh child process working in a scratch directory, and
+reports wall time, samples/sec and the peak memory of the whole process tree:
+  - RSS: resident pages, counting pages a forked worker shares with the
+    parent once per process (what per-process limits and `top` look at);
+  - PSS: proportional set size, shared pages split between the processes that
+    map them (what the tree really costs the node).
+
+Usage:
+    python engine_benchmark.py
+    python engine_benchmark.py --workers 8 --variations 4 --json engines.json
+    python engine_benchmark.py --assets /data/assets_subset
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from worker_pool import rss_bytes
+
+ASSETS_DIR = "assets"
+SAMPLE_INTERVAL = 0.1  # seconds between memory samples
+
+
+def _descendants(pid: int) -> List[int]:
+    """`pid` and all its live descendants, from the parent ids in /proc/<pid>/stat."""
+    children: Dict[int, List[int]] = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(name))
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, []))
+    return tree
+
+
+def pss_bytes(pid: int) -> int:
+    """Proportional set size of a process, its RSS where smaps_rollup is not available."""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return rss_bytes(pid)
+
+
+def _generate(engine: str, workers: int, variations: int, directory: str):
+    os.chdir(directory)
+    sys.stdout = open(os.devnull, "w")
+    import generate_datasets as gen
+
+    gen.VARIATIONS = variations
+    gen.TELEMETRY_LOG_INTERVAL = None
+    gen.main(workers=workers, engine=engine)
+
+
+def run_engine(engine: str, workers: int, variations: int, assets: str = ASSETS_DIR) -> dict:
+    directory = tempfile.mkdtemp(prefix=f"engine_benchmark_{engine}_")
+    try:
+        os.symlink(os.path.abspath(assets), os.path.join(directory, ASSETS_DIR))
+        child = multiprocessing.get_context("fork").Process(target=_generate, args=(engine, workers, variations, directory))
+        start = time.perf_counter()
+        child.start()
+        peak_rss = peak_pss = 0
+        while child.is_alive():
+            tree = _descendants(child.pid)
+            peak_rss = max(peak_rss, sum(rss_bytes(pid) for pid in tree))
+            peak_pss = max(peak_pss, sum(pss_bytes(pid) for pid in tree))
+            child.join(SAMPLE_INTERVAL)
+        seconds = time.perf_counter() - start
+        if child.exitcode:
+            raise RuntimeError(f"{engine} run failed with exit code {child.exitcode}")
+        samples = sum(
+            name.endswith(".txt")
+            for _, _, names in os.walk(os.path.join(directory, "datasets", "labels"))
+            for name in names
+        )
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return {
+        "engine": engine,
+        "workers": workers,
+        "samples": samples,
+        "seconds": seconds,
+        "samples_per_second": samples / seconds,
+        "peak_rss_mb": peak_rss / 2**20,
+        "peak_pss_mb": peak_pss / 2**20,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engines", default="process,thread", help="Comma-separated engines (default: process,thread)")
+    parser.add_argument("--workers", type=int, default=None, help="Workers per engine (default: cpu count)")
+    parser.add_argument("--variations", type=int, default=2, help="VARIATIONS of the benchmark run (default: 2)")
+    parser.add_argument("--assets", default=ASSETS_DIR, help=f"Assets directory to generate from (default: {ASSETS_DIR})")
+    parser.add_argument("--json", default=None, help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    workers = args.workers or max(1, multiprocessing.cpu_count())
+    results = []
+    for engine in args.engines.split(","):
+        result = run_engine(engine, workers, args.variations, args.assets)
+        results.append(result)
+        print(
+            f"{engine:>7} x{workers}: {result['samples']} samples in {result['seconds']:.1f}s "
+            f"({result['samples_per_second']:.1f}/s), peak RSS {result['peak_rss_mb']:.0f} MB, "
+            f"peak PSS {result['peak_pss_mb']:.0f} MB",
+            flush=True,
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"cpus": multiprocessing.cpu_count(), "results": results}, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""
+Bounded-memory, deduplicated FEN store.
+
+FENs are hash-partitioned into `NUM_PARTITIONS` partitions, each a short list
+of sorted run files that are duplicate-free and disjoint from each other.
+Adding a batch buffers at most `max_buffered` FENs in memory, spilling sorted
+runs to a staging directory whenever the buffer fills. Each touched partition
+then gets one new run holding only the FENs it did not have yet: they are
+looked up in the existing runs by binary search when the batch is small next
+to the partition, or with one streaming merge-join otherwise. Nothing already
+stored is rewritten, except when a partition's newest runs are compacted
+(the last two are merged while the newer is at least 1 / RUN_MERGE_RATIO of
+the older, or when more than MAX_RUNS are left), so every FEN is rewritten
+only O(log N) times.
+
+New FENs are also appended to an unexported log, so exporting to the same flat
+file as last time only appends them; any other file (or one changed since) is
+rewritten in global sort order with a streaming merge.
+"""
+
+import heapq
+import json
+import mmap
+import os
+import shutil
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional
+
+FEN_STORE_DIR = "assets/fen_store"
+NUM_PARTITIONS = 256
+MAX_BUFFERED_FENS = 500_000
+MAX_RUNS = 8  # runs per partition before the newest are compacted regardless of size
+RUN_MERGE_RATIO = 4
+
+
+def _iter_lines(path: str) -> Iterator[str]:
+    with open(path, "r") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line:
+                yield line
+
+
+def _unique_sorted(iterables: List[Iterable[str]]) -> Iterator[str]:
+    last = None
+    for fen in heapq.merge(*iterables):
+        if fen != last:
+            yield fen
+            last = fen
+
+
+def _run_contains(run: mmap.mmap, fen: bytes) -> bool:
+    """Binary search for a line of a sorted, newline-terminated run."""
+    lo, hi = 0, len(run)  # both always at the start of a line (or the end)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        start = run.rfind(b"\n", lo, mid) + 1 or lo
+        end = run.find(b"\n", start, hi)
+        end = hi if end < 0 else end
+        line = run[start:end]
+        if line == fen:
+            return True
+        if line < fen:
+            lo = end + 1
+        else:
+            hi = start
+    return False
+
+
+class FenStore:
+    def __init__(
+        self,
+        store_dir: str = FEN_STORE_DIR,
+        partitions: int = NUM_PARTITIONS,
+        max_buffered: int = MAX_BUFFERED_FENS,
+    ):
+        self.store_dir = store_dir
+        self.max_buffered = max_buffered
+        self.meta_path = os.path.join(store_dir, "store.json")
+        self.unexported_path = os.path.join(store_dir, "unexported.txt")
+        os.makedirs(store_dir, exist_ok=True)
+
+        meta = {"partitions": partitions, "runs": {}, "next_run": 0, "unexported": 0, "exported": None}
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                meta.update(json.load(f))
+        # the partition count of an existing store always wins, otherwise
+        # FENs would hash to a different file than the one holding them
+        self.partitions = meta["partitions"]
+        if "sizes" in meta:
+            # store written before runs: one file per partition
+            meta["runs"] = {k: [[f"part_{int(k):04d}.txt", size]] for k, size in meta.pop("sizes").items() if size}
+        # {partition: [[run file name, FEN count], ...]}, oldest first
+        self.runs: Dict[int, List[List]] = {int(k): v for k, v in meta["runs"].items()}
+        self.next_run = meta["next_run"]
+        self.unexported = meta["unexported"]  # committed bytes of the unexported log
+        self.exported = meta["exported"]  # {"path", "bytes"} of the last export
+
+    def __len__(self) -> int:
+        return sum(size for runs in self.runs.values() for _, size in runs)
+
+    def partition_of(self, fen: str) -> int:
+        return zlib.crc32(fen.encode("utf-8")) % self.partitions
+
+    def _run_path(self, name: str) -> str:
+        return os.path.join(self.store_dir, name)
+
+    def _new_run(self, index: int) -> str:
+        name = f"part_{index:04d}_r{self.next_run:06d}.txt"
+        self.next_run += 1
+        return name
+
+    def iter_partition(self, index: int) -> Iterator[str]:
+        return heapq.merge(*(_iter_lines(self._run_path(name)) for name, _ in self.runs.get(index, [])))
+
+    def _write_meta(self):
+        tmp_path = f"{self.meta_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "partitions": self.partitions,
+                "runs": self.runs,
+                "next_run": self.next_run,
+                "unexported": self.unexported,
+                "exported": self.exported,
+            }, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def _new_fens(self, index: int, candidates: Iterator[str], count: int) -> Iterator[str]:
+        """The sorted, unique `candidates` (about `count` of them) a partition does not hold yet."""
+        runs = self.runs.get(index, [])
+        size = sum(n for _, n in runs)
+        if not size:
+            yield from candidates
+        elif count * len(runs) * max(1, size.bit_length()) < size:
+            # few candidates: binary search in each run instead of reading the partition
+            files = [open(self._run_path(name), "rb") for name, _ in runs]
+            try:
+                maps = [mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) for f in files]
+                try:
+                    for fen in candidates:
+                        key = fen.encode("utf-8")
+                        if not any(_run_contains(run, key) for run in maps):
+                            yield fen
+                finally:
+                    for run in maps:
+                        run.close()
+            finally:
+                for f in files:
+                    f.close()
+        else:
+            existing = self.iter_partition(index)
+            current = next(existing, None)
+            for fen in candidates:
+                while current is not None and current < fen:
+                    current = next(existing, None)
+                if current != fen:
+                    yield fen
+
+    def _compact(self, index: int, obsolete: List[str]):
+        """Merges a partition's newest runs while they are of similar size or too many."""
+        runs = self.runs[index]
+        while len(runs) > 1 and (runs[-1][1] * RUN_MERGE_RATIO >= runs[-2][1] or len(runs) > MAX_RUNS):
+            (older, older_size), (newer, newer_size) = runs[-2], runs[-1]
+            name = self._new_run(index)
+            tmp_path = f"{self._run_path(name)}.tmp"
+            with open(tmp_path, "w") as f:
+                for fen in heapq.merge(_iter_lines(self._run_path(older)), _iter_lines(self._run_path(newer))):
+                    f.write(f"{fen}\n")
+            os.replace(tmp_path, self._run_path(name))
+            runs[-2:] = [[name, older_size + newer_size]]
+            obsolete += [older, newer]
+
+    def add_batch(self, fens: Iterable[str]) -> Dict[str, float]:
+        """
+        Adds FENs from any iterable (can be a generator of millions of items)
+        and returns counts of what was seen, newly added, and duplicated.
+        """
+        staging_dir = os.path.join(self.store_dir, f"_staging_{os.getpid()}")
+        os.makedirs(staging_dir, exist_ok=True)
+
+        buffers: Dict[int, set] = {}
+        runs: Dict[int, List[str]] = {}
+        spilled: Dict[int, int] = {}
+        buffered = 0
+        seen = 0
+
+        def spill():
+            for index, bucket in buffers.items():
+                run_path = os.path.join(staging_dir, f"p{index:04d}_r{len(runs.get(index, []))}.txt")
+                with open(run_path, "w") as f:
+                    for fen in sorted(bucket):
+                        f.write(f"{fen}\n")
+                runs.setdefault(index, []).append(run_path)
+                spilled[index] = spilled.get(index, 0) + len(bucket)
+            buffers.clear()
+
+        added = 0
+        obsolete: List[str] = []
+        try:
+            for fen in fens:
+                fen = fen.strip()
+                if not fen:
+                    continue
+                seen += 1
+                bucket = buffers.setdefault(self.partition_of(fen), set())
+                if fen not in bucket:
+                    bucket.add(fen)
+                    buffered += 1
+                if buffered >= self.max_buffered:
+                    spill()
+                    buffered = 0
+
+            with open(self.unexported_path, "a") as log:
+                log.truncate(self.unexported)  # drop the tail of a batch that never committed
+                for index in sorted(set(buffers) | set(runs)):
+                    sources = [_iter_lines(path) for path in runs.get(index, [])]
+                    sources.append(iter(sorted(buffers.get(index, ()))))
+                    count = spilled.get(index, 0) + len(buffers.get(index, ()))
+
+                    name = self._new_run(index)
+                    tmp_path = f"{self._run_path(name)}.tmp"
+                    written = 0
+                    with open(tmp_path, "w") as f:
+                        for fen in self._new_fens(index, _unique_sorted(sources), count):
+                            f.write(f"{fen}\n")
+                            log.write(f"{fen}\n")
+                            written += 1
+                    if not written:
+                        os.remove(tmp_path)
+                        continue
+                    os.replace(tmp_path, self._run_path(name))
+                    self.runs.setdefault(index, []).append([name, written])
+                    log.flush()
+                    self.unexported = log.tell()
+                    added += written
+                    self._compact(index, obsolete)
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            self._write_meta()
+            for name in obsolete:
+                os.remove(self._run_path(name))
+        duplicates = seen - added
+        return {
+            "seen": seen,
+            "added": added,
+            "duplicates": duplicates,
+            "duplicate_rate": duplicates / seen if seen else 0.0,
+            "total": len(self),
+        }
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterates every FEN in global sort order with one open file per run."""
+        return heapq.merge(*(self.iter_partition(i) for i in sorted(self.runs)))
+
+    def export(self, path: str) -> int:
+        """
+        Writes the whole store as a FEN-per-line file and returns its length. A file
+        this store exported last, unchanged since, only gets the FENs added after it.
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        target = os.path.abspath(path)
+        exported = self.exported
+        if exported and exported["path"] == target and os.path.exists(path) and os.path.getsize(path) == exported["bytes"]:
+            with open(self.unexported_path, "rb") as log, open(path, "ab") as f:
+                remaining = self.unexported
+                while remaining:
+                    chunk = log.read(min(remaining, 1 << 20))
+                    f.write(chunk)
+                    remaining -= len(chunk)
+            written = len(self)
+        else:
+            tmp_path = f"{path}.tmp"
+            written = 0
+            with open(tmp_path, "w") as f:
+                for fen in self:
+                    f.write(f"{fen}\n")
+                    written += 1
+            os.replace(tmp_path, path)
+        # the log is emptied before the export is recorded: a crash in between
+        # leaves a size mismatch, i.e. a full rewrite next time, never a duplicate
+        open(self.unexported_path, "w").close()
+        self.unexported = 0
+        self.exported = {"path": target, "bytes": os.path.getsize(path)}
+        self._write_meta()
+        return written
+
+
+def iter_fen_file(path: str) -> Iterator[str]:
+    """Yields the board placement FENs of a one-FEN-per-line file."""
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line and line.count("/") == 7:
+                yield line.split()[0]
+
+
+def open_fen_store(store_dir: str = FEN_STORE_DIR, seed_file: Optional[str] = None) -> FenStore:
+    """Opens the store, seeding an empty one from an existing flat FEN file."""
+    store = FenStore(store_dir)
+    if not len(store) and seed_file and os.path.exists(seed_file):
+        store.add_batch(iter_fen_file(seed_file))
+    return store
+
+
+def print_batch_stats(stats: Dict[str, float]):
+    print(
+        f"  Seen {stats['seen']} FENs: {stats['added']} new, {stats['duplicates']} duplicates "
+        f"({stats['duplicate_rate']:.1%}); store now holds {stats['total']}"
+    )
@@ -1,10 +1,19 @@
+import codecs
 import json
-import os
 import re
+import urllib.error
 import urllib.request
-from typing import List, Set
+from typing import IO, Iterator, List, Optional, Set
+
+from archive_cache import ArchiveCache
+from fen_store import open_fen_store, print_batch_stats
 
 CHESS_COM_FENS_FILE = "assets/chess_com_fens.txt"
+API_BASE_URL = "https://api.chess.com/pub"
+USER_AGENT = "ChessBoardDatasetGenerator/1.0 (contact: user@example.com)"
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_GAMES_KEY_RE = re.compile(r'"games"\s*:\s*\[')
 
 # Featured top players / GMs on Chess.com
 TARGET_PLAYERS = [
@@ -38,17 +47,124 @@ def parse_pgn_fens(pgn_text: str) -> List[str]:
             fens.append(board_part)
     return fens
 
-def fetch_games_for_player(username: str, max_months: int = 3) -> Set[str]:
+def extract_game_fens(game: dict) -> Set[str]:
+    """Extracts the final FEN and any PGN FEN headers of a single archived game."""
+    fens = set()
+    # Final FEN if present
+    if "fen" in game:
+        board_part = extract_fen_board_part(game["fen"])
+        if "/" in board_part and board_part.count("/") == 7:
+            fens.add(board_part)
+
+    # PGN FENs or initial setup
+    if "pgn" in game:
+        for pf in parse_pgn_fens(game["pgn"]):
+            if pf.count("/") == 7:
+                fens.add(pf)
+    return fens
+
+class GamesStreamParser:
+    """
+    Incrementally extracts game objects from a month archive body
+    (`{"games": [{...}, {...}]}`) as text chunks arrive.
+    """
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._in_array = False
+        self.done = False
+
+    def feed(self, text: str) -> List[dict]:
+        games = []
+        if self.done:
+            return games
+        self._buffer += text
+
+        if not self._in_array:
+            match = _GAMES_KEY_RE.search(self._buffer)
+            if not match:
+                # keep a small tail in case the key straddles two chunks
+                self._buffer = self._buffer[-32:]
+                return games
+            self._buffer = self._buffer[match.end():]
+            self._in_array = True
+
+        pos = 0
+        buf = self._buffer
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buf):
+                break
+            if buf[pos] == "]":
+                self.done = True
+                break
+            try:
+                obj, end = self._decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                break  # incomplete object, wait for more data
+            if isinstance(obj, dict):
+                games.append(obj)
+            pos = end
+
+        self._buffer = "" if self.done else buf[pos:]
+        return games
+
+def iter_archive_games(stream: IO[bytes]) -> Iterator[dict]:
+    """Yields the games of a month archive body without loading it all at once."""
+    parser = GamesStreamParser()
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    while True:
+        chunk = stream.read(STREAM_CHUNK_SIZE)
+        yield from parser.feed(decoder.decode(chunk, final=not chunk))
+        if not chunk:
+            break
+
+def open_archive(url: str, cache: Optional[ArchiveCache] = None) -> IO[bytes]:
+    """
+    Returns a readable body stream for `url`. With a cache, completed months are
+    served from disk and everything else is revalidated with a conditional request.
+    """
+    if cache is not None and cache.is_fresh(url):
+        return cache.open_body(url)
+
+    headers = {"User-Agent": USER_AGENT}
+    if cache is not None:
+        headers.update(cache.conditional_headers(url))
+    req = urllib.request.Request(url, headers=headers)
+    try:
+        resp = urllib.request.urlopen(req, timeout=10)
+    except urllib.error.HTTPError as e:
+        if e.code == 304 and cache is not None and cache.has(url):
+            cache.mark_revalidated(url)
+            return cache.open_body(url)
+        raise
+
+    if cache is None:
+        return resp
+
+    with resp, cache.writer(url) as writer:
+        while True:
+            chunk = resp.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            writer.write(chunk)
+        writer.commit(resp.headers)
+    return cache.open_body(url)
+
+def fetch_games_for_player(
+    username: str,
+    max_months: int = 3,
+    base_url: str = API_BASE_URL,
+    cache: Optional[ArchiveCache] = None,
+) -> Set[str]:
     """Fetches recent game archives for a given player from Chess.com public API."""
     extracted_fens = set()
-    archives_url = f"https://api.chess.com/pub/player/{username}/games/archives"
+    archives_url = f"{base_url}/player/{username}/games/archives"
     
     try:
-        req = urllib.request.Request(
-            archives_url,
-            headers={"User-Agent": "ChessBoardDatasetGenerator/1.0 (contact: user@example.com)"}
-        )
-        with urllib.request.urlopen(req, timeout=10) as response:
+        with open_archive(archives_url, cache) as response:
             data = json.loads(response.read().decode("utf-8"))
             archive_urls = data.get("archives", [])
     except Exception as e:
@@ -59,64 +175,96 @@ def fetch_games_for_player(username: str, max_months: int = 3) -> Set[str]:
     recent_archives = archive_urls[-max_months:]
     for url in recent_archives:
         try:
-            req = urllib.request.Request(
-                url,
-                headers={"User-Agent": "ChessBoardDatasetGenerator/1.0 (contact: user@example.com)"}
-            )
-            with urllib.request.urlopen(req, timeout=10) as resp:
-                month_data = json.loads(resp.read().decode("utf-8"))
-                games = month_data.get("games", [])
-                for game in games:
-                    # Final FEN if present
-                    if "fen" in game:
-                        board_part = extract_fen_board_part(game["fen"])
-                        if "/" in board_part and board_part.count("/") == 7:
-                            extracted_fens.add(board_part)
-                    
-                    # PGN FENs or initial setup
-                    if "pgn" in game:
-                        pgn_fens = parse_pgn_fens(game["pgn"])
-                        for pf in pgn_fens:
-                            if pf.count("/") == 7:
-                                extracted_fens.add(pf)
+            with open_archive(url, cache) as resp:
+                for game in iter_archive_games(resp):
+                    extracted_fens.update(extract_game_fens(game))
         except Exception as e:
             print(f"Error fetching {url}: {e}")
             continue
 
     return extracted_fens
 
-def build_chess_com_fen_database(limit: int = 15000) -> List[str]:
-    """Builds and caches a dataset of real Chess.com FEN positions."""
-    os.makedirs(os.path.dirname(CHESS_COM_FENS_FILE), exist_ok=True)
-    all_fens = set()
+def replay_cached_archives(cache: ArchiveCache) -> Set[str]:
+    """Re-extracts FENs from every cached month archive without touching the network."""
+    fens = set()
+    for url in cache.iter_urls(months_only=True):
+        with cache.open_body(url) as body:
+            for game in iter_archive_games(body):
+                fens.update(extract_game_fens(game))
+    return fens
+
+def fetch_players_sequential(
+    players: List[str],
+    all_fens: Set[str],
+    limit: int,
+    max_months: int = 2,
+    cache: Optional[ArchiveCache] = None,
+) -> None:
+    """Fallback path: fetches players one after another with blocking requests."""
+    for player in players:
+        print(f"  Fetching for player '{player}'...")
+        player_fens = fetch_games_for_player(player, max_months=max_months, cache=cache)
+        all_fens.update(player_fens)
+        print(f"  Total unique FENs so far: {len(all_fens)}")
+        if len(all_fens) >= limit:
+            break
 
-    # Load existing if available
-    if os.path.exists(CHESS_COM_FENS_FILE):
-        with open(CHESS_COM_FENS_FILE, "r") as f:
-            for line in f:
-                line = line.strip()
-                if line and line.count("/") == 7:
-                    all_fens.add(line)
+def build_chess_com_fen_database(
+    limit: int = 15000,
+    concurrent: bool = True,
+    use_cache: bool = True,
+    offline: bool = False,
+) -> int:
+    """
+    Builds and caches a dataset of real Chess.com FEN positions and returns its size.
+    Uses the pooled asyncio fetcher when aiohttp is available, otherwise
+    (or with concurrent=False) the sequential urllib path. Archive responses go
+    through the on-disk ArchiveCache unless use_cache=False; offline=True only
+    replays FENs from that cache. New FENs are merged into the bounded-memory
+    FenStore, which is then exported to CHESS_COM_FENS_FILE.
+    """
+    store = open_fen_store(seed_file=CHESS_COM_FENS_FILE)
+    print(f"Currently cached Chess.com FENs: {len(store)}")
+    cache = ArchiveCache() if use_cache or offline else None
+    fresh_fens = set()
 
-    print(f"Currently cached Chess.com FENs: {len(all_fens)}")
-    
-    if len(all_fens) < limit:
+    if offline:
+        print(f"Replaying cached archives from {cache.cache_dir} (offline)...")
+        fresh_fens = replay_cached_archives(cache)
+    elif len(store) < limit:
         print("Fetching fresh Chess.com game FENs from public API...")
-        for player in TARGET_PLAYERS:
-            print(f"  Fetching for player '{player}'...")
-            player_fens = fetch_games_for_player(player, max_months=2)
-            all_fens.update(player_fens)
-            print(f"  Total unique FENs so far: {len(all_fens)}")
-            if len(all_fens) >= limit:
-                break
+        if concurrent:
+            try:
+                from chess_com_async import fetch_players_fens
+            except ImportError as e:
+                print(f"  Concurrent fetcher unavailable ({e}), falling back to sequential fetch.")
+                concurrent = False
+
+        if concurrent:
+            fresh_fens = fetch_players_fens(TARGET_PLAYERS, max_months=2, cache=cache)
+        else:
+            fetch_players_sequential(TARGET_PLAYERS, fresh_fens, limit - len(store), max_months=2, cache=cache)
 
-    fen_list = sorted(list(all_fens))
-    with open(CHESS_COM_FENS_FILE, "w") as f:
-        for fen in fen_list:
-            f.write(f"{fen}\n")
+    if fresh_fens:
+        print_batch_stats(store.add_batch(fresh_fens))
 
-    print(f"Successfully saved {len(fen_list)} Chess.com FENs to {CHESS_COM_FENS_FILE}")
-    return fen_list
+    total = store.export(CHESS_COM_FENS_FILE)
+    print(f"Successfully saved {total} Chess.com FENs to {CHESS_COM_FENS_FILE}")
+    return total
 
 if __name__ == "__main__":
-    build_chess_com_fen_database()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fetch / refresh the cached Chess.com FEN database.")
+    parser.add_argument("--limit", type=int, default=15000, help="Stop fetching once this many unique FENs are cached")
+    parser.add_argument("--sequential", action="store_true", help="Use the blocking one-request-at-a-time fetcher")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the on-disk archive response cache")
+    parser.add_argument("--offline", action="store_true", help="Only replay FENs from the archive cache, no network")
+    args = parser.parse_args()
+
+    build_chess_com_fen_database(
+        limit=args.limit,
+        concurrent=not args.sequential,
+        use_cache=not args.no_cache,
+        offline=args.offline,
+    )
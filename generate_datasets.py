@@ -1,14 +1,33 @@
+"""
+Generates the YOLO chess pieces dataset into datasets/images and datasets/labels
+(settings below).
+
+Usage:
+    python generate_datasets.py
+    python generate_datasets.py --shard 0/4 --seed 1234   # one of 4 nodes, then `python shards.py merge`
+    python generate_datasets.py --plan-only               # plans only, then `python sample_plan.py render`
+    python generate_datasets.py --incremental             # only the samples of new or changed assets
+    python generate_datasets.py --dry-run --workers 32    # estimate samples, time and disk, generate nothing
+"""
+
+import argparse
 import io
+import json
 import math
 import multiprocessing
 import os
-import random
-from typing import List, Tuple
+import time
+from contextlib import contextmanager
+from functools import partial
+from typing import List, Optional, Tuple
 
 import numpy as np
 from PIL import Image, ImageDraw, ImageEnhance, ImageFilter
 
+import noise_bank
+from dataset_layout import IdAllocator, ensure_sample_dir, sample_path, set_image_ext, set_layout
 from random_fen_gen import generate_fen
+from thread_rng import np_random, random
 
 # ---------------------------------------------------------------------------
 # Global Settings & Hyperparameters for Dataset Generation
@@ -20,14 +39,70 @@ PIECE_CANVAS_SIZE = int(TILE_SIZE * PIECE_CANVAS_SCALE)
 VARIATIONS = 4
 
 BOARDS_DIR = "assets/boards"
+TEXTURES_DIR = "assets/textures"
+TEXTURE_CACHE_DIR = "assets/texture_cache"  # mip pyramids built by texture_cache.py, used when present
 PIECES_DIR = "assets/pieces"
+PIECE_TILES_DIR = "assets/pieces_tiles"  # pre-rasterized tiles from convert_lichess_pieces.py --tile-sizes
 BACKGROUND_NOISE_DIR = "assets/random_noise_backgrounds"
 DATASETS_IMAGES_DIR = "datasets/images"
 DATASETS_LABELS_DIR = "datasets/labels"
+DATASETS_TENSORS_DIR = "datasets/tensors"
 DATA_SPLIT = 0.8  # 80% train, 20% val
 
 MAKE_LABELS_FOR_CHESSBOARD = True
 GENERATE_IMAGES_WITH_BACKGROUND_NOISE = True
+UPDATE_LABEL_INDEX = False  # append every written sample to the columnar label index (label_index.py)
+# New splits store samples as <split>/ab/cd/<id>.jpg instead of one flat directory (dataset_layout.py)
+NESTED_LAYOUT = False
+# Output codec of the written images: Image.save format, file extension and encoder options,
+# e.g. ("WEBP", "webp", {"quality": 90, "method": 4}). Each split records its extension
+# (dataset_layout.py), which is where the dataset tools look the images up.
+OUTPUT_FORMAT = "JPEG"
+OUTPUT_EXT = "jpg"
+OUTPUT_OPTIONS = {"quality": 92}
+# "process": a multiprocessing pool, every worker with its own copy of the decoded assets;
+# "thread": one process whose threads share one copy (measure both with engine_benchmark.py
+# before switching). The memory-bounded pool settings below only apply to processes.
+WORKER_ENGINE = "process"
+NUM_WORKERS = None  # worker processes / threads, default: cpu count
+
+# Memory-bounded pool (worker_pool.py): a worker is recycled after WORKER_MAX_TASKS tasks or once its
+# RSS exceeds WORKER_MEMORY_BUDGET_MB (killed mid-task above 1.5x), and chunks whose worker raised,
+# died or was killed are re-run up to TASK_MAX_ATTEMPTS times. Both None: plain multiprocessing.Pool.
+WORKER_MEMORY_BUDGET_MB = None
+WORKER_MAX_TASKS = None
+TASK_MAX_ATTEMPTS = 3
+# Record every sample's plan (sample_plan.py) under datasets/plans/<split>/ while generating;
+# PLAN_ONLY (or --plan-only) writes only the plans, rendered later with `sample_plan.py render`.
+WRITE_PLAN = False
+PLAN_ONLY = False
+
+# Live telemetry (telemetry.py): a progress line every TELEMETRY_LOG_INTERVAL seconds (None = off),
+# and Prometheus metrics on http://127.0.0.1:<TELEMETRY_PORT>/metrics when a port is set
+TELEMETRY_LOG_INTERVAL = 30.0
+TELEMETRY_PORT = None
+
+# Incremental rebuilds (incremental.py): track the assets each sample came from in
+# datasets/generation_manifest.json and only generate samples of new or changed assets
+INCREMENTAL = False
+# Write samples into one memory-mapped (N, H, W, 3) array per split under DATASETS_TENSORS_DIR
+# (tensor_export.py) instead of JPEG + txt files; pixels still go through the final JPEG round trip.
+TENSOR_EXPORT = False
+
+# Resample the FEN when a worker repeats a (board, piece set, FEN) tuple, before anything is
+# rendered. Near-identical images are left to `near_duplicates.py clusters` on the finished split.
+DEDUPE_SAMPLES = False
+DEDUPE_MAX_RESAMPLES = 5
+
+# Share of samples drawn on an on-the-fly procedural board (procedural_boards.py)
+# instead of the assets/boards image the sample was assigned.
+PROCEDURAL_BOARD_RATIO = 0.0
+
+# Background-compositing tasks drawn from procedural_backgrounds.py (split train/val by
+# DATA_SPLIT) on top of the files in BACKGROUND_NOISE_DIR; every sample of such a task
+# gets a freshly generated background. Set a seed to make those backgrounds reproducible.
+PROCEDURAL_BACKGROUNDS = 0
+PROCEDURAL_BACKGROUND_SEED = None
 
 # Augmentation Probabilities (tuned for maximum YOLO26s generalization)
 PROB_PIECE_RESIZE = 0.40
@@ -42,6 +117,10 @@ PROB_NOISE = 0.40
 PROB_SCREEN_SCANLINES = 0.25
 PROB_VIGNETTE = 0.35
 PROB_RANDOM_LINES = 0.30
+# apply_noise takes its Gaussian / salt-and-pepper fields from windows of precomputed tiles
+# (noise_bank.py) instead of drawing a full-frame random field per sample
+NOISE_BANK = True
+NOISE_BANK_SEED = None  # None: a new bank every run (derived from --seed when given)
 
 FEN_TO_PIECE = {
     "p": "bP", "r": "bR", "n": "bN", "b": "bB", "q": "bQ", "k": "bK",
@@ -53,31 +132,49 @@ FEN_CHAR_ORDER = list(FEN_TO_PIECE.keys())
 # ---------------------------------------------------------------------------
 # Image Augmentation Utility Functions
 # ---------------------------------------------------------------------------
-def apply_jpeg_compression(img: Image.Image, min_q: int = 20, max_q: int = 90) -> Image.Image:
-    """Applies realistic JPEG compression artifacts (simulates web uploads and low-bitrate compression)."""
-    quality = random.randint(min_q, max_q)
+BLUR_GAUSSIAN, BLUR_BOX, BLUR_MOTION = 1, 2, 3
+NOISE_GAUSSIAN, NOISE_SALT_PEPPER = 1, 2
+
+
+def apply_jpeg_compression(img: Image.Image, min_q: int = 20, max_q: int = 90, quality: Optional[int] = None) -> Image.Image:
+    """
+    Applies realistic JPEG compression artifacts (simulates web uploads and low-bitrate compression).
+    The result decodes lazily and keeps its bytes as `encoded_jpeg`: when this is the last pixel
+    operation, save_sample writes them as they are. Don't draw onto the result in place.
+    """
+    quality = quality or random.randint(min_q, max_q)
     buffer = io.BytesIO()
     img.save(buffer, format="JPEG", quality=quality)
     buffer.seek(0)
-    return Image.open(buffer).convert("RGB")
+    degraded = Image.open(buffer)
+    degraded.encoded_jpeg = buffer.getvalue()
+    return degraded
+
 
+def sample_blur() -> Tuple[int, float, bool]:
+    """Draws apply_blur's (kind, amount, vertical): a Gaussian or box radius, or a motion kernel size."""
+    kind = random.choice([BLUR_GAUSSIAN, BLUR_BOX, BLUR_MOTION])
+    if kind == BLUR_GAUSSIAN:
+        return kind, random.uniform(0.5, 2.5), False
+    if kind == BLUR_BOX:
+        return kind, random.randint(1, 2), False
+    return kind, random.choice([3, 5, 7]), random.random() >= 0.5
 
-def apply_blur(img: Image.Image) -> Image.Image:
+
+def apply_blur(img: Image.Image, params: Optional[Tuple[int, float, bool]] = None) -> Image.Image:
     """Applies blur (Gaussian blur, box blur, or motion blur)."""
-    blur_choice = random.choice(["gaussian", "box", "motion"])
-    if blur_choice == "gaussian":
-        radius = random.uniform(0.5, 2.5)
-        return img.filter(ImageFilter.GaussianBlur(radius))
-    elif blur_choice == "box":
-        radius = random.randint(1, 2)
-        return img.filter(ImageFilter.BoxBlur(radius))
+    kind, amount, vertical = params or sample_blur()
+    if kind == BLUR_GAUSSIAN:
+        return img.filter(ImageFilter.GaussianBlur(amount))
+    elif kind == BLUR_BOX:
+        return img.filter(ImageFilter.BoxBlur(int(amount)))
     else:  # motion blur
         try:
             import cv2
             arr = np.array(img)
-            size = random.choice([3, 5, 7])
+            size = int(amount)
             kernel = np.zeros((size, size), dtype=np.float32)
-            if random.random() < 0.5:
+            if not vertical:
                 kernel[int((size - 1) / 2), :] = 1.0
             else:
                 kernel[:, int((size - 1) / 2)] = 1.0
@@ -88,32 +185,51 @@ def apply_blur(img: Image.Image) -> Image.Image:
             return img.filter(ImageFilter.GaussianBlur(random.uniform(0.8, 2.0)))
 
 
-def apply_noise(img: Image.Image) -> Image.Image:
-    """Applies Gaussian noise or salt-and-pepper grain."""
+def sample_noise() -> Tuple[int, float]:
+    """Draws apply_noise's (kind, amount): a Gaussian std or a salt-and-pepper probability."""
+    if random.random() < 0.7:
+        return NOISE_GAUSSIAN, random.uniform(5.0, 22.0)
+    return NOISE_SALT_PEPPER, random.uniform(0.005, 0.02)
+
+
+def apply_noise(
+    img: Image.Image, params: Optional[Tuple[int, float]] = None, bank_seed: Optional[int] = None
+) -> Image.Image:
+    """Applies Gaussian noise or salt-and-pepper grain (from the noise bank of `bank_seed` with NOISE_BANK)."""
+    kind, amount = params or sample_noise()
     arr = np.array(img, dtype=np.float32)
     h, w, c = arr.shape
     
-    if random.random() < 0.7:
-        std = random.uniform(5.0, 22.0)
-        noise = np.random.normal(0, std, (h, w, c))
+    if kind == NOISE_GAUSSIAN:
+        if NOISE_BANK:
+            noise = noise_bank.gaussian(h, w, c, amount, bank_seed, np_random)
+        else:
+            noise = np_random.normal(0, amount, (h, w, c))
         noisy_arr = np.clip(arr + noise, 0, 255).astype(np.uint8)
     else:
-        prob = random.uniform(0.005, 0.02)
-        rnd = np.random.rand(h, w)
-        arr[rnd < prob / 2] = 0
-        arr[rnd > 1 - prob / 2] = 255
+        if NOISE_BANK:
+            pepper, salt = noise_bank.salt_and_pepper(h, w, amount, bank_seed, np_random)
+        else:
+            rnd = np_random.rand(h, w)
+            pepper, salt = rnd < amount / 2, rnd > 1 - amount / 2
+        arr[pepper] = 0
+        arr[salt] = 255
         noisy_arr = np.clip(arr, 0, 255).astype(np.uint8)
         
     return Image.fromarray(noisy_arr)
 
 
-def apply_screen_scanlines(img: Image.Image) -> Image.Image:
+def sample_scanlines() -> Tuple[int, int]:
+    """Draws apply_screen_scanlines' (line spacing, alpha)."""
+    return random.choice([2, 3, 4, 5]), random.randint(15, 45)
+
+
+def apply_screen_scanlines(img: Image.Image, params: Optional[Tuple[int, int]] = None) -> Image.Image:
     """Simulates screen Moiré pattern / scanlines (photographing a computer screen)."""
+    line_spacing, alpha = params or sample_scanlines()
     overlay = Image.new("RGBA", img.size, (0, 0, 0, 0))
     draw = ImageDraw.Draw(overlay)
     w, h = img.size
-    line_spacing = random.choice([2, 3, 4, 5])
-    alpha = random.randint(15, 45)
     
     for y in range(0, h, line_spacing):
         draw.line([(0, y), (w, y)], fill=(0, 0, 0, alpha), width=1)
@@ -121,23 +237,22 @@ def apply_screen_scanlines(img: Image.Image) -> Image.Image:
     return Image.alpha_composite(img.convert("RGBA"), overlay).convert("RGB")
 
 
-def apply_color_jitter(img: Image.Image) -> Image.Image:
+def sample_color_jitter() -> Tuple[float, float, float, float]:
+    """Draws apply_color_jitter's brightness, contrast, saturation and sharpness factors (1.0 = left out)."""
+    return (
+        random.uniform(0.7, 1.3) if random.random() < 0.7 else 1.0,
+        random.uniform(0.7, 1.3) if random.random() < 0.7 else 1.0,
+        random.uniform(0.6, 1.4) if random.random() < 0.7 else 1.0,
+        random.uniform(0.5, 1.8) if random.random() < 0.5 else 1.0,
+    )
+
+
+def apply_color_jitter(img: Image.Image, factors: Optional[Tuple[float, float, float, float]] = None) -> Image.Image:
     """Applies brightness, contrast, saturation, and sharpness color jitter."""
-    if random.random() < 0.7:
-        factor = random.uniform(0.7, 1.3)
-        img = ImageEnhance.Brightness(img).enhance(factor)
-        
-    if random.random() < 0.7:
-        factor = random.uniform(0.7, 1.3)
-        img = ImageEnhance.Contrast(img).enhance(factor)
-        
-    if random.random() < 0.7:
-        factor = random.uniform(0.6, 1.4)
-        img = ImageEnhance.Color(img).enhance(factor)
-        
-    if random.random() < 0.5:
-        factor = random.uniform(0.5, 1.8)
-        img = ImageEnhance.Sharpness(img).enhance(factor)
+    enhancers = (ImageEnhance.Brightness, ImageEnhance.Contrast, ImageEnhance.Color, ImageEnhance.Sharpness)
+    for enhancer, factor in zip(enhancers, factors or sample_color_jitter()):
+        if factor != 1.0:
+            img = enhancer(img).enhance(factor)
 
     return img
 
@@ -183,16 +298,20 @@ def add_random_lines_and_spots(board: Image.Image) -> Image.Image:
     return Image.alpha_composite(board.convert("RGBA"), overlay).convert("RGB")
 
 
-def apply_perspective_transform(img: Image.Image, piece_labels: List[Tuple]) -> Tuple[Image.Image, List[Tuple]]:
-    """Applies slight perspective warping to board and updates bounding boxes."""
-    w, h = img.size
+def sample_perspective(w: int) -> Tuple[int, ...]:
+    """Draws the corner shifts (dx1, dy1, ..., dx4, dy4) of a slight perspective warp."""
     max_shift = int(w * 0.08)
-    
-    dx1, dy1 = random.randint(0, max_shift), random.randint(0, max_shift)
-    dx2, dy2 = random.randint(-max_shift, 0), random.randint(0, max_shift)
-    dx3, dy3 = random.randint(-max_shift, 0), random.randint(-max_shift, 0)
-    dx4, dy4 = random.randint(0, max_shift), random.randint(-max_shift, 0)
+    return (
+        random.randint(0, max_shift), random.randint(0, max_shift),
+        random.randint(-max_shift, 0), random.randint(0, max_shift),
+        random.randint(-max_shift, 0), random.randint(-max_shift, 0),
+        random.randint(0, max_shift), random.randint(-max_shift, 0),
+    )
 
+
+def perspective_coeffs(w: int, h: int, shifts: Tuple[int, ...]) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns (inverse coefficients for Image.transform, forward homography H) of a corner-shift warp."""
+    dx1, dy1, dx2, dy2, dx3, dy3, dx4, dy4 = shifts
     src_quad = [(0, 0), (w, 0), (w, h), (0, h)]
     dst_quad = [(dx1, dy1), (w + dx2, dy2), (w + dx3, h + dy3), (dx4, h + dy4)]
 
@@ -206,38 +325,44 @@ def apply_perspective_transform(img: Image.Image, piece_labels: List[Tuple]) ->
         res = A.I * B
         return np.array(res).reshape(8)
 
+    coeffs = find_coeffs(dst_quad, src_quad)
+    c = find_coeffs(src_quad, dst_quad)
+    H = np.array([[c[0], c[1], c[2]], [c[3], c[4], c[5]], [c[6], c[7], 1.0]])
+    return coeffs, H
+
+
+def warp_labels(piece_labels: List[Tuple], H: np.ndarray, w: int, h: int) -> List[Tuple]:
+    """Maps pixel boxes through homography H, clipped to the image; boxes that vanish are dropped."""
+    transformed_labels = []
+    for class_id, x, y, bw, bh in piece_labels:
+        pts = np.array([
+            [x, y, 1],
+            [x + bw, y, 1],
+            [x + bw, y + bh, 1],
+            [x, y + bh, 1]
+        ]).T
+        trans_pts = H @ pts
+        trans_pts /= trans_pts[2, :]
+        
+        x_min = max(0, np.min(trans_pts[0, :]))
+        y_min = max(0, np.min(trans_pts[1, :]))
+        x_max = min(w, np.max(trans_pts[0, :]))
+        y_max = min(h, np.max(trans_pts[1, :]))
+        
+        if x_max > x_min and y_max > y_min:
+            transformed_labels.append((class_id, x_min, y_min, x_max - x_min, y_max - y_min))
+    return transformed_labels
+
+
+def apply_perspective_transform(
+    img: Image.Image, piece_labels: List[Tuple], shifts: Optional[Tuple[int, ...]] = None
+) -> Tuple[Image.Image, List[Tuple]]:
+    """Applies slight perspective warping to board and updates bounding boxes."""
+    w, h = img.size
     try:
-        coeffs = find_coeffs(dst_quad, src_quad)
+        coeffs, H = perspective_coeffs(w, h, shifts or sample_perspective(w))
         warped_img = img.transform((w, h), Image.PERSPECTIVE, coeffs, Image.BICUBIC)
-        
-        A_fwd = []
-        for p1, p2 in zip(src_quad, dst_quad):
-            A_fwd.append([p1[0], p1[1], 1, 0, 0, 0, -p2[0]*p1[0], -p2[0]*p1[1]])
-            A_fwd.append([0, 0, 0, p1[0], p1[1], 1, -p2[1]*p1[0], -p2[1]*p1[1]])
-        res_fwd = np.matrix(A_fwd, dtype=np.float64).I * np.matrix(dst_quad, dtype=np.float64).reshape(8, 1)
-        c = np.array(res_fwd).flatten()
-        H = np.array([[c[0], c[1], c[2]], [c[3], c[4], c[5]], [c[6], c[7], 1.0]])
-
-        transformed_labels = []
-        for class_id, x, y, bw, bh in piece_labels:
-            pts = np.array([
-                [x, y, 1],
-                [x + bw, y, 1],
-                [x + bw, y + bh, 1],
-                [x, y + bh, 1]
-            ]).T
-            trans_pts = H @ pts
-            trans_pts /= trans_pts[2, :]
-            
-            x_min = max(0, np.min(trans_pts[0, :]))
-            y_min = max(0, np.min(trans_pts[1, :]))
-            x_max = min(w, np.max(trans_pts[0, :]))
-            y_max = min(h, np.max(trans_pts[1, :]))
-            
-            if x_max > x_min and y_max > y_min:
-                transformed_labels.append((class_id, x_min, y_min, x_max - x_min, y_max - y_min))
-
-        return warped_img, transformed_labels
+        return warped_img, warp_labels(piece_labels, H, w, h)
     except Exception:
         return img, piece_labels
 
@@ -245,16 +370,80 @@ def apply_perspective_transform(img: Image.Image, piece_labels: List[Tuple]) ->
 # ---------------------------------------------------------------------------
 # Asset Loading & Piece Processing
 # ---------------------------------------------------------------------------
+def _load_tile_bboxes(piece_set_name: str) -> Tuple[dict, float]:
+    """({piece: bbox} of a set from pieces_tiles/<TILE_SIZE>/bboxes.json, the file's mtime), empty when absent."""
+    path = f"{PIECE_TILES_DIR}/{TILE_SIZE}/bboxes.json"
+    if not os.path.exists(path):
+        return {}, 0.0
+    with open(path) as f:
+        return json.load(f).get(piece_set_name, {}), os.path.getmtime(path)
+
+
+def _alpha_outline(tile: Image.Image) -> List[Tuple[int, int]]:
+    """Convex hull (pixel corners) of the non-transparent pixels of a tile, [] when there are none."""
+    alpha = np.asarray(tile.getchannel("A")) > 0
+    rows = np.flatnonzero(alpha.any(axis=1))
+    points = set()
+    for y in rows:
+        xs = np.flatnonzero(alpha[y])
+        for x in (int(xs[0]), int(xs[-1]) + 1):
+            points.update(((x, int(y)), (x, int(y) + 1)))
+    points = sorted(points)
+    if len(points) < 3:
+        return points
+
+    def cross(o, a, b):
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+    # Andrew's monotone chain
+    hull = []
+    for chain in (points, points[::-1]):
+        start = len(hull)
+        for p in chain:
+            while len(hull) >= start + 2 and cross(hull[-2], hull[-1], p) <= 0:
+                hull.pop()
+            hull.append(p)
+        hull.pop()
+    return hull
+
+
 def load_pieces(piece_set_name: str) -> dict:
+    """
+    The TILE_SIZE RGBA tiles of a piece set by FEN character. Each tile carries the
+    alpha bounding box of its content in `tile.info["bbox"]` (from bboxes.json for
+    pre-rasterized tiles) and the convex hull of its alpha in `tile.info["outline"]`,
+    from which piece_geometry computes label boxes without drawing the piece.
+    """
     pieces = {}
+    tiles_dir = f"{PIECE_TILES_DIR}/{TILE_SIZE}/{piece_set_name}"
+    bboxes, bboxes_mtime = _load_tile_bboxes(piece_set_name)
     for f, p in FEN_TO_PIECE.items():
-        img_path = f"{PIECES_DIR}/{piece_set_name}/{p}.png"
-        with Image.open(img_path) as img:
-            rgba = img.convert("RGBA")
-            pieces[f] = rgba.resize((TILE_SIZE, TILE_SIZE), Image.BILINEAR)
+        tile_path = f"{tiles_dir}/{p}.png"
+        bbox = None
+        if os.path.exists(tile_path):
+            # already rasterized at TILE_SIZE, no resize needed
+            with Image.open(tile_path) as img:
+                tile = img.convert("RGBA")
+            if p in bboxes and os.path.getmtime(tile_path) <= bboxes_mtime:
+                bbox = tuple(bboxes[p]) if bboxes[p] else None
+            else:
+                bbox = tile.getbbox()  # tile re-rasterized after bboxes.json was written
+        else:
+            img_path = f"{PIECES_DIR}/{piece_set_name}/{p}.png"
+            with Image.open(img_path) as img:
+                tile = img.convert("RGBA").resize((TILE_SIZE, TILE_SIZE), Image.BILINEAR)
+            bbox = tile.getbbox()
+        tile.info["bbox"] = bbox
+        tile.info["outline"] = _alpha_outline(tile)
+        pieces[f] = tile
     return pieces
 
 
+def load_background(background_file: str) -> Image.Image:
+    with Image.open(f"{BACKGROUND_NOISE_DIR}/{background_file}") as img:
+        return img.convert("RGB").resize((BOARD_SIZE, BOARD_SIZE))
+
+
 def load_board(board_file: str) -> Image.Image:
     board_path = f"{BOARDS_DIR}/{board_file}"
     with Image.open(board_path) as img:
@@ -262,6 +451,20 @@ def load_board(board_file: str) -> Image.Image:
         return rgb.resize((BOARD_SIZE, BOARD_SIZE), Image.BILINEAR)
 
 
+def save_sample(image: Image.Image, path: str):
+    """
+    Encodes a finished sample once. An image whose last pixel operation was
+    apply_jpeg_compression is written as its degraded bytes instead of being
+    decoded and re-encoded at the output quality.
+    """
+    encoded = getattr(image, "encoded_jpeg", None)
+    if encoded is not None and OUTPUT_FORMAT == "JPEG":
+        with open(path, "wb") as f:
+            f.write(encoded)
+        return
+    image.save(path, OUTPUT_FORMAT, **OUTPUT_OPTIONS)
+
+
 def yolo_label(x, y, w, h, img_w, img_h, class_id) -> str:
     """Converts absolute pixel box to normalized YOLO format line."""
     xc = (x + w / 2.0) / img_w
@@ -290,15 +493,22 @@ def labels_to_yolo_lines(piece_labels, img_w, img_h, x_bias=0.0, y_bias=0.0, sca
     return lines
 
 
-def _apply_random_resize(piece_image: Image.Image) -> Image.Image:
-    bbox = piece_image.getbbox()
+def tile_bbox(tile: Image.Image) -> Optional[Tuple[int, int, int, int]]:
+    """Alpha bounding box of a tile from load_pieces (measured when it is not one)."""
+    return tile.info["bbox"] if "bbox" in tile.info else tile.getbbox()
+
+
+def _apply_random_resize(
+    piece_image: Image.Image, scale_factor: Optional[float] = None, bbox: Optional[Tuple[int, int, int, int]] = None
+) -> Image.Image:
+    bbox = bbox or piece_image.getbbox()
     if not bbox:
         return piece_image
 
     piece_content = piece_image.crop(bbox)
     content_width, content_height = piece_content.size
 
-    scale_factor = random.uniform(0.80, 1.20)
+    scale_factor = scale_factor or random.uniform(0.80, 1.20)
     new_width = min(int(content_width * scale_factor), PIECE_CANVAS_SIZE)
     new_height = min(int(content_height * scale_factor), PIECE_CANVAS_SIZE)
     if new_width <= 0 or new_height <= 0:
@@ -312,13 +522,89 @@ def _apply_random_resize(piece_image: Image.Image) -> Image.Image:
     return canvas
 
 
+def place_piece(tile: Image.Image, scale: float = 0.0, angle: Optional[float] = None) -> Image.Image:
+    """A piece tile after its optional content resize (scale 0 = none) and rotation (None = none)."""
+    piece_image = tile
+    if scale:
+        piece_image = _apply_random_resize(piece_image, scale, tile_bbox(tile))
+    if angle is not None:
+        piece_image = piece_image.rotate(angle, expand=True)
+    return piece_image
+
+
+def _rotate_points(
+    size: Tuple[int, int], points: List[Tuple[float, float]], angle: float
+) -> Tuple[Tuple[int, int], List[Tuple[float, float]]]:
+    """Size of `Image.rotate(angle, expand=True)` of an image of `size`, and where `points` end up in it."""
+    w, h = size
+    if angle % 360.0 == 0:
+        return size, points
+    # the output size exactly as PIL computes it (see Image.rotate)
+    theta = -math.radians(angle)
+    cos, sin = round(math.cos(theta), 15), round(math.sin(theta), 15)
+    cx, cy = w / 2, h / 2
+    tx, ty = cos * -cx + sin * -cy + cx, -sin * -cx + cos * -cy + cy
+    xx = [cos * x + sin * y + tx for x, y in ((0, 0), (w, 0), (w, h), (0, h))]
+    yy = [-sin * x + cos * y + ty for x, y in ((0, 0), (w, 0), (w, h), (0, h))]
+    nw = math.ceil(max(xx)) - math.floor(min(xx))
+    nh = math.ceil(max(yy)) - math.floor(min(yy))
+    # PIL's matrix maps output pixels back to the input about the two centres; its transpose maps forward
+    return (nw, nh), [
+        (cos * (x - cx) - sin * (y - cy) + nw / 2, sin * (x - cx) + cos * (y - cy) + nh / 2) for x, y in points
+    ]
+
+
+def piece_geometry(
+    tile: Image.Image, scale: float = 0.0, angle: Optional[float] = None
+) -> Tuple[Tuple[int, int], Optional[Tuple[int, int, int, int]]]:
+    """
+    Size of `place_piece(tile, scale, angle)` and the box of its content, computed from the
+    tile's recorded outline (its bbox corners without one) instead of drawing the piece: the
+    content is scaled about the canvas centre as in _apply_random_resize, then rotated with it.
+    """
+    size, bbox = tile.size, tile_bbox(tile)
+    if not bbox:
+        return (_rotate_points(size, [], angle)[0] if angle is not None else size), None
+    x1, y1, x2, y2 = bbox
+    points = tile.info.get("outline") or [(x1, y1), (x2, y1), (x2, y2), (x1, y2)]
+    if scale:
+        new_width = min(int((x2 - x1) * scale), PIECE_CANVAS_SIZE)
+        new_height = min(int((y2 - y1) * scale), PIECE_CANVAS_SIZE)
+        if new_width > 0 and new_height > 0:
+            paste_x = (PIECE_CANVAS_SIZE - new_width) // 2
+            paste_y = (PIECE_CANVAS_SIZE - new_height) // 2
+            sx, sy = new_width / (x2 - x1), new_height / (y2 - y1)
+            size = (PIECE_CANVAS_SIZE, PIECE_CANVAS_SIZE)
+            points = [(paste_x + (x - x1) * sx, paste_y + (y - y1) * sy) for x, y in points]
+    if angle is not None:
+        size, points = _rotate_points(size, points, angle)
+    xs, ys = [x for x, _ in points], [y for _, y in points]
+    return size, (
+        max(0, math.floor(min(xs))), max(0, math.floor(min(ys))),
+        min(size[0], math.ceil(max(xs))), min(size[1], math.ceil(max(ys))),
+    )
+
+
+def _paste_position(square: int, size: Tuple[int, int], shift: Tuple[int, int]) -> Tuple[int, int]:
+    """Top-left board pixel of a placed piece of `size`, centred on its square and shifted."""
+    x, y = (square % 8) * TILE_SIZE, (square // 8) * TILE_SIZE
+    offset_x = (size[0] - TILE_SIZE) // 2
+    offset_y = (size[1] - TILE_SIZE) // 2
+    return x - offset_x + shift[0], y - offset_y + shift[1]
+
+
 # ---------------------------------------------------------------------------
 # Core Image Generation Function
 # ---------------------------------------------------------------------------
-def generate_image(board: Image.Image, piece_set: dict, fen: str) -> Tuple[Image.Image, List[Tuple]]:
-    """Draws pieces onto board according to FEN, with micro-jitters & augmentations."""
-    piece_labels = []
-    board = board.copy()
+def plan_image(piece_set: dict, fen: str) -> dict:
+    """
+    Draws every random decision of a board render (per-piece resize, rotation and
+    offset, which augmentations fire and with what parameters) and the piece boxes
+    they imply, in board pixels, computed geometrically (piece_geometry) without
+    drawing any pixels.
+    """
+    pieces, piece_labels = [], []
+    max_shift = int(TILE_SIZE * 0.07)
 
     for row, fen_rank in enumerate(fen.split()[0].split("/")):
         file_index = 0
@@ -331,30 +617,17 @@ def generate_image(board: Image.Image, piece_set: dict, fen: str) -> Tuple[Image
                 file_index += 1
                 continue
 
-            x, y = file_index * TILE_SIZE, row * TILE_SIZE
-            piece_image = piece_set[char].copy()
-
-            if random.random() < PROB_PIECE_RESIZE:
-                piece_image = _apply_random_resize(piece_image)
-
-            if random.random() < PROB_PIECE_ROTATE:
-                piece_image = piece_image.rotate(random.uniform(-14, 14), expand=True)
-
-            offset_x = (piece_image.width - TILE_SIZE) // 2
-            offset_y = (piece_image.height - TILE_SIZE) // 2
-            
-            shift_x = 0
-            shift_y = 0
+            scale = random.uniform(0.80, 1.20) if random.random() < PROB_PIECE_RESIZE else 0.0
+            angle = random.uniform(-14, 14) if random.random() < PROB_PIECE_ROTATE else None
+            shift = (0, 0)
             if random.random() < PROB_PIECE_OFFSET:
-                shift_x = random.randint(-int(TILE_SIZE * 0.07), int(TILE_SIZE * 0.07))
-                shift_y = random.randint(-int(TILE_SIZE * 0.07), int(TILE_SIZE * 0.07))
+                shift = (random.randint(-max_shift, max_shift), random.randint(-max_shift, max_shift))
 
-            paste_x = x - offset_x + shift_x
-            paste_y = y - offset_y + shift_y
+            square = row * 8 + file_index
+            size, bbox = piece_geometry(piece_set[char], scale, angle)
+            paste_x, paste_y = _paste_position(square, size, shift)
+            pieces.append((square, char, scale, angle, shift))
 
-            board.paste(piece_image, (paste_x, paste_y), piece_image)
-
-            bbox = piece_image.getbbox()
             if bbox:
                 bx1, by1, bx2, by2 = bbox
                 abs_x1 = max(0, paste_x + bx1)
@@ -369,131 +642,374 @@ def generate_image(board: Image.Image, piece_set: dict, fen: str) -> Tuple[Image
 
             file_index += 1
 
-    if random.random() < PROB_RANDOM_LINES:
+    plan = {"fen": fen, "pieces": pieces, "random_lines": random.random() < PROB_RANDOM_LINES, "warp": None}
+    if random.random() < PROB_PERSPECTIVE_WARP:
+        shifts = sample_perspective(BOARD_SIZE)
+        try:
+            _, H = perspective_coeffs(BOARD_SIZE, BOARD_SIZE, shifts)
+            piece_labels = warp_labels(piece_labels, H, BOARD_SIZE, BOARD_SIZE)
+            plan["warp"] = shifts
+        except Exception:
+            pass  # a degenerate warp is left out, as in apply_perspective_transform
+    plan["jitter"] = sample_color_jitter() if random.random() < PROB_COLOR_JITTER else None
+    plan["vignette"] = random.random() < PROB_VIGNETTE
+    plan["scanlines"] = sample_scanlines() if random.random() < PROB_SCREEN_SCANLINES else None
+    plan["blur"] = sample_blur() if random.random() < PROB_BLUR else None
+    plan["noise"] = sample_noise() if random.random() < PROB_NOISE else None
+    plan["noise_bank"] = _NOISE_BANK_SEED
+    plan["jpeg"] = random.randint(25, 88) if random.random() < PROB_JPEG_COMPRESSION else None
+    plan["labels"] = piece_labels
+    return plan
+
+
+def render_image(board: Image.Image, piece_set: dict, plan: dict) -> Image.Image:
+    """Draws the pieces and augmentations of a plan_image plan onto a copy of `board`."""
+    board = board.copy()
+    for square, char, scale, angle, shift in plan["pieces"]:
+        piece_image = place_piece(piece_set[char], scale, angle)
+        board.paste(piece_image, _paste_position(square, piece_image.size, shift), piece_image)
+
+    if plan["random_lines"]:
         board = add_random_lines_and_spots(board)
 
-    if random.random() < PROB_PERSPECTIVE_WARP:
-        board, piece_labels = apply_perspective_transform(board, piece_labels)
+    if plan["warp"] is not None:
+        board, _ = apply_perspective_transform(board, [], plan["warp"])
 
-    if random.random() < PROB_COLOR_JITTER:
-        board = apply_color_jitter(board)
+    if plan["jitter"] is not None:
+        board = apply_color_jitter(board, plan["jitter"])
 
-    if random.random() < PROB_VIGNETTE:
+    if plan["vignette"]:
         board = apply_vignette(board)
 
-    if random.random() < PROB_SCREEN_SCANLINES:
-        board = apply_screen_scanlines(board)
+    if plan["scanlines"] is not None:
+        board = apply_screen_scanlines(board, plan["scanlines"])
+
+    if plan["blur"] is not None:
+        board = apply_blur(board, plan["blur"])
 
-    if random.random() < PROB_BLUR:
-        board = apply_blur(board)
+    if plan["noise"] is not None:
+        board = apply_noise(board, plan["noise"], plan.get("noise_bank"))
 
-    if random.random() < PROB_NOISE:
-        board = apply_noise(board)
+    if plan["jpeg"] is not None:
+        board = apply_jpeg_compression(board, quality=plan["jpeg"])
 
-    if random.random() < PROB_JPEG_COMPRESSION:
-        board = apply_jpeg_compression(board, min_q=25, max_q=88)
+    return board
 
-    return board, piece_labels
+
+def generate_image(board: Image.Image, piece_set: dict, fen: str) -> Tuple[Image.Image, List[Tuple]]:
+    """Draws pieces onto board according to FEN, with micro-jitters & augmentations."""
+    plan = plan_image(piece_set, fen)
+    return render_image(board, piece_set, plan), plan["labels"]
+
+
+def plan_composite() -> dict:
+    """Draws a scene composite: the board's size and position on the background, then its augmentations."""
+    board_size = random.randint(320, BOARD_SIZE)
+    max_pos = BOARD_SIZE - board_size
+    return {
+        "board_size": board_size,
+        "x": random.randint(0, max_pos),
+        "y": random.randint(0, max_pos),
+        "jitter": sample_color_jitter() if random.random() < PROB_COLOR_JITTER else None,
+        "blur": sample_blur() if random.random() < PROB_BLUR else None,
+        "noise": sample_noise() if random.random() < PROB_NOISE else None,
+        "jpeg": random.randint(25, 85) if random.random() < PROB_JPEG_COMPRESSION else None,
+    }
+
+
+def render_composite(
+    background: Image.Image, chessboard: Image.Image, composite: dict, noise_bank_seed: Optional[int] = None
+) -> Image.Image:
+    size = composite["board_size"]
+    image = background.copy()
+    image.paste(chessboard.resize((size, size)), (composite["x"], composite["y"]))
+    if composite["jitter"] is not None:
+        image = apply_color_jitter(image, composite["jitter"])
+    if composite["blur"] is not None:
+        image = apply_blur(image, composite["blur"])
+    if composite["noise"] is not None:
+        image = apply_noise(image, composite["noise"], noise_bank_seed)
+    if composite["jpeg"] is not None:
+        image = apply_jpeg_compression(image, quality=composite["jpeg"])
+    return image
+
+
+def plan_labels(plan: dict) -> List[str]:
+    """YOLO label lines of a planned sample, placed on its scene when it has one."""
+    composite = plan.get("composite")
+    if composite is None:
+        lines = labels_to_yolo_lines(plan["labels"], BOARD_SIZE, BOARD_SIZE)
+        if MAKE_LABELS_FOR_CHESSBOARD:
+            lines.append(yolo_label(0, 0, BOARD_SIZE, BOARD_SIZE, BOARD_SIZE, BOARD_SIZE, "12"))
+        return lines
+
+    x, y, size = composite["x"], composite["y"], composite["board_size"]
+    lines = labels_to_yolo_lines(
+        plan["labels"], BOARD_SIZE, BOARD_SIZE, x_bias=x, y_bias=y, scale=size / BOARD_SIZE
+    )
+    if MAKE_LABELS_FOR_CHESSBOARD:
+        lines.append(yolo_label(x, y, size, size, BOARD_SIZE, BOARD_SIZE, "12"))
+    return lines
+
+
+@contextmanager
+def _seeded(seed: int):
+    """Seeds `random` and `np.random` for one block and restores their streams afterwards."""
+    state, np_state = random.getstate(), np_random.get_state()
+    random.seed(seed)
+    np_random.seed(seed)
+    try:
+        yield
+    finally:
+        random.setstate(state)
+        np_random.set_state(np_state)
+
+
+def render_sample(plan, board_image, piece_set, board_source=None, background=None, background_source=None):
+    """
+    Renders a full plan under its own seed, so a plan gives the same pixels wherever
+    it is rendered. Board -1 draws a procedural board from `board_source`; a scene
+    whose `background` is None draws a procedural one from `background_source`.
+    """
+    with _seeded(plan["seed"]):
+        board = board_source.generate() if plan["board"] < 0 else board_image
+        image = render_image(board, piece_set, plan)
+        composite = plan.get("composite")
+        if composite is not None:
+            if background is None:
+                background = background_source.generate(background_source.rng_for(plan["seed"]))
+            image = render_composite(background, image, composite, plan.get("noise_bank"))
+    return image
 
 
 # ---------------------------------------------------------------------------
 # Parallel Worker Generation Functions
 # ---------------------------------------------------------------------------
-def generate_images_worker(args):
-    boards, pieces, images_dir, labels_dir, variations, image_id = args[0:6]
-    for board_image in boards:
-        for _ in range(variations):
-            fen = generate_fen()
-            img_path = f"{images_dir}/{image_id}.jpg"
-            label_path = f"{labels_dir}/{image_id}.txt"
+_TELEMETRY = None  # telemetry.Telemetry of the running main(), inherited by the forked workers
+_NOISE_BANK_SEED = None  # noise bank of the running main(), recorded in every plan
 
-            image, piece_labels = generate_image(board_image, pieces, fen)
-            image.save(img_path, "JPEG", quality=92)
 
-            lines = labels_to_yolo_lines(piece_labels, BOARD_SIZE, BOARD_SIZE)
-            if MAKE_LABELS_FOR_CHESSBOARD:
-                lines.append(
-                    yolo_label(0, 0, BOARD_SIZE, BOARD_SIZE, BOARD_SIZE, BOARD_SIZE, "12")
-                )
+def _label_index_appender(labels_dir):
+    if not UPDATE_LABEL_INDEX:
+        return None
+    from label_index import LabelIndexAppender
 
-            with open(label_path, "w") as f:
-                f.write("\n".join(lines))
+    # flushed once per task, so a chunk that fails and is re-run leaves no partial records behind
+    return LabelIndexAppender(os.path.basename(os.path.normpath(labels_dir)), flush_every=2**62)
 
-            image_id += 1
 
+def _seed_worker():
+    """Pool initializer: forked workers inherit the parent's NumPy RNG state, so reseed it."""
+    seed = int.from_bytes(os.urandom(4), "little")
+    random.seed(seed)
+    np_random.seed(seed)
 
-def generate_images_with_background_noise_worker(args):
-    images_dir, labels_dir, boards, piece_sets, background, variations, image_id = args
 
-    bg_path = f"{BACKGROUND_NOISE_DIR}/{background}"
-    with Image.open(bg_path) as img:
-        bg_img = img.convert("RGB").resize((BOARD_SIZE, BOARD_SIZE))
+def _reported_task(worker, args):
+    """Runs one pool task with the telemetry marking its worker busy; a task that raises has its samples dropped."""
+    _TELEMETRY.task_started()
+    ok = False
+    try:
+        result = worker(args)
+        ok = True
+        return result
+    finally:
+        _TELEMETRY.task_done(ok)
+
+
+def _run_pool(worker, tasks):
+    if _TELEMETRY:
+        _TELEMETRY.submit(len(tasks))
+        worker = partial(_reported_task, worker)
+    num_workers = NUM_WORKERS or max(1, multiprocessing.cpu_count())
+    if WORKER_ENGINE == "thread":
+        from concurrent.futures import ThreadPoolExecutor
+
+        # every thread draws from its own RNGs (thread_rng.py), seeded on first use
+        with ThreadPoolExecutor(num_workers) as pool:
+            return list(pool.map(worker, tasks))
+    if WORKER_MEMORY_BUDGET_MB is None and WORKER_MAX_TASKS is None:
+        with multiprocessing.Pool(num_workers, initializer=_seed_worker) as pool:
+            return pool.map(worker, tasks)
+    from worker_pool import BoundedPool
+
+    pool = BoundedPool(num_workers, WORKER_MEMORY_BUDGET_MB, WORKER_MAX_TASKS, TASK_MAX_ATTEMPTS, _seed_worker)
+    results = pool.map(worker, tasks)
+    print(pool.report())
+    if _TELEMETRY:
+        _TELEMETRY.given_up(len(pool.failed))
+    return results
+
+
+def _commit_results(tensor_writer, plan_out, results):
+    """Commits what the tasks returned: their tensor rows and, when recording plans, their sample plans."""
+    if plan_out is not None:
+        plan_out.append(row for result in results if result is not None for row in result[1] or [])
+    if tensor_writer:
+        if any(result is None for result in results):
+            # the split's rows must be contiguous, so rows of a chunk that never succeeded can't be skipped
+            failed = sum(result is None for result in results)
+            raise RuntimeError(f"{failed} chunks failed every attempt, {tensor_writer.directory} was not extended")
+        tensor_writer.commit(sample for samples, _ in results for sample in samples)
+
+
+def _tensor_split_writer(images_dir):
+    if not TENSOR_EXPORT or PLAN_ONLY:
+        return None
+    from tensor_export import TensorSplitWriter
+
+    return TensorSplitWriter(os.path.join(DATASETS_TENSORS_DIR, os.path.basename(os.path.normpath(images_dir))))
+
+
+def _tensor_row_writer(images_dir):
+    if not TENSOR_EXPORT or PLAN_ONLY:
+        return None
+    from tensor_export import TensorRowWriter
+
+    return TensorRowWriter(os.path.join(DATASETS_TENSORS_DIR, os.path.basename(os.path.normpath(images_dir))))
+
+
+def _sample_deduper():
+    if not DEDUPE_SAMPLES:
+        return None
+    from near_duplicates import SampleDeduper
+
+    return SampleDeduper()
+
+
+def _write_sample(images_dir, labels_dir, image_id, image, lines, tensor_out, index):
+    text = "\n".join(lines)
+    if tensor_out:
+        tensor_out.write(image_id, image, lines)
+        nbytes = tensor_out.images[0].nbytes + 20 * len(lines)
+    else:
+        ensure_sample_dir(images_dir, image_id)
+        ensure_sample_dir(labels_dir, image_id)
+        image_path = sample_path(images_dir, image_id, OUTPUT_EXT)
+        save_sample(image, image_path)
+        with open(sample_path(labels_dir, image_id, "txt"), "w") as f:
+            f.write(text)
+        nbytes = os.path.getsize(image_path) + len(text)
+    if index:
+        index.add(image_id, lines)
+    if _TELEMETRY:
+        _TELEMETRY.sample_written(os.path.basename(os.path.normpath(labels_dir)), nbytes)
 
-    original_bg_size = bg_img.width
 
-    for _ in range(variations):
-        board_img = random.choice(boards)
-        board_size_random = random.randint(320, BOARD_SIZE)
-        scale_factor = board_size_random / original_bg_size
-        max_pos = original_bg_size - board_size_random
-
-        bg_img_copy = bg_img.copy()
-        random_x = random.randint(0, max_pos)
-        random_y = random.randint(0, max_pos)
-
-        pieces = random.choice(piece_sets)
-        fen = generate_fen()
-        chessboard, piece_labels = generate_image(board_img, pieces, fen)
-        chessboard = chessboard.resize((board_size_random, board_size_random))
-
-        bg_img_copy.paste(chessboard, (random_x, random_y))
-
-        if random.random() < PROB_COLOR_JITTER:
-            bg_img_copy = apply_color_jitter(bg_img_copy)
-        if random.random() < PROB_BLUR:
-            bg_img_copy = apply_blur(bg_img_copy)
-        if random.random() < PROB_NOISE:
-            bg_img_copy = apply_noise(bg_img_copy)
-        if random.random() < PROB_JPEG_COMPRESSION:
-            bg_img_copy = apply_jpeg_compression(bg_img_copy, min_q=25, max_q=85)
-
-        labels = labels_to_yolo_lines(
-            piece_labels,
-            BOARD_SIZE,
-            BOARD_SIZE,
-            x_bias=random_x,
-            y_bias=random_y,
-            scale=scale_factor,
-        )
+def generate_images_worker(args):
+    boards, pieces, images_dir, labels_dir, variations, image_id = args[0:6]
+    board_source = args[6] if len(args) > 6 else None
+    piece_set_idx = args[7] if len(args) > 7 else 0
+    index = _label_index_appender(labels_dir)
+    deduper = _sample_deduper()
+    tensor_out = _tensor_row_writer(images_dir)
+    plans = [] if WRITE_PLAN or PLAN_ONLY else None
+    for board_idx, board_image in enumerate(boards):
+        for _ in range(variations):
+            seed = random.getrandbits(32)
+            # procedural boards are unique, so they have no dedupe key
+            procedural = board_source is not None and random.random() < PROCEDURAL_BOARD_RATIO
+            board_key = None if procedural else board_idx
+
+            # each task covers one piece set, so (board, FEN) identifies the tuple
+            for attempt in range(DEDUPE_MAX_RESAMPLES + 1):
+                fen = generate_fen(rng=random)
+                if not deduper or board_key is None or deduper.accept_key((board_key, fen)):
+                    break
+            plan = plan_image(pieces, fen)
+            plan.update(seed=seed, board=-1 if procedural else board_idx, piece_set=piece_set_idx)
+            if not PLAN_ONLY:
+                image = render_sample(plan, board_image, pieces, board_source)
+
+            lines = plan_labels(plan)
+            if plans is not None:
+                plans.append((image_id, plan, lines))
+            if not PLAN_ONLY:
+                _write_sample(images_dir, labels_dir, image_id, image, lines, tensor_out, index)
+            image_id += 1
 
-        if MAKE_LABELS_FOR_CHESSBOARD:
-            labels.append(
-                yolo_label(
-                    random_x,
-                    random_y,
-                    board_size_random,
-                    board_size_random,
-                    BOARD_SIZE,
-                    BOARD_SIZE,
-                    "12",
-                )
-            )
+    if index:
+        index.flush()
+    return (tensor_out.close() if tensor_out else None), plans
 
-        bg_img_copy.save(f"{images_dir}/{image_id}.jpg", "JPEG", quality=92)
-        with open(f"{labels_dir}/{image_id}.txt", "w") as f:
-            f.write("\n".join(labels))
 
+def generate_images_with_background_noise_worker(args):
+    images_dir, labels_dir, boards, piece_sets, background, variations, image_id = args[0:7]
+    board_source = args[7] if len(args) > 7 else None
+    background_source = args[8] if len(args) > 8 else None
+    background_idx = args[9] if len(args) > 9 else 0
+    index = _label_index_appender(labels_dir)
+    deduper = _sample_deduper()
+    tensor_out = _tensor_row_writer(images_dir)
+    # incremental runs record which board and piece set each scene drew, from its plan
+    plans = [] if WRITE_PLAN or PLAN_ONLY or INCREMENTAL else None
+
+    # background None: a procedural background per sample instead of one file per task
+    bg_img = None
+    if background is not None and not PLAN_ONLY:
+        bg_img = load_background(background)
+
+    for _ in range(variations):
+        seed = random.getrandbits(32)
+        board_idx = random.randrange(len(boards))
+        procedural = board_source is not None and random.random() < PROCEDURAL_BOARD_RATIO
+        board_key = None if procedural else board_idx
+        composite = plan_composite()
+        composite["background"] = background_idx
+
+        pieces_idx = random.randrange(len(piece_sets))
+        pieces = piece_sets[pieces_idx]
+        # each task covers one background, so (board, piece set, FEN) identifies the tuple
+        for attempt in range(DEDUPE_MAX_RESAMPLES + 1):
+            fen = generate_fen(rng=random)
+            if not deduper or board_key is None or deduper.accept_key((board_key, pieces_idx, fen)):
+                break
+        plan = plan_image(pieces, fen)
+        plan.update(seed=seed, board=-1 if procedural else board_idx, piece_set=pieces_idx, composite=composite)
+        if not PLAN_ONLY:
+            image = render_sample(plan, boards[board_idx], pieces, board_source, bg_img, background_source)
+
+        lines = plan_labels(plan)
+        if plans is not None:
+            plans.append((image_id, plan, lines))
+        if not PLAN_ONLY:
+            _write_sample(images_dir, labels_dir, image_id, image, lines, tensor_out, index)
         image_id += 1
 
+    if index:
+        index.flush()
+    return (tensor_out.close() if tensor_out else None), plans
+
 
 # ---------------------------------------------------------------------------
 # Dataset Generation Pipeline
 # ---------------------------------------------------------------------------
-def generate_datasets(images_dir, labels_dir, boards, piece_sets, variations):
+def generate_datasets(
+    images_dir,
+    labels_dir,
+    boards,
+    piece_sets,
+    variations,
+    board_source=None,
+    first_id=None,
+    shard=None,
+    plan_out=None,
+    sample_log=None,
+):
+    """
+    Returns the (first id, count) ranges it generated. A sharded run (`shard` = (i, N)) takes its
+    ids from the planned `first_id` and only runs every N-th task. Sample plans are appended to
+    `plan_out` (a sample_plan.PlanWriter over the same boards and piece sets) when given, and
+    the samples' assets to `sample_log` (an incremental.SampleLog, likewise).
+    """
     os.makedirs(images_dir, exist_ok=True)
     os.makedirs(labels_dir, exist_ok=True)
 
-    current_id = get_next_image_id(images_dir)
+    tensor_writer = _tensor_split_writer(images_dir)
+    if tensor_writer:
+        current_id = tensor_writer.reserve(len(piece_sets) * len(boards) * variations)
+    else:
+        current_id = _reserve_ids(images_dir, labels_dir, len(piece_sets) * len(boards) * variations, first_id)
     tasks = [
         (
             boards,
@@ -502,21 +1018,52 @@ def generate_datasets(images_dir, labels_dir, boards, piece_sets, variations):
             labels_dir,
             variations,
             current_id + (idx * len(boards) * variations),
+            board_source,
+            idx,
         )
         for idx, piece_set in enumerate(piece_sets)
     ]
-    num_workers = max(1, multiprocessing.cpu_count())
-    with multiprocessing.Pool(num_workers) as pool:
-        pool.map(generate_images_worker, tasks)
+    if shard is not None:
+        tasks = tasks[shard[0] :: shard[1]]
+    results = _run_pool(generate_images_worker, tasks)
+    _commit_results(tensor_writer, plan_out, results)
+    if sample_log is not None:
+        for task, result in zip(tasks, results):
+            if result is not None:
+                sample_log.add_board_renders(task[5], task[7], variations)
+        sample_log.save()
+    return [(task[5], len(boards) * variations) for task, result in zip(tasks, results) if result is not None]
 
 
 def run_generate_datasets_with_background_noise(
-    images_dir, labels_dir, boards, piece_sets, backgrounds, variations
+    images_dir,
+    labels_dir,
+    boards,
+    piece_sets,
+    backgrounds,
+    variations,
+    board_source=None,
+    background_source=None,
+    first_id=None,
+    shard=None,
+    plan_out=None,
+    sample_log=None,
+    counts=None,
 ):
+    """
+    Returns the (first id, count) ranges it generated; `first_id`, `shard`, `plan_out` and `sample_log`
+    as in generate_datasets. `counts` gives the number of scenes per background (default `variations`).
+    """
     os.makedirs(images_dir, exist_ok=True)
     os.makedirs(labels_dir, exist_ok=True)
 
-    current_id = get_next_image_id(images_dir)
+    counts = counts or [variations] * len(backgrounds)
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(int).tolist()
+    tensor_writer = _tensor_split_writer(images_dir)
+    if tensor_writer:
+        current_id = tensor_writer.reserve(offsets[-1])
+    else:
+        current_id = _reserve_ids(images_dir, labels_dir, offsets[-1], first_id)
 
     tasks = [
         (
@@ -525,15 +1072,25 @@ def run_generate_datasets_with_background_noise(
             boards,
             piece_sets,
             backgrounds[idx],
-            variations,
-            current_id + (idx * variations),
+            counts[idx],
+            current_id + offsets[idx],
+            board_source,
+            background_source,
+            idx,
         )
         for idx in range(len(backgrounds))
     ]
+    if shard is not None:
+        tasks = tasks[shard[0] :: shard[1]]
 
-    num_workers = max(1, multiprocessing.cpu_count())
-    with multiprocessing.Pool(num_workers) as pool:
-        pool.map(generate_images_with_background_noise_worker, tasks)
+    results = _run_pool(generate_images_with_background_noise_worker, tasks)
+    _commit_results(tensor_writer, plan_out, results)
+    if sample_log is not None:
+        for result in results:
+            for image_id, plan, _ in result[1] if result is not None else []:
+                sample_log.add_scene(image_id, plan["board"], plan["piece_set"], plan["composite"]["background"])
+        sample_log.save()
+    return [(task[6], task[5]) for task, result in zip(tasks, results) if result is not None]
 
 
 def split_data(boards, pieces_sets, split):
@@ -555,82 +1112,432 @@ def randomize_and_split_data(boards, pieces_sets, split):
 
 
 def get_next_image_id(dir_path):
-    ids = []
-    for f in os.listdir(dir_path):
-        name, dot, ext = f.partition(".")
-        if dot and name.isdigit():
-            ids.append(int(name))
-    return max(ids) + 1 if ids else 1
-
+    return IdAllocator(dir_path).peek()
+
+
+def _reserve_ids(images_dir, labels_dir, count, first_id=None):
+    """
+    Sets up the split layout and reserves `count` consecutive ids from its counter file,
+    or starts at `first_id` when a sharded run planned the ids itself.
+    """
+    nested = set_layout(images_dir, NESTED_LAYOUT)
+    if NESTED_LAYOUT and not nested:
+        print(f"{images_dir} already holds flat samples, keeping the flat layout.")
+    set_layout(labels_dir, nested)
+    set_image_ext(images_dir, OUTPUT_EXT)
+    if first_id is not None:
+        return first_id
+    return IdAllocator(images_dir).reserve(count)
+
+
+def compact_label_index(removed_samples=False):
+    if not UPDATE_LABEL_INDEX:
+        return
+    from label_index import compact_index, sync_index
 
-def main():
-    print("Loading board and piece assets...")
-    boards = [load_board(board) for board in os.listdir(BOARDS_DIR)]
-    piece_sets = [load_pieces(piece_set) for piece_set in os.listdir(PIECES_DIR)]
+    for split in ("train", "val"):
+        if removed_samples:
+            # also drops the records of deleted samples
+            print(f"Label index ({split}): {sync_index(split)['records']} records")
+        else:
+            print(f"Label index ({split}): {compact_index(split)} records")
 
-    train_boards, val_boards, train_piece_sets, val_piece_sets = (
-        randomize_and_split_data(boards, piece_sets, DATA_SPLIT)
-    )
 
-    print(f"Loaded {len(boards)} boards and {len(piece_sets)} piece sets.")
-    print(f"Train split: {len(train_boards)} boards, {len(train_piece_sets)} piece sets.")
-    print(f"Val split: {len(val_boards)} boards, {len(val_piece_sets)} piece sets.")
-
-    print("\nGenerating training dataset (clean + board augmentations)...")
-    generate_datasets(
-        DATASETS_IMAGES_DIR + "/train",
-        DATASETS_LABELS_DIR + "/train",
-        train_boards,
-        train_piece_sets,
-        VARIATIONS,
+def _write_shard_manifest(shard, plan, planned_ids, generated):
+    if shard is None:
+        return
+    from shards import SHARDS_DIR, plan_fingerprint, shard_dir, write_manifest
+
+    fingerprint = plan_fingerprint(dict(plan, shards=shard[1], ids=planned_ids))
+    splits = {split: {"ids": [1, planned_ids[split]], "ranges": generated[split]} for split in planned_ids}
+    write_manifest(shard_dir(SHARDS_DIR, *shard), shard, fingerprint, OUTPUT_EXT, splits)
+    print(f"Shard manifest written (plan {fingerprint}).")
+
+
+def _plan_writer(images_dir, boards, piece_sets, backgrounds=(), board_source=None, background_source=None):
+    """PlanWriter of a split's plans, in `plans/<split>` next to the split's images root."""
+    if not (WRITE_PLAN or PLAN_ONLY):
+        return None
+    from sample_plan import PlanWriter
+
+    images_dir = os.path.normpath(images_dir)
+    directory = os.path.join(os.path.dirname(os.path.dirname(images_dir)), "plans", os.path.basename(images_dir))
+    sources = {}
+    if board_source is not None:
+        sources["textures"] = board_source.texture_files
+    if background_source is not None:
+        sources.update(background_seed=background_source.seed, background_stream=background_source.stream)
+    return PlanWriter(directory, boards, piece_sets, backgrounds, **sources)
+
+
+def _generation_config() -> dict:
+    """Settings that shape every sample: an incremental run regenerates everything when they change."""
+    config = {
+        name: value
+        for name, value in globals().items()
+        if name.startswith(("PROB_", "DEDUPE_", "OUTPUT_", "PROCEDURAL_"))
+    }
+    config.update(
+        board_size=BOARD_SIZE,
+        piece_canvas_scale=PIECE_CANVAS_SCALE,
+        variations=VARIATIONS,
+        board_labels=MAKE_LABELS_FOR_CHESSBOARD,
     )
-    print("Training dataset generated.")
-
-    print("\nGenerating validation dataset...")
-    generate_datasets(
-        DATASETS_IMAGES_DIR + "/val",
-        DATASETS_LABELS_DIR + "/val",
-        val_boards,
-        val_piece_sets,
-        VARIATIONS,
+    return config
+
+
+def _generation_manifest(images_root, board_names, piece_set_names, background_names):
+    """Loads the incremental manifest, rehashes the assets and deletes the samples of changed or removed ones."""
+    from incremental import GenerationManifest
+
+    manifest = GenerationManifest(os.path.dirname(os.path.normpath(images_root)))
+    if manifest.is_new:
+        print("No generation manifest yet: generating the full dataset and tracking it from now on.")
+    assets = {
+        "boards": {name: [f"{BOARDS_DIR}/{name}"] for name in board_names},
+        "piece_sets": {
+            name: [f"{PIECES_DIR}/{name}", f"{PIECE_TILES_DIR}/{TILE_SIZE}/{name}"] for name in piece_set_names
+        },
+        "backgrounds": {name: [f"{BACKGROUND_NOISE_DIR}/{name}"] for name in background_names},
+    }
+    for kind, changes in manifest.refresh(_generation_config(), OUTPUT_EXT, assets).items():
+        print(f"Assets ({kind}): {changes['added']} new, {changes['changed']} changed, {changes['removed']} removed")
+    return manifest
+
+
+def _time_sample(job, directory):
+    """
+    Dry run: plans, renders and writes one random sample of a job into `directory`,
+    returns (seconds, image bytes, label bytes).
+    """
+    boards, piece_sets, board_source = job["boards"], job["piece_sets"], job["board_source"]
+    board_idx, pieces_idx = random.randrange(len(boards)), random.randrange(len(piece_sets))
+    background, load_seconds = None, 0.0
+    if job["stage"] == "scenes":
+        background_idx = random.choices(range(len(job["backgrounds"])), job["counts"])[0]
+        if job["backgrounds"][background_idx] is not None:
+            start = time.perf_counter()
+            background = load_background(job["backgrounds"][background_idx])
+            # a worker loads its background once per task
+            load_seconds = (time.perf_counter() - start) / VARIATIONS
+
+    start = time.perf_counter()
+    procedural = board_source is not None and random.random() < PROCEDURAL_BOARD_RATIO
+    plan = plan_image(piece_sets[pieces_idx], generate_fen(rng=random))
+    plan.update(seed=random.getrandbits(32), board=-1 if procedural else board_idx, piece_set=pieces_idx)
+    if job["stage"] == "scenes":
+        plan["composite"] = dict(plan_composite(), background=background_idx)
+    image = render_sample(
+        plan, boards[board_idx], piece_sets[pieces_idx], board_source, background, job["background_source"]
     )
-    print("Validation dataset generated.")
+    lines = plan_labels(plan)
+    if TENSOR_EXPORT:
+        from tensor_export import jpeg_roundtrip
 
-    if not GENERATE_IMAGES_WITH_BACKGROUND_NOISE:
-        print("Dataset generation completed!")
-        return
+        image_bytes, label_bytes = jpeg_roundtrip(image).nbytes, 20 * len(lines)
+    else:
+        image_path, label_path = os.path.join(directory, f"sample.{OUTPUT_EXT}"), os.path.join(directory, "sample.txt")
+        save_sample(image, image_path)
+        with open(label_path, "w") as f:
+            f.write("\n".join(lines))
+        image_bytes, label_bytes = os.path.getsize(image_path), os.path.getsize(label_path)
+    return time.perf_counter() - start + load_seconds, image_bytes, label_bytes
+
+
+def _start_telemetry(jobs, port=None):
+    """Shared counters the workers report to, with the periodic log line and the /metrics endpoint."""
+    global _TELEMETRY
+    port = TELEMETRY_PORT if port is None else port
+    if PLAN_ONLY or (not TELEMETRY_LOG_INTERVAL and port is None):
+        return None
+    from telemetry import Telemetry
+
+    _TELEMETRY = Telemetry()
+    for job in jobs:
+        _TELEMETRY.plan(job["split"], job["samples"])
+    _TELEMETRY.start(TELEMETRY_LOG_INTERVAL, port)
+    return _TELEMETRY
+
+
+def main(
+    shard=None,
+    seed=None,
+    plan_only=False,
+    incremental=False,
+    dry_run=False,
+    workers=None,
+    estimate_json=None,
+    metrics_port=None,
+    engine=None,
+):
+    global UPDATE_LABEL_INDEX, PLAN_ONLY, INCREMENTAL, WORKER_ENGINE, NUM_WORKERS, _NOISE_BANK_SEED
+    WORKER_ENGINE = engine or WORKER_ENGINE
+    NUM_WORKERS = workers or NUM_WORKERS
+    if WORKER_ENGINE == "thread" and (WORKER_MEMORY_BUDGET_MB is not None or WORKER_MAX_TASKS is not None):
+        print("Thread engine: WORKER_MEMORY_BUDGET_MB / WORKER_MAX_TASKS only apply to the process pool, ignored.")
+    images_root, labels_root = DATASETS_IMAGES_DIR, DATASETS_LABELS_DIR
+    PLAN_ONLY = PLAN_ONLY or plan_only
+    INCREMENTAL = INCREMENTAL or incremental
+    if seed is not None:
+        random.seed(seed)
+    # drawn outside `random`, whose seeded stream decides the asset split
+    if NOISE_BANK_SEED is not None:
+        _NOISE_BANK_SEED = NOISE_BANK_SEED & 0xFFFFFFFF  # plans store it as uint32
+    elif seed is not None:
+        _NOISE_BANK_SEED = int(np.random.SeedSequence([seed, 1]).generate_state(1)[0])
+    else:
+        _NOISE_BANK_SEED = int.from_bytes(os.urandom(4), "little")
+    if INCREMENTAL and (shard is not None or TENSOR_EXPORT or PLAN_ONLY):
+        raise SystemExit("Incremental runs track a rendered YOLO tree: no shards, tensor export or plan-only runs.")
+    if shard is not None:
+        if TENSOR_EXPORT:
+            raise SystemExit("Sharded runs write YOLO trees: merge them, then run tensor_export.py convert.")
+        from shards import SHARDS_DIR, shard_dir
+
+        if UPDATE_LABEL_INDEX:
+            print("Sharded run: the label index is built by `shards.py merge --label-index` instead.")
+            UPDATE_LABEL_INDEX = False
+        root = shard_dir(SHARDS_DIR, *shard)
+        images_root, labels_root = f"{root}/images", f"{root}/labels"
+        print(f"Shard {shard[0]}/{shard[1]} (seed {seed}), writing to {root}")
 
-    print("\nGenerating images with background noise and scene compositing...")
+    print("Loading board and piece assets...")
+    board_names = sorted(os.listdir(BOARDS_DIR))
+    piece_set_names = sorted(os.listdir(PIECES_DIR))
+    background_names = sorted(os.listdir(BACKGROUND_NOISE_DIR)) if os.path.isdir(BACKGROUND_NOISE_DIR) else []
+
+    # a sharded run lays each split's ids out from 1 in stage order, the same way on every node
+    planned_ids = {"train": 1, "val": 1}
+    generated = {"train": [], "val": []}
+    plan = {"seed": seed, "boards": board_names, "piece_sets": piece_set_names, "variations": VARIATIONS}
+
+    def first_id(split, count):
+        planned_ids[split] += count
+        return planned_ids[split] - count if shard is not None else None
+
+    manifest, removed_samples = None, 0
+    if INCREMENTAL:
+        manifest = _generation_manifest(images_root, board_names, piece_set_names, background_names)
+        if dry_run:
+            print(f"Would remove {sum(c for runs in manifest.stale.values() for _, c, *_ in runs)} samples.")
+        else:
+            removed_samples = manifest.remove_stale(images_root, labels_root)
+            print(f"Removed {removed_samples} samples of changed or removed assets.")
+        # asset splits stick across incremental runs
+        train_board_names, val_board_names = manifest.assign_splits("boards", board_names, DATA_SPLIT)
+        train_piece_set_names, val_piece_set_names = manifest.assign_splits("piece_sets", piece_set_names, DATA_SPLIT)
+    else:
+        # split the names, so that plans can refer to the assets by name
+        train_board_names, val_board_names, train_piece_set_names, val_piece_set_names = (
+            randomize_and_split_data(board_names, piece_set_names, DATA_SPLIT)
+        )
+    boards = {board: load_board(board) for board in board_names}
+    piece_sets = {piece_set: load_pieces(piece_set) for piece_set in piece_set_names}
+
+    print(f"Loaded {len(board_names)} boards and {len(piece_set_names)} piece sets.")
+    print(f"Train split: {len(train_board_names)} boards, {len(train_piece_set_names)} piece sets.")
+    print(f"Val split: {len(val_board_names)} boards, {len(val_piece_set_names)} piece sets.")
+
+    train_board_source, val_board_source = None, None
+    if PROCEDURAL_BOARD_RATIO > 0:
+        from procedural_boards import ProceduralBoardSource
+        from texture_cache import TextureCache
+
+        texture_cache = TextureCache(TEXTURE_CACHE_DIR)
+        textures = texture_cache.names() or sorted(os.listdir(TEXTURES_DIR))
+        random.shuffle(textures)
+        split_at = max(1, int(len(textures) * DATA_SPLIT))
+        train_board_source = ProceduralBoardSource(
+            TEXTURES_DIR, textures[:split_at], BOARD_SIZE, texture_cache=texture_cache, rng=random
+        )
+        val_board_source = ProceduralBoardSource(
+            TEXTURES_DIR, textures[split_at:] or textures, BOARD_SIZE, texture_cache=texture_cache, rng=random
+        )
+        print(
+            f"Procedural boards: {PROCEDURAL_BOARD_RATIO:.0%} of samples, {len(textures)} textures"
+            f" ({len(texture_cache)} from the mip pyramid cache)."
+        )
 
-    backgrounds = os.listdir(BACKGROUND_NOISE_DIR)
-    random.shuffle(backgrounds)
-    train_backgrounds, val_backgrounds = (
-        backgrounds[: int(len(backgrounds) * DATA_SPLIT)],
-        backgrounds[int(len(backgrounds) * DATA_SPLIT) :],
-    )
+    # the generate calls of the run, collected up front so the dry run and the telemetry see all of them
+    jobs = []
+
+    def board_stage(split, split_board_names, split_piece_set_names, board_source):
+        groups = [(split_board_names, split_piece_set_names)]
+        if manifest is not None:
+            groups = manifest.missing_board_samples(split, split_board_names, split_piece_set_names)
+            print(f"{split}: {sum(len(b) * len(p) for b, p in groups)} (board, piece set) pairs to render.")
+        for group_board_names, group_piece_set_names in groups:
+            # one task per piece set
+            tasks = group_piece_set_names[shard[0] :: shard[1]] if shard is not None else group_piece_set_names
+            task_samples = [len(group_board_names) * VARIATIONS] * len(tasks)
+            jobs.append({
+                "split": split,
+                "stage": "boards",
+                "samples": sum(task_samples),
+                "task_samples": task_samples,
+                "board_names": group_board_names,
+                "piece_set_names": group_piece_set_names,
+                "boards": [boards[board] for board in group_board_names],
+                "piece_sets": [piece_sets[piece_set] for piece_set in group_piece_set_names],
+                "board_source": board_source,
+                "background_source": None,
+                "first_id": first_id(split, len(group_piece_set_names) * len(group_board_names) * VARIATIONS),
+            })
+
+    def scene_stage(split, split_board_names, split_piece_set_names, backgrounds, board_source, background_source):
+        counts = [VARIATIONS] * len(backgrounds)
+        if manifest is not None:
+            backgrounds, counts = manifest.missing_scene_samples(split, backgrounds, VARIATIONS)
+            print(f"{split}: {sum(counts)} scenes to render.")
+        if not backgrounds:
+            return
+        task_samples = counts[shard[0] :: shard[1]] if shard is not None else counts
+        jobs.append({
+            "split": split,
+            "stage": "scenes",
+            "samples": sum(task_samples),
+            "task_samples": task_samples,
+            "board_names": split_board_names,
+            "piece_set_names": split_piece_set_names,
+            "boards": [boards[board] for board in split_board_names],
+            "piece_sets": [piece_sets[piece_set] for piece_set in split_piece_set_names],
+            "backgrounds": backgrounds,
+            "counts": counts,
+            "board_source": board_source,
+            "background_source": background_source,
+            "first_id": first_id(split, sum(counts)),
+        })
+
+    def run_job(job):
+        split = job["split"]
+        images_dir, labels_dir = f"{images_root}/{split}", f"{labels_root}/{split}"
+        if job["stage"] == "boards":
+            return generate_datasets(
+                images_dir,
+                labels_dir,
+                job["boards"],
+                job["piece_sets"],
+                VARIATIONS,
+                job["board_source"],
+                job["first_id"],
+                shard,
+                _plan_writer(images_dir, job["board_names"], job["piece_set_names"], (), job["board_source"]),
+                manifest and manifest.sample_log(split, job["board_names"], job["piece_set_names"]),
+            )
+        return run_generate_datasets_with_background_noise(
+            images_dir,
+            labels_dir,
+            job["boards"],
+            job["piece_sets"],
+            job["backgrounds"],
+            VARIATIONS,
+            job["board_source"],
+            job["background_source"],
+            job["first_id"],
+            shard,
+            _plan_writer(
+                images_dir,
+                job["board_names"],
+                job["piece_set_names"],
+                job["backgrounds"],
+                job["board_source"],
+                job["background_source"],
+            ),
+            manifest and manifest.sample_log(split, job["board_names"], job["piece_set_names"], job["backgrounds"]),
+            job["counts"],
+        )
 
-    run_generate_datasets_with_background_noise(
-        DATASETS_IMAGES_DIR + "/train",
-        DATASETS_LABELS_DIR + "/train",
-        train_boards,
-        train_piece_sets,
-        train_backgrounds,
-        VARIATIONS,
-    )
-    print("Training dataset with background noise generated.")
-
-    run_generate_datasets_with_background_noise(
-        DATASETS_IMAGES_DIR + "/val",
-        DATASETS_LABELS_DIR + "/val",
-        val_boards,
-        val_piece_sets,
-        val_backgrounds,
-        VARIATIONS,
-    )
-    print("Validation dataset with background noise generated.")
+    board_stage("train", train_board_names, train_piece_set_names, train_board_source)
+    board_stage("val", val_board_names, val_piece_set_names, val_board_source)
+
+    if GENERATE_IMAGES_WITH_BACKGROUND_NOISE:
+        backgrounds = background_names[:]
+        plan.update(backgrounds=backgrounds, procedural_backgrounds=PROCEDURAL_BACKGROUNDS)
+        if manifest is not None:
+            train_backgrounds, val_backgrounds = manifest.assign_splits("backgrounds", backgrounds, DATA_SPLIT)
+        else:
+            random.shuffle(backgrounds)
+            train_backgrounds, val_backgrounds = (
+                backgrounds[: int(len(backgrounds) * DATA_SPLIT)],
+                backgrounds[int(len(backgrounds) * DATA_SPLIT) :],
+            )
+
+        train_background_source, val_background_source = None, None
+        if PROCEDURAL_BACKGROUNDS > 0:
+            from procedural_backgrounds import ProceduralBackgroundSource
+
+            train_background_source = ProceduralBackgroundSource(BOARD_SIZE, PROCEDURAL_BACKGROUND_SEED, stream=0)
+            val_background_source = ProceduralBackgroundSource(BOARD_SIZE, PROCEDURAL_BACKGROUND_SEED, stream=1)
+            num_train = int(PROCEDURAL_BACKGROUNDS * DATA_SPLIT)
+            train_backgrounds += [None] * num_train
+            val_backgrounds += [None] * (PROCEDURAL_BACKGROUNDS - num_train)
+            print(
+                f"Procedural backgrounds: {PROCEDURAL_BACKGROUNDS} tasks on top of {len(backgrounds)} background files."
+            )
+
+        scene_stage(
+            "train", train_board_names, train_piece_set_names, train_backgrounds, train_board_source, train_background_source
+        )
+        scene_stage(
+            "val", val_board_names, val_piece_set_names, val_backgrounds, val_board_source, val_background_source
+        )
+
+    if NOISE_BANK and PROB_NOISE and not PLAN_ONLY:
+        noise_bank.bank(_NOISE_BANK_SEED)  # built before the pool forks, so the workers share its pages
+
+    if dry_run:
+        from dry_run import estimate_run, print_estimate, write_estimate
+
+        print("\nDry run: timing a stratified sample of the planned work...")
+        estimate = estimate_run(jobs, _time_sample, NUM_WORKERS or max(1, multiprocessing.cpu_count()))
+        print_estimate(estimate)
+        print(f"Estimate written to {write_estimate(estimate, estimate_json)}")
+        return
+
+    telemetry = _start_telemetry(jobs, metrics_port)
+    stage_names = {"boards": "clean + board augmentations", "scenes": "background noise and scene compositing"}
+    try:
+        for job in jobs:
+            print(f"\nGenerating {job['split']} samples ({stage_names[job['stage']]}): {job['samples']} samples...")
+            generated[job["split"]] += run_job(job)
+            print(f"{job['split']} samples ({stage_names[job['stage']]}) generated.")
+    finally:
+        if telemetry:
+            telemetry.stop()
 
     print("\nAll datasets generated successfully!")
+    compact_label_index(removed_samples > 0)
+    _write_shard_manifest(shard, plan, planned_ids, generated)
 
 
 if __name__ == "__main__":
-    main()
+    from shards import parse_shard
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shard", type=parse_shard, default=None, help="Generate only shard i of N (i/N)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the asset split, shared by all shards")
+    parser.add_argument("--plan-only", action="store_true", help="Only write sample plans (render with sample_plan.py)")
+    parser.add_argument(
+        "--incremental", action="store_true", help="Only generate samples of new or changed assets (incremental.py)"
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Estimate sample counts, time and disk use (dry_run.py)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes / threads (default: cpu count)")
+    parser.add_argument(
+        "--engine", choices=["process", "thread"], default=None, help="Worker engine (default: WORKER_ENGINE)"
+    )
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve live Prometheus metrics on this port")
+    parser.add_argument("--estimate-json", default=None, help="Where the dry run writes its estimate (default: datasets/run_estimate.json)")
+    args = parser.parse_args()
+    if args.shard is not None and args.seed is None:
+        parser.error("--shard needs --seed, so that every node derives the same asset split")
+    main(
+        args.shard,
+        args.seed,
+        args.plan_only,
+        args.incremental,
+        args.dry_run,
+        args.workers,
+        args.estimate_json,
+        args.metrics_port,
+        args.engine,
+    )
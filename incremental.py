@@ -0,0 +1,239 @@
+"""
+Incremental dataset builds: which assets every generated sample came from.
+
+`python generate_datasets.py --incremental` keeps `datasets/generation_manifest.json`:
+  - config   fingerprint of the generation settings the samples were made with
+  - assets   per kind (boards, piece_sets, backgrounds) and name, a content hash
+             of the asset's files, plus the sizes/mtimes it was computed from so
+             unchanged files are not read again
+  - splits   the split each asset was assigned to; assignments stick across
+             runs, new assets go where they keep the train share near DATA_SPLIT
+  - samples  per split, runs [first_id, count, stage, board, piece_set, background]
+             of consecutive ids made from the same assets (stage 0 = board
+             render, 1 = scene composite; a stage-0 board is the board slot the
+             sample fills, even when a procedural board was drawn there; a
+             stage-1 board / background of None is procedural)
+
+A rebuild rehashes the assets and deletes the samples of every asset that was
+removed or whose content changed (all samples, when the settings changed). It
+then generates only what is missing: VARIATIONS board renders for each
+(board, piece set) pair of a split, and VARIATIONS scenes per background, so
+new assets, changed assets, scenes that lost their board or piece set and
+chunks that failed in an earlier run are all filled in. New samples take fresh
+ids from the split's counter; removed ones leave gaps.
+"""
+
+import hashlib
+import json
+import os
+import random
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from dataset_layout import sample_path
+
+MANIFEST = "generation_manifest.json"
+
+BOARD_STAGE, SCENE_STAGE = 0, 1
+
+
+def config_fingerprint(config: dict) -> str:
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _files(paths: Iterable[str]) -> List[str]:
+    """The files under `paths` (files or directories, missing ones skipped), sorted."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, names in os.walk(path):
+                files.extend(os.path.join(directory, name) for name in names)
+        elif os.path.exists(path):
+            files.append(path)
+    return sorted(files)
+
+
+def _stat_signature(files: Sequence[str]) -> str:
+    stats = [(path, os.stat(path).st_size, os.stat(path).st_mtime_ns) for path in files]
+    return hashlib.sha1(json.dumps(stats).encode()).hexdigest()
+
+
+def content_hash(files: Sequence[str]) -> str:
+    """sha1 over the names and bytes of `files`."""
+    digest = hashlib.sha1()
+    for path in files:
+        digest.update(os.path.basename(path).encode())
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(2**20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+class GenerationManifest:
+    def __init__(self, root: str):
+        self.path = os.path.join(root, MANIFEST)
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.data = json.load(f)
+        else:
+            self.data = {"config": None, "ext": None, "assets": {}, "splits": {}, "samples": {}}
+        self.stale: Dict[str, List[list]] = {}
+
+    @property
+    def is_new(self) -> bool:
+        return self.data["config"] is None
+
+    def refresh(self, config: dict, ext: str, assets: Dict[str, Dict[str, List[str]]]) -> Dict[str, Dict[str, int]]:
+        """
+        Rehashes `assets` (kind -> name -> paths) and moves the sample runs that depend on
+        a removed or changed asset (all runs, when `config` changed) to `self.stale`.
+        Returns added / changed / removed counts per kind.
+        """
+        fingerprint = config_fingerprint(config)
+        config_changed = not self.is_new and self.data["config"] != fingerprint
+        summary, outdated = {}, {}
+        for kind, named_paths in assets.items():
+            old = self.data["assets"].get(kind, {})
+            current = {}
+            for name, paths in named_paths.items():
+                files = _files(paths)
+                stat = _stat_signature(files)
+                entry = old.get(name)
+                if entry is None or entry["stat"] != stat:
+                    entry = {"stat": stat, "hash": content_hash(files)}
+                current[name] = entry
+            removed = set(old) - set(current)
+            changed = {name for name in set(old) & set(current) if old[name]["hash"] != current[name]["hash"]}
+            outdated[kind] = removed | changed
+            summary[kind] = {"added": len(set(current) - set(old)), "changed": len(changed), "removed": len(removed)}
+            self.data["assets"][kind] = current
+            splits = self.data["splits"].get(kind, {})
+            self.data["splits"][kind] = {name: split for name, split in splits.items() if name in current}
+
+        def is_stale(run):
+            _, _, _, board, piece_set, background = run
+            return (
+                config_changed
+                or board in outdated.get("boards", ())
+                or piece_set in outdated.get("piece_sets", ())
+                or background in outdated.get("backgrounds", ())
+            )
+
+        for split, runs in self.data["samples"].items():
+            self.stale[split] = [run for run in runs if is_stale(run)]
+            self.data["samples"][split] = [run for run in runs if not is_stale(run)]
+        if config_changed:
+            print("Generation settings changed since the last run: all samples are regenerated.")
+        self.data["config"] = fingerprint
+        self.stale_ext, self.data["ext"] = self.data["ext"] or ext, ext
+        return summary
+
+    def remove_stale(self, images_root: str, labels_root: str) -> int:
+        """Deletes the image and label files of the stale runs and saves the manifest; returns the sample count."""
+        removed = 0
+        for split, runs in self.stale.items():
+            for first_id, count, *_ in runs:
+                for image_id in range(first_id, first_id + count):
+                    for path in (
+                        sample_path(f"{images_root}/{split}", image_id, self.stale_ext),
+                        sample_path(f"{labels_root}/{split}", image_id, "txt"),
+                    ):
+                        if os.path.exists(path):
+                            os.remove(path)
+                removed += count
+        self.stale = {}
+        self.save()
+        return removed
+
+    def assign_splits(self, kind: str, names: Sequence[str], share: float) -> Tuple[List[str], List[str]]:
+        """
+        (train, val) names. Assets keep the split they were assigned before; on the first run the
+        names are shuffled and cut like randomize_and_split_data, later new ones are dealt out
+        one by one to whichever split is below its share.
+        """
+        splits = self.data["splits"].setdefault(kind, {})
+        new = [name for name in names if name not in splits]
+        random.shuffle(new)
+        if not splits:
+            cut = int(len(new) * share)
+            splits.update({name: "train" if i < cut else "val" for i, name in enumerate(new)})
+        else:
+            counts = Counter(splits.values())
+            for name in new:
+                split = "train" if counts["train"] < share * (counts["train"] + counts["val"] + 1) else "val"
+                splits[name] = split
+                counts[split] += 1
+        return [n for n in names if splits[n] == "train"], [n for n in names if splits[n] == "val"]
+
+    def missing_board_samples(
+        self, split: str, boards: Sequence[str], piece_sets: Sequence[str]
+    ) -> List[Tuple[List[str], List[str]]]:
+        """
+        The (board, piece set) pairs of `split` without board renders, grouped into
+        (boards, piece sets) cross products (one generate_datasets call each).
+        """
+        present = {
+            (board, piece_set)
+            for _, _, stage, board, piece_set, _ in self.data["samples"].get(split, [])
+            if stage == BOARD_STAGE
+        }
+        groups: Dict[Tuple[str, ...], List[str]] = {}
+        for piece_set in piece_sets:
+            missing = tuple(board for board in boards if (board, piece_set) not in present)
+            if missing:
+                groups.setdefault(missing, []).append(piece_set)
+        return [(list(missing), group) for missing, group in groups.items()]
+
+    def missing_scene_samples(
+        self, split: str, backgrounds: Sequence[Optional[str]], variations: int
+    ) -> Tuple[List[Optional[str]], List[int]]:
+        """
+        (backgrounds, counts) of the scenes `split` is short of: every entry of `backgrounds`
+        (None = a procedural background task) stands for `variations` scenes.
+        """
+        present = Counter()
+        for _, count, stage, _, _, background in self.data["samples"].get(split, []):
+            if stage == SCENE_STAGE:
+                present[background] += count
+        tasks, counts = [], []
+        for background, expected in Counter(backgrounds).items():
+            missing = expected * variations - present[background]
+            while missing > 0:
+                tasks.append(background)
+                counts.append(min(missing, variations))
+                missing -= counts[-1]
+        return tasks, counts
+
+    def sample_log(self, split: str, boards: Sequence[str], piece_sets: Sequence[str], backgrounds=()) -> "SampleLog":
+        return SampleLog(self, split, boards, piece_sets, backgrounds)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(f"{self.path}.tmp", "w") as f:
+            json.dump(self.data, f)
+        os.replace(f"{self.path}.tmp", self.path)
+
+
+class SampleLog:
+    """
+    Records the samples of one generate call in the manifest. Like sample_plan.PlanWriter, it
+    takes the asset names in the order the call's boards / piece sets / backgrounds were passed,
+    and the workers' codes index into them.
+    """
+
+    def __init__(self, manifest: GenerationManifest, split: str, boards, piece_sets, backgrounds=()):
+        self.manifest = manifest
+        self.runs = manifest.data["samples"].setdefault(split, [])
+        self.boards, self.piece_sets, self.backgrounds = list(boards), list(piece_sets), list(backgrounds)
+
+    def add_board_renders(self, first_id: int, piece_set: int, variations: int):
+        """One generate_images_worker task: `variations` renders per board of the call, board by board."""
+        for slot, board in enumerate(self.boards):
+            self.runs.append([first_id + slot * variations, variations, BOARD_STAGE, board, self.piece_sets[piece_set], None])
+
+    def add_scene(self, image_id: int, board: int, piece_set: int, background: int):
+        board_name = None if board < 0 else self.boards[board]
+        self.runs.append([image_id, 1, SCENE_STAGE, board_name, self.piece_sets[piece_set], self.backgrounds[background]])
+
+    def save(self):
+        self.manifest.save()
@@ -0,0 +1,288 @@
+"""
+Columnar index of the YOLO labels of a dataset tree, plus a stats command.
+
+Every box is stored as one packed fixed-size record (image id, class id,
+xc, yc, w, h) in `datasets/label_index/<split>.bin`, so a split with millions
+of label files is a single array that loads with one read. Label files
+without boxes get one record with class EMPTY_CLASS so the image still counts.
+
+The index is kept in sync in three ways:
+  - `generate_datasets.py` (with UPDATE_LABEL_INDEX) appends records from each
+    worker to `<split>.<thread id>.part` files while it writes samples, and
+    compacts them into `<split>.bin` when the run finishes;
+  - `sync` indexes label files that are new or changed since the last sync and
+    drops ids whose label file is gone;
+  - `build` re-indexes a split from scratch.
+`compact` folds left-over .part files into `<split>.bin`.
+
+Usage:
+    python label_index.py build
+    python label_index.py sync --split train
+    python label_index.py stats
+    python label_index.py stats --json stats.json
+"""
+
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from dataset_layout import iter_sample_entries, sample_path
+
+DATASETS_LABELS_DIR = "datasets/labels"
+LABEL_INDEX_DIR = "datasets/label_index"
+SPLITS = ["train", "val"]
+
+EMPTY_CLASS = 255
+IMAGE_SIZE = 640
+FILES_PER_CHUNK = 5000
+
+INDEX_DTYPE = np.dtype([
+    ("image_id", "<u4"),
+    ("class_id", "u1"),
+    ("xc", "<f4"),
+    ("yc", "<f4"),
+    ("w", "<f4"),
+    ("h", "<f4"),
+])
+
+CLASS_NAMES = [
+    "bP", "bR", "bN", "bB", "bQ", "bK",
+    "wP", "wR", "wN", "wB", "wQ", "wK",
+    "board",
+]
+
+
+def index_path(split: str) -> str:
+    return os.path.join(LABEL_INDEX_DIR, f"{split}.bin")
+
+
+def records_from_lines(image_id: int, lines: Iterable[str]) -> np.ndarray:
+    """Converts the YOLO label lines of one image to index records."""
+    rows = []
+    for line in lines:
+        tokens = line.split()
+        if len(tokens) != 5:
+            continue
+        try:
+            rows.append((image_id, int(tokens[0]), *map(float, tokens[1:])))
+        except ValueError:
+            continue
+    if not rows:
+        rows.append((image_id, EMPTY_CLASS, 0.0, 0.0, 0.0, 0.0))
+    return np.array(rows, dtype=INDEX_DTYPE)
+
+
+class LabelIndexAppender:
+    """
+    Buffers records in a generator worker and appends them to this process's
+    part file, so concurrent workers never write to the same file.
+    """
+
+    def __init__(self, split: str, flush_every: int = 4096):
+        os.makedirs(LABEL_INDEX_DIR, exist_ok=True)
+        # one part file per worker thread (the process id for a process worker's main thread)
+        self.path = os.path.join(LABEL_INDEX_DIR, f"{split}.{threading.get_native_id()}.part")
+        self.flush_every = flush_every
+        self._pending: List[np.ndarray] = []
+        self._pending_rows = 0
+
+    def add(self, image_id: int, lines: Iterable[str]):
+        records = records_from_lines(image_id, lines)
+        self._pending.append(records)
+        self._pending_rows += len(records)
+        if self._pending_rows >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        with open(self.path, "ab") as f:
+            np.concatenate(self._pending).tofile(f)
+        self._pending = []
+        self._pending_rows = 0
+
+
+def load_index(split: str) -> np.ndarray:
+    """Loads a split's index including any not yet compacted part files."""
+    arrays = []
+    paths = [index_path(split)] + sorted(glob.glob(os.path.join(LABEL_INDEX_DIR, f"{split}.*.part")))
+    for path in paths:
+        if os.path.exists(path) and os.path.getsize(path):
+            arrays.append(np.fromfile(path, dtype=INDEX_DTYPE))
+    if not arrays:
+        return np.zeros(0, dtype=INDEX_DTYPE)
+    return np.concatenate(arrays)
+
+
+def _write_index(split: str, records: np.ndarray):
+    os.makedirs(LABEL_INDEX_DIR, exist_ok=True)
+    path = index_path(split)
+    records.tofile(f"{path}.tmp")
+    os.replace(f"{path}.tmp", path)
+    for part in glob.glob(os.path.join(LABEL_INDEX_DIR, f"{split}.*.part")):
+        os.remove(part)
+
+
+def _index_chunk(args) -> np.ndarray:
+    split, ids = args
+    arrays = []
+    for image_id in ids:
+        try:
+            with open(sample_path(f"{DATASETS_LABELS_DIR}/{split}", image_id, "txt")) as f:
+                arrays.append(records_from_lines(image_id, f))
+        except OSError:
+            continue
+    return np.concatenate(arrays) if arrays else np.zeros(0, dtype=INDEX_DTYPE)
+
+
+def _scan_label_ids(split: str, newer_than: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns (all label ids, ids of label files modified after `newer_than`)."""
+    ids, changed = [], []
+    for image_id, entry in iter_sample_entries(f"{DATASETS_LABELS_DIR}/{split}", "txt"):
+        ids.append(image_id)
+        if newer_than is not None and entry.stat().st_mtime > newer_than:
+            changed.append(image_id)
+    return np.array(ids, dtype=np.uint32), np.array(changed, dtype=np.uint32)
+
+
+def _index_ids(split: str, ids: np.ndarray, workers: Optional[int]) -> np.ndarray:
+    if not len(ids):
+        return np.zeros(0, dtype=INDEX_DTYPE)
+    chunks = [(split, ids[i:i + FILES_PER_CHUNK].tolist()) for i in range(0, len(ids), FILES_PER_CHUNK)]
+    num_workers = workers or max(1, multiprocessing.cpu_count())
+    with multiprocessing.Pool(num_workers) as pool:
+        return np.concatenate(pool.map(_index_chunk, chunks))
+
+
+def build_index(split: str, workers: Optional[int] = None) -> int:
+    """Re-indexes every label file of a split from scratch."""
+    ids, _ = _scan_label_ids(split)
+    records = _index_ids(split, np.sort(ids), workers)
+    _write_index(split, records)
+    return len(records)
+
+
+def sync_index(split: str, workers: Optional[int] = None) -> Dict[str, int]:
+    """Indexes new or changed label files and drops removed ones; compacts part files."""
+    path = index_path(split)
+    last_sync = os.path.getmtime(path) if os.path.exists(path) else None
+    records = load_index(split)
+    on_disk, changed = _scan_label_ids(split, newer_than=last_sync)
+
+    indexed_ids = np.unique(records["image_id"])
+    missing = np.setdiff1d(on_disk, indexed_ids)
+    removed = np.setdiff1d(indexed_ids, on_disk)
+    to_index = np.union1d(missing, changed)
+
+    drop = np.isin(records["image_id"], np.union1d(removed, to_index))
+    kept = records[~drop]
+    added = _index_ids(split, to_index, workers)
+    merged = np.concatenate([kept, added])
+    merged = merged[np.argsort(merged["image_id"], kind="stable")]
+    _write_index(split, merged)
+    return {"indexed": len(to_index), "removed": len(removed), "records": len(merged)}
+
+
+def compact_index(split: str) -> int:
+    records = load_index(split)
+    records = records[np.argsort(records["image_id"], kind="stable")]
+    _write_index(split, records)
+    return len(records)
+
+
+def _distribution(values: np.ndarray) -> dict:
+    if not len(values):
+        return {}
+    pcts = np.percentile(values, [1, 5, 25, 50, 75, 95, 99])
+    return {
+        "mean": float(values.mean()),
+        "min": float(values.min()),
+        "max": float(values.max()),
+        "percentiles": dict(zip(["p1", "p5", "p25", "p50", "p75", "p95", "p99"], map(float, pcts))),
+    }
+
+
+def split_stats(records: np.ndarray) -> dict:
+    """Computes class histogram, bbox size/aspect and boxes-per-image for one split."""
+    boxes = records[records["class_id"] != EMPTY_CLASS]
+    _, per_image = np.unique(records["image_id"], return_counts=True)
+    empties = np.unique(records["image_id"][records["class_id"] == EMPTY_CLASS])
+    class_counts = np.bincount(boxes["class_id"], minlength=len(CLASS_NAMES))
+
+    pieces = boxes[boxes["class_id"] != CLASS_NAMES.index("board")]
+    boards = boxes[boxes["class_id"] == CLASS_NAMES.index("board")]
+    piece_counts = np.bincount(
+        np.searchsorted(np.unique(records["image_id"]), pieces["image_id"]),
+        minlength=len(per_image),
+    )
+    aspect = pieces["w"] / np.maximum(pieces["h"], 1e-6)
+
+    return {
+        "images": int(len(per_image)),
+        "images_without_boxes": int(len(empties)),
+        "boxes": int(len(boxes)),
+        "class_histogram": {
+            (CLASS_NAMES[c] if c < len(CLASS_NAMES) else str(c)): int(n) for c, n in enumerate(class_counts) if n
+        },
+        "pieces_per_image": _distribution(piece_counts),
+        "piece_width_px": _distribution(pieces["w"] * IMAGE_SIZE),
+        "piece_height_px": _distribution(pieces["h"] * IMAGE_SIZE),
+        "piece_aspect": _distribution(aspect),
+        "board_width_px": _distribution(boards["w"] * IMAGE_SIZE),
+    }
+
+
+def print_stats(split: str, stats: dict):
+    print(f"[{split}] {stats['images']} images, {stats['boxes']} boxes ({stats['images_without_boxes']} without boxes)")
+    total = max(1, stats["boxes"])
+    for name, count in stats["class_histogram"].items():
+        print(f"  {name:>5}: {count:>10}  {count / total:6.1%}")
+    for key in ("pieces_per_image", "piece_width_px", "piece_height_px", "piece_aspect", "board_width_px"):
+        dist = stats[key]
+        if not dist:
+            continue
+        p = dist["percentiles"]
+        print(
+            f"  {key:<16} mean {dist['mean']:8.2f}  p5 {p['p5']:8.2f}  p50 {p['p50']:8.2f}  "
+            f"p95 {p['p95']:8.2f}  max {dist['max']:8.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["build", "sync", "compact", "stats"])
+    parser.add_argument("--split", choices=SPLITS, default=None, help="Only this split (default: all)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes for build/sync (default: cpu count)")
+    parser.add_argument("--json", default=None, help="With stats: also write the stats as JSON to this path")
+    args = parser.parse_args()
+
+    splits = [args.split] if args.split else SPLITS
+    if args.command == "build":
+        for split in splits:
+            print(f"{split}: indexed {build_index(split, args.workers)} records")
+    elif args.command == "sync":
+        for split in splits:
+            result = sync_index(split, args.workers)
+            print(f"{split}: {result['indexed']} files indexed, {result['removed']} removed, {result['records']} records")
+    elif args.command == "compact":
+        for split in splits:
+            print(f"{split}: {compact_index(split)} records")
+    else:
+        all_stats = {}
+        for split in splits:
+            all_stats[split] = split_stats(load_index(split))
+            print_stats(split, all_stats[split])
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(all_stats, f, indent=1)
+            print(f"Stats written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+Perceptual-hash index for finding near-duplicate generated samples.
+
+Each image gets a 64-bit difference hash (dHash). Clusters of images whose
+hashes are within `--max-distance` bits of each other are found with
+multi-index hashing: the hash is cut into max_distance + 1 bands, so any two
+hashes within that distance share at least one identical band, and only
+images sharing a band are compared. A bucket of more than MAX_BUCKET hashes
+sharing a band is cut again the same way over its remaining bits, so the
+pairwise comparisons stay bounded however the hashes are distributed.
+
+The index keeps the size and mtime of every hashed file next to it
+(`<split>.stat.bin`); `build` rehashes images whose file changed since, e.g.
+after an incremental rebuild, a shard merge or a plan re-render.
+
+`SampleDeduper` is the generation-time counterpart used by
+`generate_datasets.py` (DEDUPE_SAMPLES) to resample a FEN when a worker
+draws a (board, piece set, FEN) tuple it has already made. It does not hash
+renders: a 9x8 dHash of a whole sample mostly sees the board pattern, so
+different FENs on the same board look alike; near-identical images are
+found here, on the finished split.
+
+Usage:
+    python near_duplicates.py build
+    python near_duplicates.py clusters --split train --max-distance 4 --json dupes.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+from typing import Dict, Hashable, List, Optional
+
+import numpy as np
+from PIL import Image
+
+from dataset_layout import IMAGE_EXTS, image_path, iter_sample_entries
+
+DATASETS_IMAGES_DIR = "datasets/images"
+HASH_INDEX_DIR = "datasets/phash_index"
+SPLITS = ["train", "val"]
+
+HASH_SIZE = 8
+DEFAULT_MAX_DISTANCE = 4
+IMAGES_PER_CHUNK = 2000
+MAX_BUCKET = 256  # hashes compared pairwise; larger buckets are split further
+
+HASH_DTYPE = np.dtype([("image_id", "<u4"), ("hash", "<u8")])
+STAT_DTYPE = np.dtype([("size", "<u8"), ("mtime_ns", "<i8")])  # row i: the file index row i was hashed from
+
+
+def dhash(image: Image.Image, hash_size: int = HASH_SIZE) -> int:
+    """64-bit difference hash: sign of horizontal gradients of a 9x8 grayscale thumbnail."""
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def popcount64(values: np.ndarray) -> np.ndarray:
+    values = np.ascontiguousarray(values, dtype=np.uint64)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    return np.unpackbits(values.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+class SampleDeduper:
+    """Worker-local memory of the sample keys produced so far."""
+
+    def __init__(self):
+        self._keys = set()
+        self.rejected = 0
+
+    def accept_key(self, key: Hashable) -> bool:
+        if key in self._keys:
+            self.rejected += 1
+            return False
+        self._keys.add(key)
+        return True
+
+
+def index_path(split: str) -> str:
+    return os.path.join(HASH_INDEX_DIR, f"{split}.bin")
+
+
+def stat_path(split: str) -> str:
+    return os.path.join(HASH_INDEX_DIR, f"{split}.stat.bin")
+
+
+def load_hash_index(split: str) -> np.ndarray:
+    path = index_path(split)
+    if not os.path.exists(path):
+        return np.zeros(0, dtype=HASH_DTYPE)
+    return np.fromfile(path, dtype=HASH_DTYPE)
+
+
+def _load_stats(split: str, rows: int) -> np.ndarray:
+    """File stats of the index rows; zeros (never matching a file) for an index written without them."""
+    path = stat_path(split)
+    stats = np.fromfile(path, dtype=STAT_DTYPE) if os.path.exists(path) else np.zeros(0, dtype=STAT_DTYPE)
+    return stats if len(stats) == rows else np.zeros(rows, dtype=STAT_DTYPE)
+
+
+def _hash_chunk(args) -> np.ndarray:
+    split, ids = args
+    rows = []
+    for image_id in ids:
+        try:
+            with Image.open(image_path(f"{DATASETS_IMAGES_DIR}/{split}", image_id)) as img:
+                img.draft("RGB", (64, 64))  # decode at reduced size, the hash only needs 9x8
+                rows.append((image_id, dhash(img)))
+        except OSError:
+            continue
+    return np.array(rows, dtype=HASH_DTYPE)
+
+
+def build_hash_index(split: str, workers: Optional[int] = None, rebuild: bool = False) -> Dict[str, int]:
+    """Hashes images not yet in the split's index or changed since they were hashed (all of them with rebuild=True)."""
+    existing = np.zeros(0, dtype=HASH_DTYPE) if rebuild else load_hash_index(split)
+    existing_stats = _load_stats(split, len(existing))
+    files = {}
+    for image_id, entry in iter_sample_entries(f"{DATASETS_IMAGES_DIR}/{split}", IMAGE_EXTS):
+        stat = entry.stat()
+        files[image_id] = (stat.st_size, stat.st_mtime_ns)
+    on_disk = np.array(sorted(files), dtype=np.uint32)
+    disk_stats = np.array([files[image_id] for image_id in on_disk.tolist()], dtype=STAT_DTYPE)
+
+    # keep the rows whose file is still there, unchanged
+    position = np.searchsorted(on_disk, existing["image_id"]).clip(0, max(0, len(on_disk) - 1))
+    keep = np.isin(existing["image_id"], on_disk)
+    keep[keep] = disk_stats[position[keep]] == existing_stats[keep]
+    changed = int(np.isin(existing["image_id"], on_disk).sum() - keep.sum())
+    existing = existing[keep]
+    todo = np.setdiff1d(on_disk, existing["image_id"])
+    chunks = [(split, todo[i:i + IMAGES_PER_CHUNK].tolist()) for i in range(0, len(todo), IMAGES_PER_CHUNK)]
+
+    added = [np.zeros(0, dtype=HASH_DTYPE)]
+    if chunks:
+        num_workers = workers or max(1, multiprocessing.cpu_count())
+        with multiprocessing.Pool(num_workers) as pool:
+            added += pool.map(_hash_chunk, chunks)
+
+    merged = np.concatenate([existing] + added)
+    merged = merged[np.argsort(merged["image_id"], kind="stable")]
+    stats = disk_stats[np.searchsorted(on_disk, merged["image_id"])] if len(merged) else np.zeros(0, dtype=STAT_DTYPE)
+    os.makedirs(HASH_INDEX_DIR, exist_ok=True)
+    stats.tofile(f"{stat_path(split)}.tmp")
+    merged.tofile(f"{index_path(split)}.tmp")
+    os.replace(f"{index_path(split)}.tmp", index_path(split))
+    os.replace(f"{stat_path(split)}.tmp", stat_path(split))
+    return {"hashed": int(sum(len(a) for a in added)), "changed": changed, "total": len(merged)}
+
+
+def _find_root(parent: np.ndarray, i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def find_clusters(
+    index: np.ndarray, max_distance: int = DEFAULT_MAX_DISTANCE, max_bucket: int = MAX_BUCKET
+) -> List[List[int]]:
+    """Groups image ids whose hashes are within max_distance bits, largest clusters first."""
+    n = len(index)
+    if n < 2:
+        return []
+    # identical hashes are one node; only distinct hashes are compared
+    hashes, inverse = np.unique(index["hash"].astype(np.uint64), return_inverse=True)
+    parent = np.arange(len(hashes))
+
+    def union(i: int, j: int):
+        a, b = _find_root(parent, i), _find_root(parent, j)
+        if a != b:
+            parent[b] = a
+
+    # (hash indices, bit positions they may still differ in): members of a bucket agree on every
+    # other bit, so two of them within max_distance share one of max_distance + 1 groups of the
+    # free bits exactly and meet again in that group's sub-bucket
+    stack = [(np.arange(len(hashes)), np.arange(64))] if max_distance >= 0 else []
+    while stack:
+        members, free = stack.pop()
+        if len(members) < 2:
+            continue
+        if len(members) >= 8 and len({_find_root(parent, member) for member in members}) == 1:
+            continue  # already one cluster
+        if len(members) <= max_bucket:
+            member_hashes = hashes[members]
+            for k in range(len(members) - 1):
+                distances = popcount64(member_hashes[k + 1:] ^ member_hashes[k])
+                for j in np.flatnonzero(distances <= max_distance):
+                    union(members[k], members[k + 1 + j])
+            continue
+        # bits every member agrees on cannot separate them
+        varying = np.bitwise_or.reduce(hashes[members] ^ hashes[members[0]])
+        free = free[((varying >> free.astype(np.uint64)) & np.uint64(1)).astype(bool)]
+        if len(free) <= max_distance:
+            for member in members[1:]:
+                union(members[0], member)
+            continue
+        for group in np.array_split(free, max_distance + 1):
+            mask = np.uint64(sum(1 << int(bit) for bit in group))
+            keys = hashes[members] & mask
+            order = np.argsort(keys, kind="stable")
+            sorted_keys = keys[order]
+            # boundaries of runs of equal group values
+            starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+            ends = np.r_[starts[1:], len(members)]
+            rest = np.setdiff1d(free, group)
+            for start, end in zip(starts, ends):
+                if end - start > 1:
+                    stack.append((members[order[start:end]], rest))
+
+    clusters: Dict[int, List[int]] = {}
+    for i in range(n):
+        clusters.setdefault(_find_root(parent, inverse[i]), []).append(int(index["image_id"][i]))
+    return sorted((ids for ids in clusters.values() if len(ids) > 1), key=len, reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["build", "clusters"])
+    parser.add_argument("--split", choices=SPLITS, default=None, help="Only this split (default: all)")
+    parser.add_argument("--max-distance", type=int, default=DEFAULT_MAX_DISTANCE, help="Max differing hash bits to count as a near-duplicate")
+    parser.add_argument("--rebuild", action="store_true", help="With build: re-hash every image instead of only new or changed ones")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes for build (default: cpu count)")
+    parser.add_argument("--json", default=None, help="With clusters: write the clusters as JSON to this path")
+    args = parser.parse_args()
+
+    splits = [args.split] if args.split else SPLITS
+    if args.command == "build":
+        for split in splits:
+            result = build_hash_index(split, args.workers, args.rebuild)
+            print(
+                f"{split}: hashed {result['hashed']} new or changed images "
+                f"({result['changed']} changed since the last build), {result['total']} in index"
+            )
+        return
+
+    report = {}
+    for split in splits:
+        index = load_hash_index(split)
+        clusters = find_clusters(index, args.max_distance)
+        redundant = sum(len(c) - 1 for c in clusters)
+        print(
+            f"{split}: {len(index)} images, {len(clusters)} near-duplicate clusters, "
+            f"{redundant} redundant samples ({redundant / max(1, len(index)):.1%})"
+        )
+        for cluster in clusters[:10]:
+            print(f"  {len(cluster)}: {' '.join(map(str, cluster[:12]))}{' ...' if len(cluster) > 12 else ''}")
+        report[split] = {"images": len(index), "redundant": redundant, "clusters": clusters}
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f)
+        print(f"Clusters written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Precomputed noise tiles for apply_noise's Gaussian and salt-and-pepper grain.
+
+Drawing a fresh full-frame float64 normal field per noisy sample costs more
+than the rest of the noise stage. Instead, a bank of BANK_TILES square tiles
+of TILE_SIZE pixels is drawn once per process and bank seed (in the parent
+before the pool forks, so worker processes share their pages):
+  - Gaussian tiles: unit normal samples as int16 in units of 1/GAUSSIAN_SCALE
+    (3 channels); a sample's field is a window of one tile times its std;
+  - uniform tiles: uint16 samples of [0, 1) in units of 1/UNIFORM_LEVELS
+    (1 channel); a pixel is pepper / salt where its value is below amount / 2
+    / at least 1 - amount / 2.
+Every sample picks a tile, a random window offset and random horizontal /
+vertical flips from the RandomState-like `rng` it passes in (default
+`np.random`). Frames larger than a tile wrap
+around it.
+
+generate_datasets.py draws a new bank seed for every run (derived from --seed
+when one is given) and records it in each sample's plan, so a plan re-renders
+with the bank it was made with. Calls without a seed use DEFAULT_SEED.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+
+TILE_SIZE = 1024
+BANK_TILES = 4
+DEFAULT_SEED = 0
+MAX_BANKS = 4  # banks kept per process (a plan re-render may span several runs)
+GAUSSIAN_SCALE = 4096  # int16 units per std: covers +-8 std
+UNIFORM_LEVELS = 2**16
+
+_BANKS: "OrderedDict[int, Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+_BANK_LOCK = threading.Lock()
+
+
+def bank(seed: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """(Gaussian tiles (N, T, T, 3) int16, uniform tiles (N, T, T) uint16) of a seed, built on first use."""
+    seed = DEFAULT_SEED if seed is None else int(seed)
+    with _BANK_LOCK:
+        tiles = _BANKS.get(seed)
+        if tiles is None:
+            rng = np.random.default_rng(seed)
+            shape = (BANK_TILES, TILE_SIZE, TILE_SIZE)
+            normal = rng.standard_normal((*shape, 3), dtype=np.float32) * GAUSSIAN_SCALE
+            gaussian = np.clip(np.rint(normal), -32768, 32767).astype(np.int16)
+            uniform = rng.integers(0, UNIFORM_LEVELS, size=shape, dtype=np.uint16)
+            tiles = _BANKS[seed] = gaussian, uniform
+            while len(_BANKS) > MAX_BANKS:
+                _BANKS.popitem(last=False)
+        _BANKS.move_to_end(seed)
+    return tiles
+
+
+def _window(tiles: np.ndarray, h: int, w: int, rng) -> np.ndarray:
+    """A randomly placed and flipped (h, w) window of a random tile, wrapping when the frame is larger."""
+    tile = tiles[rng.randint(len(tiles))]
+    size = tile.shape[0]
+    y = rng.randint(max(1, size - h + 1))
+    x = rng.randint(max(1, size - w + 1))
+    if h <= size and w <= size:
+        window = tile[y : y + h, x : x + w]
+    else:
+        window = tile[(y + np.arange(h)) % size][:, (x + np.arange(w)) % size]
+    flips = rng.randint(4)
+    if flips & 1:
+        window = window[:, ::-1]
+    if flips & 2:
+        window = window[::-1]
+    return window
+
+
+def gaussian(h: int, w: int, c: int, std: float, seed: Optional[int] = None, rng=np.random) -> np.ndarray:
+    """A (h, w, c) float32 field of zero-mean Gaussian noise with standard deviation `std`, from bank `seed`."""
+    window = _window(bank(seed)[0], h, w, rng)
+    if c != window.shape[-1]:
+        window = window[..., np.arange(c) % window.shape[-1]]
+    return window * np.float32(std / GAUSSIAN_SCALE)
+
+
+def salt_and_pepper(
+    h: int, w: int, amount: float, seed: Optional[int] = None, rng=np.random
+) -> Tuple[np.ndarray, np.ndarray]:
+    """(pepper, salt) (h, w) masks, each set with probability amount / 2, from bank `seed`."""
+    window = _window(bank(seed)[1], h, w, rng)
+    threshold = int(round(amount / 2 * UNIFORM_LEVELS))
+    return window < threshold, window >= UNIFORM_LEVELS - threshold
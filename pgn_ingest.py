@@ -0,0 +1,212 @@
+"""
+Streams large local PGN dumps (.pgn or .pgn.zst) and replays the move text of
+every game to extract the board placement at every ply (or every Nth ply).
+
+The file is read in chunks and split into raw game texts in the main process;
+batches of games are then replayed across a process pool, so memory stays
+bounded no matter how large the dump is.
+
+Usage:
+    python pgn_ingest.py lichess_db_2024-01.pgn.zst
+    python pgn_ingest.py games.pgn --every 2 --min-ply 8 --workers 8
+    python pgn_ingest.py games.pgn --out assets/pgn_fens.txt
+
+Replayed FENs are deduplicated through the bounded-memory FenStore and the
+merged database is exported to --out.
+"""
+
+import argparse
+import collections
+import io
+import multiprocessing
+import re
+from typing import IO, Iterable, Iterator, List, Optional
+
+import chess
+
+from fen_store import FEN_STORE_DIR, open_fen_store, print_batch_stats
+from fetch_chess_com_fens import CHESS_COM_FENS_FILE
+
+READ_CHUNK_SIZE = 1 << 20  # characters per read from the (decompressed) stream
+GAMES_PER_BATCH = 256
+
+SUPPORTED_VARIANTS = {"", "standard", "chess960", "from position"}
+
+_HEADER_RE = re.compile(r'^\[(\w+)\s+"(.*)"\]\s*$')
+_COMMENT_RE = re.compile(r"\{[^}]*\}|;[^\n]*")
+_VARIATION_RE = re.compile(r"\([^()]*\)")
+_NOISE_RE = re.compile(r"\$\d+|\d+\.(\.\.)?|1-0|0-1|1/2-1/2|\*")
+
+
+def open_pgn_stream(path: str) -> IO[str]:
+    """Opens a .pgn or .pgn.zst file as a text stream without decompressing it up front."""
+    if path.endswith(".zst"):
+        import zstandard
+
+        raw = open(path, "rb")
+        reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+        return io.TextIOWrapper(reader, encoding="utf-8", errors="replace")
+    return open(path, "r", encoding="utf-8", errors="replace")
+
+
+def iter_pgn_games(stream: IO[str], chunk_size: int = READ_CHUNK_SIZE) -> Iterator[str]:
+    """Splits a PGN text stream into raw game texts (headers + move text), chunk by chunk."""
+    game_lines: List[str] = []
+    seen_moves = False
+    tail = ""
+
+    while True:
+        chunk = stream.read(chunk_size)
+        lines = (tail + chunk).split("\n")
+        tail = lines.pop() if chunk else ""
+        for line in lines:
+            stripped = line.strip()
+            if stripped.startswith("[") and seen_moves:
+                # a header after move text starts the next game
+                yield "\n".join(game_lines)
+                game_lines = []
+                seen_moves = False
+            elif stripped and not stripped.startswith("["):
+                seen_moves = True
+            game_lines.append(line)
+        if not chunk:
+            break
+
+    if seen_moves:
+        yield "\n".join(game_lines)
+
+
+def _clean_movetext(movetext: str) -> List[str]:
+    movetext = _COMMENT_RE.sub(" ", movetext)
+    # strip nested variations from the innermost outwards
+    while "(" in movetext:
+        stripped = _VARIATION_RE.sub(" ", movetext)
+        if stripped == movetext:
+            break
+        movetext = stripped
+    movetext = _NOISE_RE.sub(" ", movetext)
+    return [tok.rstrip("!?") for tok in movetext.split() if tok.rstrip("!?")]
+
+
+def replay_game_fens(game_text: str, every_n_plies: int = 1, min_ply: int = 0) -> List[str]:
+    """
+    Replays one game's move text and returns the board placement FEN at every
+    `every_n_plies`-th ply from `min_ply` on. Stops at the first illegal move.
+    """
+    headers = {}
+    movetext_lines = []
+    for line in game_text.split("\n"):
+        match = _HEADER_RE.match(line.strip())
+        if match:
+            headers[match.group(1)] = match.group(2)
+        else:
+            movetext_lines.append(line)
+
+    variant = headers.get("Variant", "").lower()
+    if variant not in SUPPORTED_VARIANTS:
+        return []
+
+    try:
+        board = chess.Board(headers["FEN"], chess960=variant == "chess960") if "FEN" in headers else chess.Board()
+    except ValueError:
+        return []
+
+    fens = []
+    every_n_plies = max(1, every_n_plies)
+    if min_ply <= 0:
+        fens.append(board.board_fen())
+
+    for ply, san in enumerate(_clean_movetext(" ".join(movetext_lines)), start=1):
+        try:
+            board.push_san(san)
+        except ValueError:
+            break
+        if ply >= min_ply and ply % every_n_plies == 0:
+            fens.append(board.board_fen())
+    return fens
+
+
+def _replay_batch(args) -> List[str]:
+    games, every_n_plies, min_ply = args
+    fens = set()
+    for game_text in games:
+        fens.update(replay_game_fens(game_text, every_n_plies, min_ply))
+    return list(fens)
+
+
+def _iter_batches(paths: Iterable[str], batch_size: int, every_n_plies: int, min_ply: int):
+    batch = []
+    for path in paths:
+        with open_pgn_stream(path) as stream:
+            for game_text in iter_pgn_games(stream):
+                batch.append(game_text)
+                if len(batch) >= batch_size:
+                    yield batch, every_n_plies, min_ply
+                    batch = []
+    if batch:
+        yield batch, every_n_plies, min_ply
+
+
+def ingest_pgn_files(
+    paths: Iterable[str],
+    every_n_plies: int = 1,
+    min_ply: int = 0,
+    workers: Optional[int] = None,
+    batch_size: int = GAMES_PER_BATCH,
+) -> Iterator[List[str]]:
+    """
+    Yields lists of board placement FENs (deduplicated within each batch of games)
+    as the process pool finishes replaying them.
+    """
+    num_workers = workers or max(1, multiprocessing.cpu_count())
+    batches = _iter_batches(paths, batch_size, every_n_plies, min_ply)
+    if num_workers == 1:
+        for batch in batches:
+            yield _replay_batch(batch)
+        return
+
+    # Pool.imap would drain the reader as fast as it can, so submit through a
+    # bounded window instead to keep only a few batches of raw games in flight
+    max_in_flight = num_workers * 2
+    with multiprocessing.Pool(num_workers) as pool:
+        pending = collections.deque()
+        for batch in batches:
+            pending.append(pool.apply_async(_replay_batch, (batch,)))
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pgn_files", nargs="+", help="Local .pgn or .pgn.zst files")
+    parser.add_argument("--every", type=int, default=1, help="Emit every Nth ply (default: every ply)")
+    parser.add_argument("--min-ply", type=int, default=0, help="Skip positions before this ply (default: 0, the start position)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: cpu count)")
+    parser.add_argument("--batch-size", type=int, default=GAMES_PER_BATCH, help="Games per worker task")
+    parser.add_argument("--out", default=CHESS_COM_FENS_FILE, help=f"FEN database to export to (default: {CHESS_COM_FENS_FILE})")
+    parser.add_argument("--store", default=FEN_STORE_DIR, help=f"Deduplicating FEN store directory (default: {FEN_STORE_DIR})")
+    args = parser.parse_args()
+
+    store = open_fen_store(args.store, seed_file=args.out)
+    print(f"Currently cached FENs: {len(store)}")
+
+    extracted = 0
+
+    def replayed_fens():
+        nonlocal extracted
+        for fens in ingest_pgn_files(args.pgn_files, args.every, args.min_ply, args.workers, args.batch_size):
+            extracted += len(fens)
+            yield from fens
+
+    stats = store.add_batch(replayed_fens())
+    print(f"Replayed positions: {extracted}")
+    print_batch_stats(stats)
+
+    total = store.export(args.out)
+    print(f"Successfully saved {total} FENs to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
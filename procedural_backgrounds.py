@@ -0,0 +1,146 @@
+"""
+On-the-fly procedural backgrounds for scene compositing.
+
+Generates solid colors, linear/radial gradients, fractal Perlin noise and
+random clutter (rectangles, ellipses, lines) directly in memory, as a
+replacement for decoding the solid-color JPEGs written by
+`assets/generate_noise_backgrounds.py`.
+
+Everything is drawn from a `numpy.random.Generator`, so a source built with a
+seed is reproducible: `rng_for(key)` derives an independent generator per
+sample (from the sample plan's seed), whichever worker process runs it. A
+source built without one draws a fresh seed from OS entropy (kept in `seed`,
+so its samples can still be re-rendered). Sources for different splits should
+use different `stream` values so they never repeat each other.
+"""
+
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+BACKGROUND_SIZE = 640
+KIND_WEIGHTS = {"solid": 0.15, "gradient": 0.25, "noise": 0.35, "clutter": 0.25}
+NOISE_DOWNSCALE = 4  # noise is evaluated at size / NOISE_DOWNSCALE and upscaled
+NOISE_OCTAVES = 4
+CLUTTER_SHAPES = (5, 40)
+
+
+def _colorize(field: np.ndarray, rng: np.random.Generator) -> Image.Image:
+    """Maps a (H, W) uint8 field to RGB through a 256-entry ramp between two random colors."""
+    c0, c1 = rng.integers(0, 256, size=(2, 3))
+    ramp = np.linspace(0.0, 1.0, 256)[:, None]
+    lut = np.clip(c0 + ramp * (c1 - c0) + 0.5, 0, 255).astype(np.uint8)
+    gray = Image.fromarray(field)
+    return Image.merge("RGB", [gray.point(lut[:, c].tolist()) for c in range(3)])
+
+
+def _to_field(values: np.ndarray, size: int) -> np.ndarray:
+    """Normalizes a small float array to [0, 255] and upscales it to a (size, size) uint8 field."""
+    values = values - values.min()
+    values = values / max(float(values.max()), 1e-6)
+    small = Image.fromarray((values * 255 + 0.5).astype(np.uint8))
+    return np.asarray(small.resize((size, size), Image.BILINEAR))
+
+
+def perlin(shape: Tuple[int, int], cells: int, rng: np.random.Generator) -> np.ndarray:
+    """Vectorized 2D Perlin noise over a grid of `cells` x `cells` gradients, roughly in [-0.7, 0.7]."""
+    h, w = shape
+    angles = rng.uniform(0, 2 * np.pi, size=(cells + 1, cells + 1))
+    gx, gy = np.cos(angles), np.sin(angles)
+
+    y = np.linspace(0, cells, h, endpoint=False)
+    x = np.linspace(0, cells, w, endpoint=False)
+    yi, xi = y.astype(int), x.astype(int)
+    yf, xf = (y - yi)[:, None], (x - xi)[None, :]
+
+    def corner(dy, dx):
+        rows, cols = (yi + dy)[:, None], (xi + dx)[None, :]
+        return gx[rows, cols] * (xf - dx) + gy[rows, cols] * (yf - dy)
+
+    n00, n01, n10, n11 = corner(0, 0), corner(0, 1), corner(1, 0), corner(1, 1)
+    fade_y = yf * yf * yf * (yf * (yf * 6 - 15) + 10)
+    fade_x = xf * xf * xf * (xf * (xf * 6 - 15) + 10)
+    top = n00 + fade_x * (n01 - n00)
+    bottom = n10 + fade_x * (n11 - n10)
+    return top + fade_y * (bottom - top)
+
+
+def fractal_noise(size: int, rng: np.random.Generator, octaves: int = NOISE_OCTAVES) -> np.ndarray:
+    """Sum of Perlin octaves as a (size, size) uint8 field, evaluated at a reduced size and upscaled."""
+    small = max(8, size // NOISE_DOWNSCALE)
+    base_cells = int(rng.integers(2, 7))
+    persistence = rng.uniform(0.35, 0.65)
+    field = np.zeros((small, small))
+    amplitude = 1.0
+    for octave in range(octaves):
+        cells = min(small // 2, base_cells * 2 ** octave)
+        field += amplitude * perlin((small, small), cells, rng)
+        amplitude *= persistence
+    return _to_field(field, size)
+
+
+def gradient_field(size: int, rng: np.random.Generator) -> np.ndarray:
+    """Linear gradient at a random angle or radial gradient from a random center, as a uint8 field."""
+    small = max(8, size // NOISE_DOWNSCALE)
+    coords = np.linspace(0.0, 1.0, small)
+    if rng.random() < 0.6:
+        theta = rng.uniform(0, 2 * np.pi)
+        t = np.cos(theta) * coords[None, :] + np.sin(theta) * coords[:, None]
+    else:
+        cx, cy = rng.uniform(0, 1, size=2)
+        t = np.sqrt((coords[None, :] - cx) ** 2 + (coords[:, None] - cy) ** 2)
+    return _to_field(t, size)
+
+
+class ProceduralBackgroundSource:
+    def __init__(
+        self,
+        size: int = BACKGROUND_SIZE,
+        seed: Optional[int] = None,
+        stream: int = 0,
+        kind_weights: Optional[Dict[str, float]] = None,
+    ):
+        self.size = size
+        self.seed = np.random.SeedSequence().entropy if seed is None else seed
+        self.stream = stream
+        weights = kind_weights or KIND_WEIGHTS
+        self.kinds = list(weights)
+        total = sum(weights.values())
+        self.probs = [weights[kind] / total for kind in self.kinds]
+        self.rng = np.random.default_rng([self.seed, stream])
+
+    def rng_for(self, key: int) -> np.random.Generator:
+        """A generator for one sample, derived from (seed, stream, key)."""
+        return np.random.default_rng([self.seed, self.stream, key])
+
+    def solid(self, rng: np.random.Generator) -> Image.Image:
+        return Image.new("RGB", (self.size, self.size), tuple(int(c) for c in rng.integers(0, 256, size=3)))
+
+    def gradient(self, rng: np.random.Generator) -> Image.Image:
+        return _colorize(gradient_field(self.size, rng), rng)
+
+    def noise(self, rng: np.random.Generator) -> Image.Image:
+        return _colorize(fractal_noise(self.size, rng), rng)
+
+    def clutter(self, rng: np.random.Generator) -> Image.Image:
+        image = self.gradient(rng) if rng.random() < 0.5 else self.solid(rng)
+        draw = ImageDraw.Draw(image)
+        for _ in range(int(rng.integers(*CLUTTER_SHAPES))):
+            x0, y0 = rng.integers(-self.size // 8, self.size, size=2)
+            w, h = rng.integers(self.size // 40, self.size // 3, size=2)
+            box = (int(x0), int(y0), int(x0 + w), int(y0 + h))
+            color = tuple(int(c) for c in rng.integers(0, 256, size=3))
+            shape = rng.random()
+            if shape < 0.4:
+                draw.rectangle(box, fill=color)
+            elif shape < 0.8:
+                draw.ellipse(box, fill=color)
+            else:
+                draw.line(box, fill=color, width=int(rng.integers(1, 12)))
+        return image
+
+    def generate(self, rng: Optional[np.random.Generator] = None) -> Image.Image:
+        rng = rng if rng is not None else self.rng
+        kind = self.kinds[rng.choice(len(self.kinds), p=self.probs)]
+        return getattr(self, kind)(rng)
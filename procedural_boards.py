@@ -0,0 +1,130 @@
+"""
+On-the-fly procedural chessboard source.
+
+Draws a random light/dark checkerboard and, most of the time, blends a random
+crop of a texture from `assets/textures` over it. Crops come from the
+memory-mapped mip pyramids of `texture_cache.py` when the texture has been
+ingested, otherwise from a per-process cache of decoded textures; the
+checkerboard and blend are built as NumPy arrays, so producing a board costs a
+few array ops instead of a disk read and decode.
+
+`generate_datasets.py` draws from this source alongside `assets/boards`
+(PROCEDURAL_BOARD_RATIO); `assets/boards_generater.py` uses it to write a
+fixed set of boards to disk.
+"""
+
+import os
+import random
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from texture_cache import TextureCache
+
+TEXTURES_DIR = "assets/textures"
+BOARD_SIZE = 640
+PROB_TEXTURED = 0.7  # not every board gets a texture — keep some flat ones too
+TEXTURE_OPACITY = 0.6
+# a crop covers size * scale full-resolution texels, scale drawn uniformly from this range
+TEXTURE_SCALE = (1.0, 1.0)
+
+# decoded textures, per worker process: {path: HxWx3 uint8} and
+# {(path, min_size): upscaled copy} for textures smaller than the board
+_TEXTURE_CACHE: Dict[str, np.ndarray] = {}
+_UPSCALED_CACHE: Dict[Tuple[str, int], np.ndarray] = {}
+
+
+def load_texture(path: str, min_size: int = 0) -> np.ndarray:
+    """Decodes a texture once per process, upscaled if it is smaller than `min_size`."""
+    texture = _TEXTURE_CACHE.get(path)
+    if texture is None:
+        with Image.open(path) as img:
+            texture = np.asarray(img.convert("RGB"))
+        _TEXTURE_CACHE[path] = texture
+
+    th, tw = texture.shape[:2]
+    if tw >= min_size and th >= min_size:
+        return texture
+
+    upscaled = _UPSCALED_CACHE.get((path, min_size))
+    if upscaled is None:
+        size = (max(min_size, tw), max(min_size, th))
+        upscaled = np.asarray(Image.fromarray(texture).resize(size))
+        _UPSCALED_CACHE[(path, min_size)] = upscaled
+    return upscaled
+
+
+def checkerboard(size: int, light: Tuple[int, int, int], dark: Tuple[int, int, int]) -> np.ndarray:
+    """Builds an 8x8 checkerboard as a (size, size, 3) uint8 array; a1 (bottom-left) is dark."""
+    light_mask = (np.arange(8)[:, None] + np.arange(8)[None, :]) % 2 == 0
+    tiles = np.where(light_mask[..., None], np.array(light, np.uint8), np.array(dark, np.uint8))
+    tile = size // 8
+    board = np.repeat(np.repeat(tiles, tile, axis=0), tile, axis=1)
+    if size % 8:
+        board = np.pad(board, ((0, size % 8), (0, size % 8), (0, 0)), mode="edge")
+    return board
+
+
+def blend(base: np.ndarray, overlay: np.ndarray, alpha: float) -> np.ndarray:
+    """Same result as PIL's Image.blend, in 8-bit fixed point on uint16 arrays."""
+    a = int(round(alpha * 256))
+    mixed = base.astype(np.uint16) * (256 - a) + overlay.astype(np.uint16) * a + 128
+    return (mixed >> 8).astype(np.uint8)
+
+
+class ProceduralBoardSource:
+    def __init__(
+        self,
+        textures_dir: str = TEXTURES_DIR,
+        texture_files: Optional[List[str]] = None,
+        size: int = BOARD_SIZE,
+        prob_textured: float = PROB_TEXTURED,
+        texture_opacity: float = TEXTURE_OPACITY,
+        texture_scale: Tuple[float, float] = TEXTURE_SCALE,
+        texture_cache: Optional[TextureCache] = None,
+        rng=None,
+    ):
+        self.textures_dir = textures_dir
+        self.rng = rng or random  # random.Random-like generator the boards are drawn from
+        self.texture_cache = texture_cache
+        if texture_files is None:
+            if texture_cache is not None and len(texture_cache):
+                texture_files = texture_cache.names()
+            elif os.path.isdir(textures_dir):
+                texture_files = sorted(os.listdir(textures_dir))
+            else:
+                texture_files = []
+        self.texture_files = list(texture_files)
+        self.size = size
+        self.prob_textured = prob_textured
+        self.texture_opacity = texture_opacity
+        self.texture_scale = texture_scale
+
+    def random_texture_crop(self, size: int) -> np.ndarray:
+        """Crops a random (size, size) patch from a random texture."""
+        name = self.rng.choice(self.texture_files)
+        scale = self.rng.uniform(*self.texture_scale)
+        if self.texture_cache is not None and name in self.texture_cache:
+            return self.texture_cache.crop(name, size, scale, self.rng)
+
+        texture = load_texture(os.path.join(self.textures_dir, name), size)
+        th, tw = texture.shape[:2]
+        span = min(th, tw, max(1, round(size * scale)))
+        x = self.rng.randint(0, tw - span)
+        y = self.rng.randint(0, th - span)
+        patch = texture[y:y + span, x:x + span]
+        if span != size:
+            patch = np.asarray(Image.fromarray(patch).resize((size, size), Image.BILINEAR))
+        return patch
+
+    def generate(self) -> Image.Image:
+        light = tuple(self.rng.randint(180, 255) for _ in range(3))
+        dark = tuple(self.rng.randint(20, 140) for _ in range(3))
+        board = checkerboard(self.size, light, dark)
+
+        if self.texture_files and self.rng.random() < self.prob_textured:
+            # one texture patch covering the whole board
+            board = blend(board, self.random_texture_crop(self.size), self.texture_opacity)
+
+        return Image.fromarray(board)
@@ -71,19 +71,19 @@ def board_to_fen(chess_board: list) -> str:
                 fen += "/"
     return fen
 
-def get_random_chess_com_fen() -> str:
+def get_random_chess_com_fen(rng=random) -> str:
     """70% Source: Selects a random FEN from Chess.com's open database pool."""
     fens = get_chess_com_fens_list()
-    return random.choice(fens)
+    return rng.choice(fens)
 
-def generate_custom_realistic_fen() -> str:
+def generate_custom_realistic_fen(rng=random) -> str:
     """
     20% Source: Generates a realistic custom chess position.
     Follows standard chess piece counts and pawn rank constraints.
     """
     board = [None] * 64
     available_indices = list(range(64))
-    random.shuffle(available_indices)
+    rng.shuffle(available_indices)
 
     # Place Kings (1 White King, 1 Black King)
     w_king_pos = available_indices.pop()
@@ -95,11 +95,11 @@ def generate_custom_realistic_fen() -> str:
     # Define realistic piece distribution counts per color
     # Pawns: 0-8, Rooks: 0-2, Knights: 0-2, Bishops: 0-2, Queens: 0-2
     piece_pools = {
-        "P": random.randint(0, 8),
-        "R": random.randint(0, 2),
-        "N": random.randint(0, 2),
-        "B": random.randint(0, 2),
-        "Q": random.randint(0, 2),
+        "P": rng.randint(0, 8),
+        "R": rng.randint(0, 2),
+        "N": rng.randint(0, 2),
+        "B": rng.randint(0, 2),
+        "Q": rng.randint(0, 2),
     }
 
     # White pieces
@@ -112,7 +112,7 @@ def generate_custom_realistic_fen() -> str:
                 pawn_indices = [idx for idx in available_indices if 8 <= idx <= 55]
                 if not pawn_indices:
                     continue
-                pos = random.choice(pawn_indices)
+                pos = rng.choice(pawn_indices)
                 available_indices.remove(pos)
             else:
                 pos = available_indices.pop()
@@ -120,11 +120,11 @@ def generate_custom_realistic_fen() -> str:
 
     # Black pieces
     b_piece_pools = {
-        "p": random.randint(0, 8),
-        "r": random.randint(0, 2),
-        "n": random.randint(0, 2),
-        "b": random.randint(0, 2),
-        "q": random.randint(0, 2),
+        "p": rng.randint(0, 8),
+        "r": rng.randint(0, 2),
+        "n": rng.randint(0, 2),
+        "b": rng.randint(0, 2),
+        "q": rng.randint(0, 2),
     }
 
     for p_type, count in b_piece_pools.items():
@@ -135,7 +135,7 @@ def generate_custom_realistic_fen() -> str:
                 pawn_indices = [idx for idx in available_indices if 8 <= idx <= 55]
                 if not pawn_indices:
                     continue
-                pos = random.choice(pawn_indices)
+                pos = rng.choice(pawn_indices)
                 available_indices.remove(pos)
             else:
                 pos = available_indices.pop()
@@ -143,7 +143,7 @@ def generate_custom_realistic_fen() -> str:
 
     return board_to_fen(board)
 
-def generate_bogus_fen() -> str:
+def generate_bogus_fen(rng=random) -> str:
     """
     10% Source: Generates a complete bogus / chaotic position.
     Can feature extreme piece counts (e.g. 8 queens, 5 kings), wild piece scatter,
@@ -153,31 +153,32 @@ def generate_bogus_fen() -> str:
     all_pieces = ["P", "R", "N", "B", "Q", "K", "p", "r", "n", "b", "q", "k"]
     
     # Random piece count anywhere from 1 to 50 pieces
-    num_pieces = random.randint(1, 50)
-    positions = random.sample(range(64), num_pieces)
+    num_pieces = rng.randint(1, 50)
+    positions = rng.sample(range(64), num_pieces)
 
     for pos in positions:
         # Completely unconstrained piece selection
-        board[pos] = random.choice(all_pieces)
+        board[pos] = rng.choice(all_pieces)
 
     return board_to_fen(board)
 
-def generate_fen(ratio=(0.70, 0.20, 0.10)) -> str:
+def generate_fen(ratio=(0.70, 0.20, 0.10), rng=random) -> str:
     """
     Generates a FEN position based on the required distribution:
       - 70% Chess.com Open Database
       - 20% Custom Realistic Generator
       - 10% Complete Bogus Generator
+    `rng` is the random.Random-like generator to draw from (default: the `random` module).
     """
-    r = random.random()
+    r = rng.random()
     p_chess_com, p_custom, p_bogus = ratio
     
     if r < p_chess_com:
-        return get_random_chess_com_fen()
+        return get_random_chess_com_fen(rng)
     elif r < p_chess_com + p_custom:
-        return generate_custom_realistic_fen()
+        return generate_custom_realistic_fen(rng)
     else:
-        return generate_bogus_fen()
+        return generate_bogus_fen(rng)
 
 if __name__ == "__main__":
     print("Testing FEN Generator Distribution (10 samples):")
@@ -0,0 +1,444 @@
+"""
+Columnar sample manifests: generation planned up front, rendered later.
+
+Every sample `generate_datasets.py` makes is a plan first (`plan_image`,
+plus `plan_composite` for background scenes): the FEN, each piece's resize,
+rotation and offset, which augmentations fire and with what parameters, the
+scene placement, and the labels those imply, computed geometrically. The
+leftover pixel-level randomness (noise fields, random lines, procedural
+boards and backgrounds) comes from the plan's own seed. Rendering a plan is
+deterministic, so the same plan gives the same pixels on any machine.
+
+With WRITE_PLAN (or PLAN_ONLY, which skips the pixels) each split's plans are
+appended to `datasets/plans/<split>/`:
+  - samples.npy        SAMPLE_DTYPE, one row per sample
+  - pieces.npy         PIECE_DTYPE, the pieces of sample i are
+                       pieces[piece_offsets[i]:piece_offsets[i + 1]]
+  - piece_offsets.npy  int64 (N + 1,)
+  - labels.npy         float64 (M, 5) YOLO rows, split by label_offsets.npy
+  - meta.json          asset dictionaries (boards, piece_sets, backgrounds:
+                       the `board` / `piece_set` / `background` columns are
+                       codes into them, -1 = procedural), the texture list
+                       and procedural background seed of the latest run
+
+`info` summarizes a plan (class balance, augmentation rates) before any pixel
+is drawn; `render` draws any subset of it across a process pool into a YOLO
+tree, optionally at another resolution (--size resizes each finished sample;
+labels are normalized, so they stay valid). Procedural boards re-render
+against the split's texture list in meta.json.
+
+Usage:
+    python sample_plan.py info --split train
+    python sample_plan.py render --split val
+    python sample_plan.py render --split train --ids 1:5000 --size 320 --out datasets_320
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+PLANS_DIR = "datasets/plans"
+SPLITS = ["train", "val"]
+SAMPLES_PER_CHUNK = 256
+
+# stage axis of the augmentation columns: 0 = board render, 1 = scene composite
+SAMPLE_DTYPE = np.dtype([
+    ("image_id", "<u4"),
+    ("seed", "<u4"),
+    ("board", "<i4"),
+    ("piece_set", "<i4"),
+    ("background", "<i4"),
+    ("composite", "u1"),
+    ("fen", "S72"),
+    ("random_lines", "u1"),
+    ("warp", "u1"),
+    ("warp_shifts", "<i2", (8,)),
+    ("vignette", "u1"),
+    ("scanlines", "u1", (2,)),  # (spacing, alpha), 0 = off
+    ("jitter", "<f8", (2, 4)),  # 0 = off, 1.0 = that enhancement left out
+    ("blur_kind", "u1", (2,)),  # 0 = off, else BLUR_GAUSSIAN / BLUR_BOX / BLUR_MOTION
+    ("blur_amount", "<f8", (2,)),
+    ("blur_vertical", "u1", (2,)),
+    ("noise_kind", "u1", (2,)),  # 0 = off, else NOISE_GAUSSIAN / NOISE_SALT_PEPPER
+    ("noise_amount", "<f8", (2,)),
+    ("jpeg_quality", "u1", (2,)),  # 0 = off
+    ("board_size", "<u2"),
+    ("x", "<u2"),
+    ("y", "<u2"),
+    ("noise_bank", "<u4"),  # noise_bank seed of the run (0 = DEFAULT_SEED, also for plans made before the column)
+])
+PIECE_DTYPE = np.dtype([
+    ("square", "u1"),  # row * 8 + file
+    ("piece", "S1"),  # FEN character
+    ("scale", "<f8"),  # 0 = not resized
+    ("rotated", "u1"),
+    ("angle", "<f8"),
+    ("shift", "i1", (2,)),
+])
+
+
+def plan_dir(split: str, root: str = PLANS_DIR) -> str:
+    return os.path.join(root, split)
+
+
+def load_meta(directory: str) -> dict:
+    path = os.path.join(directory, "meta.json")
+    if not os.path.exists(path):
+        return {"count": 0, "boards": [], "piece_sets": [], "backgrounds": []}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_meta(directory: str, meta: dict):
+    path = os.path.join(directory, "meta.json")
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(meta, f, indent=1)
+    os.replace(f"{path}.tmp", path)
+
+
+def _label_array(lines: Iterable[str]) -> np.ndarray:
+    return np.array([[float(t) for t in line.split()] for line in lines], dtype=np.float64).reshape(-1, 5)
+
+
+def _encode(image_id: int, plan: dict, codes: Dict[str, List[int]]) -> Tuple[np.ndarray, np.ndarray]:
+    row = np.zeros((), dtype=SAMPLE_DTYPE)
+    row["image_id"], row["seed"], row["fen"] = image_id, plan["seed"], plan["fen"].encode()
+    row["board"] = -1 if plan["board"] < 0 else codes["boards"][plan["board"]]
+    row["piece_set"] = codes["piece_sets"][plan["piece_set"]]
+    row["random_lines"], row["vignette"] = plan["random_lines"], plan["vignette"]
+    if plan["warp"] is not None:
+        row["warp"], row["warp_shifts"] = 1, plan["warp"]
+    if plan["scanlines"] is not None:
+        row["scanlines"] = plan["scanlines"]
+    row["background"] = -1
+    stages = [plan]
+    composite = plan.get("composite")
+    if composite is not None:
+        row["composite"] = 1
+        background = codes["backgrounds"][composite["background"]]
+        row["background"] = -1 if background is None else background
+        row["board_size"], row["x"], row["y"] = composite["board_size"], composite["x"], composite["y"]
+        stages.append(composite)
+    for stage, ops in enumerate(stages):
+        if ops["jitter"] is not None:
+            row["jitter"][stage] = ops["jitter"]
+        if ops["blur"] is not None:
+            row["blur_kind"][stage], row["blur_amount"][stage], row["blur_vertical"][stage] = ops["blur"]
+        if ops["noise"] is not None:
+            row["noise_kind"][stage], row["noise_amount"][stage] = ops["noise"]
+        row["jpeg_quality"][stage] = ops["jpeg"] or 0
+    row["noise_bank"] = plan.get("noise_bank") or 0
+
+    pieces = np.zeros(len(plan["pieces"]), dtype=PIECE_DTYPE)
+    for i, (square, char, scale, angle, shift) in enumerate(plan["pieces"]):
+        pieces[i] = (square, char.encode(), scale, angle is not None, angle or 0.0, shift)
+    return row, pieces
+
+
+def decode(row: np.void, pieces: np.ndarray) -> dict:
+    """Rebuilds the plan dict of generate_datasets.render_sample from a manifest row and its pieces."""
+    plan = {
+        "seed": int(row["seed"]),
+        "board": int(row["board"]),
+        "piece_set": int(row["piece_set"]),
+        "fen": row["fen"].decode(),
+        "pieces": [
+            (int(p["square"]), p["piece"].decode(), float(p["scale"]), float(p["angle"]) if p["rotated"] else None,
+             tuple(int(v) for v in p["shift"]))
+            for p in pieces
+        ],
+        "random_lines": bool(row["random_lines"]),
+        "warp": tuple(int(v) for v in row["warp_shifts"]) if row["warp"] else None,
+        "vignette": bool(row["vignette"]),
+        "scanlines": tuple(int(v) for v in row["scanlines"]) if row["scanlines"][0] else None,
+        "noise_bank": int(row["noise_bank"]),
+    }
+    stages = [plan]
+    if row["composite"]:
+        plan["composite"] = {
+            "background": int(row["background"]),
+            "board_size": int(row["board_size"]),
+            "x": int(row["x"]),
+            "y": int(row["y"]),
+        }
+        stages.append(plan["composite"])
+    for stage, ops in enumerate(stages):
+        ops["jitter"] = tuple(float(v) for v in row["jitter"][stage]) if row["jitter"][stage][0] else None
+        blur_kind = int(row["blur_kind"][stage])
+        ops["blur"] = (blur_kind, float(row["blur_amount"][stage]), bool(row["blur_vertical"][stage])) if blur_kind else None
+        noise_kind = int(row["noise_kind"][stage])
+        ops["noise"] = (noise_kind, float(row["noise_amount"][stage])) if noise_kind else None
+        ops["jpeg"] = int(row["jpeg_quality"][stage]) or None
+    return plan
+
+
+class PlanWriter:
+    """
+    Appends (image id, plan, label lines) rows of one split. `boards`,
+    `piece_sets` and `backgrounds` are the split's asset lists the plans index
+    into (a background None is procedural); their names join the manifest's
+    append-only dictionaries, so codes stay valid across runs.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        boards: Sequence[str],
+        piece_sets: Sequence[str],
+        backgrounds: Sequence[Optional[str]] = (),
+        **meta_fields,
+    ):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.meta = load_meta(directory)
+        self.meta.update(meta_fields)
+        self.codes = {
+            "boards": [self._code("boards", name) for name in boards],
+            "piece_sets": [self._code("piece_sets", name) for name in piece_sets],
+            "backgrounds": [None if name is None else self._code("backgrounds", name) for name in backgrounds],
+        }
+        _write_meta(directory, self.meta)
+
+    def _code(self, kind: str, name: str) -> int:
+        names = self.meta[kind]
+        if name not in names:
+            names.append(name)
+        return names.index(name)
+
+    def append(self, rows: Iterable[Tuple[int, dict, List[str]]]):
+        samples, pieces, labels = [], [], []
+        for image_id, plan, lines in rows:
+            row, row_pieces = _encode(image_id, plan, self.codes)
+            samples.append(row)
+            pieces.append(row_pieces)
+            labels.append(_label_array(lines))
+        if not samples:
+            return
+        current = load_plan(self.directory) if self.meta["count"] else None
+        new = {
+            "samples": np.stack(samples),
+            "pieces": np.concatenate(pieces),
+            "piece_offsets": np.cumsum([0] + [len(p) for p in pieces]),
+            "labels": np.concatenate(labels),
+            "label_offsets": np.cumsum([0] + [len(l) for l in labels]),
+        }
+        if current is not None:
+            for name in ("piece_offsets", "label_offsets"):
+                new[name] = np.concatenate([current[name], current[name][-1] + new[name][1:]])
+            for name in ("samples", "pieces", "labels"):
+                new[name] = np.concatenate([current[name], new[name]])
+        for name, array in new.items():
+            path = os.path.join(self.directory, f"{name}.npy")
+            np.save(f"{path}.tmp.npy", array.astype(np.int64) if name.endswith("offsets") else array)
+            os.replace(f"{path}.tmp.npy", path)
+        self.meta["count"] = len(new["samples"])
+        _write_meta(self.directory, self.meta)
+
+
+def load_plan(directory: str) -> Dict[str, np.ndarray]:
+    """Loads a split's manifest arrays (samples, pieces, piece_offsets, labels, label_offsets)."""
+    names = ("samples", "pieces", "piece_offsets", "labels", "label_offsets")
+    plan = {name: np.load(os.path.join(directory, f"{name}.npy")) for name in names}
+    samples = plan["samples"]
+    if samples.dtype != SAMPLE_DTYPE:
+        # written before a column was added: the missing columns are 0
+        plan["samples"] = np.zeros(len(samples), dtype=SAMPLE_DTYPE)
+        for name in samples.dtype.names:
+            plan["samples"][name] = samples[name]
+    return plan
+
+
+# ---------------------------------------------------------------------------
+# Rendering
+# ---------------------------------------------------------------------------
+_ASSETS: Dict[Tuple[str, str], object] = {}  # per-process cache of decoded boards, piece sets and backgrounds
+
+
+def _asset(kind: str, name: str, meta: dict):
+    import generate_datasets as gen
+
+    key = (kind, name)
+    if key not in _ASSETS:
+        if kind == "board":
+            _ASSETS[key] = gen.load_board(name)
+        elif kind == "piece_set":
+            _ASSETS[key] = gen.load_pieces(name)
+        elif kind == "background":
+            _ASSETS[key] = gen.load_background(name)
+        elif kind == "board_source":
+            from procedural_boards import ProceduralBoardSource
+            from texture_cache import TextureCache
+
+            _ASSETS[key] = ProceduralBoardSource(
+                gen.TEXTURES_DIR, meta.get("textures") or [], gen.BOARD_SIZE, texture_cache=TextureCache(gen.TEXTURE_CACHE_DIR)
+            )
+        else:
+            from procedural_backgrounds import ProceduralBackgroundSource
+
+            _ASSETS[key] = ProceduralBackgroundSource(gen.BOARD_SIZE, meta.get("background_seed"), meta.get("background_stream", 0))
+    return _ASSETS[key]
+
+
+def _render_chunk(args) -> int:
+    import generate_datasets as gen
+    from dataset_layout import ensure_sample_dir, sample_path
+
+    meta, rows, pieces, piece_offsets, labels, label_offsets, images_dir, labels_dir, size = args
+    for i, row in enumerate(rows):
+        plan = decode(row, pieces[piece_offsets[i]:piece_offsets[i + 1]])
+        board = None if plan["board"] < 0 else _asset("board", meta["boards"][plan["board"]], meta)
+        background = None
+        if plan.get("composite") and plan["composite"]["background"] >= 0:
+            background = _asset("background", meta["backgrounds"][plan["composite"]["background"]], meta)
+        image = gen.render_sample(
+            plan,
+            board,
+            _asset("piece_set", meta["piece_sets"][plan["piece_set"]], meta),
+            _asset("board_source", "", meta) if plan["board"] < 0 else None,
+            background,
+            _asset("background_source", "", meta),
+        )
+        if size and image.size != (size, size):
+            image = image.resize((size, size), gen.Image.BILINEAR)
+        image_id = int(row["image_id"])
+        ensure_sample_dir(images_dir, image_id)
+        ensure_sample_dir(labels_dir, image_id)
+        gen.save_sample(image, sample_path(images_dir, image_id, gen.OUTPUT_EXT))
+        lines = [
+            f"{int(c)} {xc:.6f} {yc:.6f} {w:.6f} {h:.6f}" for c, xc, yc, w, h in labels[label_offsets[i]:label_offsets[i + 1]]
+        ]
+        with open(sample_path(labels_dir, image_id, "txt"), "w") as f:
+            f.write("\n".join(lines))
+    return len(rows)
+
+
+def render_plan(
+    split: str,
+    ids: Optional[np.ndarray] = None,
+    size: Optional[int] = None,
+    root: str = PLANS_DIR,
+    out: Optional[str] = None,
+    workers: Optional[int] = None,
+) -> int:
+    """
+    Renders the samples of a split's plan whose image id is in `ids` (all when None)
+    into `<out>/images/<split>` and `<out>/labels/<split>` (out defaults to the plans
+    root's parent, i.e. the tree the plan was made for). Returns the rendered count.
+    """
+    import generate_datasets as gen
+    from dataset_layout import set_image_ext, set_layout
+
+    directory = plan_dir(split, root)
+    meta = load_meta(directory)
+    plan = load_plan(directory)
+    samples = plan["samples"]
+    selected = np.arange(len(samples)) if ids is None else np.flatnonzero(np.isin(samples["image_id"], ids))
+
+    out = out or os.path.dirname(os.path.normpath(root))
+    images_dir, labels_dir = os.path.join(out, "images", split), os.path.join(out, "labels", split)
+    os.makedirs(images_dir, exist_ok=True)
+    set_layout(labels_dir, set_layout(images_dir, False))
+    set_image_ext(images_dir, gen.OUTPUT_EXT)
+
+    po, lo = plan["piece_offsets"], plan["label_offsets"]
+    chunks = []
+    for start in range(0, len(selected), SAMPLES_PER_CHUNK):
+        rows = selected[start:start + SAMPLES_PER_CHUNK]
+        pieces_idx = np.concatenate([np.arange(po[i], po[i + 1]) for i in rows]).astype(np.int64)
+        labels_idx = np.concatenate([np.arange(lo[i], lo[i + 1]) for i in rows]).astype(np.int64)
+        chunks.append((
+            meta,
+            samples[rows],
+            plan["pieces"][pieces_idx],
+            np.cumsum([0] + [po[i + 1] - po[i] for i in rows]),
+            plan["labels"][labels_idx],
+            np.cumsum([0] + [lo[i + 1] - lo[i] for i in rows]),
+            images_dir,
+            labels_dir,
+            size,
+        ))
+    if not chunks:
+        return 0
+    if gen.NOISE_BANK:
+        import noise_bank
+
+        for seed in np.unique(samples["noise_bank"][selected]):
+            noise_bank.bank(int(seed))  # before the pool forks, so the workers share them
+    num_workers = workers or max(1, multiprocessing.cpu_count())
+    with multiprocessing.Pool(num_workers) as pool:
+        return sum(pool.imap_unordered(_render_chunk, chunks))
+
+
+def plan_stats(directory: str) -> dict:
+    """Sample counts, label class balance and augmentation firing rates of a split's plan."""
+    meta = load_meta(directory)
+    plan = load_plan(directory)
+    samples = plan["samples"]
+    n = max(1, len(samples))
+    composite = samples["composite"].astype(bool)
+    classes, counts = np.unique(plan["labels"][:, 0].astype(int), return_counts=True)
+
+    def rate(mask) -> float:
+        return round(float(np.count_nonzero(mask)) / n, 4)
+
+    return {
+        "samples": len(samples),
+        "composite": int(np.count_nonzero(composite)),
+        "procedural_boards": int(np.count_nonzero(samples["board"] < 0)),
+        "procedural_backgrounds": int(np.count_nonzero(composite & (samples["background"] < 0))),
+        "labels": int(len(plan["labels"])),
+        "classes": {int(c): int(k) for c, k in zip(classes, counts)},
+        "board_usage": int(len(np.unique(samples["board"][samples["board"] >= 0]))),
+        "boards": len(meta["boards"]),
+        "piece_set_usage": int(len(np.unique(samples["piece_set"]))),
+        "piece_sets": len(meta["piece_sets"]),
+        "augmentations": {
+            "random_lines": rate(samples["random_lines"]),
+            "warp": rate(samples["warp"]),
+            "vignette": rate(samples["vignette"]),
+            "scanlines": rate(samples["scanlines"][:, 0]),
+            "jitter": rate(samples["jitter"][:, 0, 0]),
+            "blur": rate(samples["blur_kind"][:, 0]),
+            "noise": rate(samples["noise_kind"][:, 0]),
+            "jpeg": rate(samples["jpeg_quality"][:, 0]),
+            "scene_jitter": rate(samples["jitter"][:, 1, 0]),
+            "scene_blur": rate(samples["blur_kind"][:, 1]),
+            "scene_noise": rate(samples["noise_kind"][:, 1]),
+            "scene_jpeg": rate(samples["jpeg_quality"][:, 1]),
+        },
+    }
+
+
+def _parse_ids(text: str) -> np.ndarray:
+    start, _, stop = text.partition(":")
+    return np.arange(int(start), int(stop) + 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["info", "render"])
+    parser.add_argument("--split", choices=SPLITS, default=None, help="Only this split (default: all)")
+    parser.add_argument("--plans", default=PLANS_DIR, help=f"Plans root directory (default: {PLANS_DIR})")
+    parser.add_argument("--ids", type=_parse_ids, default=None, help="Render only image ids A:B (inclusive)")
+    parser.add_argument("--size", type=int, default=None, help="Output image size (default: as planned)")
+    parser.add_argument("--out", default=None, help="Output root holding images/ and labels/ (default: the plans root's parent)")
+    parser.add_argument("--workers", type=int, default=None, help="Render worker processes (default: cpu count)")
+    args = parser.parse_args()
+
+    for split in [args.split] if args.split else SPLITS:
+        if not os.path.exists(os.path.join(plan_dir(split, args.plans), "samples.npy")):
+            print(f"{split}: no plan")
+            continue
+        if args.command == "info":
+            print(f"{split}: {json.dumps(plan_stats(plan_dir(split, args.plans)), indent=1)}")
+        else:
+            count = render_plan(split, args.ids, args.size, args.plans, args.out, args.workers)
+            print(f"{split}: rendered {count} samples")
+
+
+if __name__ == "__main__":
+    main()
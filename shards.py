@@ -0,0 +1,243 @@
+"""
+Multi-node dataset builds: shard manifests and the merge step.
+
+`python generate_datasets.py --shard i/N --seed S` runs on each node. With the
+same seed and the same assets, every node derives the same train/val asset
+split and the same id plan: each split's ids are laid out from 1 in stage
+order (clean boards, then background compositing), and shard i generates
+every N-th task of each stage. Its YOLO tree and `manifest.json` go to
+`datasets/shards/<i>-of-<N>/`.
+
+Once all shard directories are on one host (shared storage, rsync, or
+several shards run locally), `merge` checks that:
+  - all N manifests are present and were built from the same plan;
+  - their id ranges tile each split's planned ids without overlap;
+  - every planned sample has its image and label file.
+It then reserves a range of ids from each final split's counter, links or
+copies every sample into `datasets/images` / `datasets/labels` under its
+renumbered id, and records the result in `merged.json`. `merge --index-only`
+writes `index.json` instead, listing the id ranges each shard directory holds.
+
+Usage:
+    python shards.py check
+    python shards.py merge
+    python shards.py merge --index-only
+"""
+
+import argparse
+import errno
+import hashlib
+import json
+import os
+import shutil
+import sys
+from typing import Dict, List, Tuple
+
+from dataset_layout import IdAllocator, ensure_sample_dir, sample_path, set_image_ext, set_layout
+
+SHARDS_DIR = "datasets/shards"
+DATASETS_IMAGES_DIR = "datasets/images"
+DATASETS_LABELS_DIR = "datasets/labels"
+MANIFEST = "manifest.json"
+
+
+def parse_shard(text: str) -> Tuple[int, int]:
+    """Parses 'i/N' (0 <= i < N) for argparse."""
+    try:
+        index, count = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/N, got {text!r}")
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard index must be in [0, {count}), got {index}")
+    return index, count
+
+
+def shard_dir(root: str, index: int, count: int) -> str:
+    return os.path.join(root, f"{index}-of-{count}")
+
+
+def plan_fingerprint(plan: dict) -> str:
+    """Stable hash of everything that shapes the id plan (seed, asset names, settings, id totals)."""
+    return hashlib.sha256(json.dumps(plan, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def write_manifest(directory: str, shard: Tuple[int, int], fingerprint: str, ext: str, splits: Dict[str, dict]):
+    """
+    `splits` maps a split to {"ids": [first, end), "ranges": [[first_id, count], ...]}:
+    the split's whole planned id range and the ranges this shard generated.
+    """
+    manifest = {"shard": shard[0], "shards": shard[1], "plan": fingerprint, "ext": ext, "splits": splits}
+    path = os.path.join(directory, MANIFEST)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(f"{path}.tmp", path)
+
+
+def load_manifests(root: str = SHARDS_DIR) -> List[Tuple[str, dict]]:
+    manifests = []
+    if not os.path.isdir(root):
+        return manifests
+    for name in sorted(os.listdir(root)):
+        path = os.path.join(root, name, MANIFEST)
+        if os.path.exists(path):
+            with open(path) as f:
+                manifests.append((os.path.join(root, name), json.load(f)))
+    return manifests
+
+
+def check_shards(root: str = SHARDS_DIR) -> Tuple[List[str], Dict[str, List[Tuple[str, int, int]]], dict]:
+    """
+    Returns (problems, ranges, reference manifest); `ranges` maps each split to
+    its (shard directory, first id, count) ranges in id order.
+    """
+    manifests = load_manifests(root)
+    if not manifests:
+        return [f"no shard manifests under {root}"], {}, {}
+    reference = manifests[0][1]
+    problems = []
+    for directory, manifest in manifests:
+        if (manifest["shards"], manifest["plan"]) != (reference["shards"], reference["plan"]):
+            problems.append(f"{directory} belongs to another build (plan {manifest['plan']}, {manifest['shards']} shards)")
+    present = {manifest["shard"] for _, manifest in manifests}
+    missing = sorted(set(range(reference["shards"])) - present)
+    if missing:
+        shards = reference["shards"]
+        problems.append(f"missing shards: {', '.join(f'{i}/{shards}' for i in missing)}")
+
+    ranges: Dict[str, List[Tuple[str, int, int]]] = {}
+    for split, planned in reference["splits"].items():
+        split_ranges = sorted(
+            (first_id, count, directory)
+            for directory, manifest in manifests
+            for first_id, count in manifest["splits"].get(split, {}).get("ranges", [])
+        )
+        expected = planned["ids"][0]
+        for first_id, count, directory in split_ranges:
+            if first_id != expected:
+                kind = "overlap" if first_id < expected else "gap"
+                problems.append(f"{split}: {kind} at id {min(first_id, expected)} ({directory})")
+            expected = max(expected, first_id + count)
+        if expected != planned["ids"][1]:
+            problems.append(f"{split}: ids {expected}..{planned['ids'][1] - 1} were not generated by any shard")
+
+        absent = 0
+        for first_id, count, directory in split_ranges:
+            images_dir, labels_dir = f"{directory}/images/{split}", f"{directory}/labels/{split}"
+            for image_id in range(first_id, first_id + count):
+                if not (
+                    os.path.exists(sample_path(images_dir, image_id, reference["ext"]))
+                    and os.path.exists(sample_path(labels_dir, image_id, "txt"))
+                ):
+                    absent += 1
+        if absent:
+            problems.append(f"{split}: {absent} planned samples have no image or label file")
+        ranges[split] = [(directory, first_id, count) for first_id, count, directory in split_ranges]
+    return problems, ranges, reference
+
+
+def _link_or_copy(source: str, target: str):
+    try:
+        os.link(source, target)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.copyfile(source, target)
+
+
+def merge_shards(
+    root: str = SHARDS_DIR,
+    images_root: str = DATASETS_IMAGES_DIR,
+    labels_root: str = DATASETS_LABELS_DIR,
+    nested: bool = False,
+    index_only: bool = False,
+    label_index: bool = False,
+) -> Dict[str, int]:
+    """Checks the shards and assembles them (see the module docstring); returns samples per split."""
+    problems, ranges, reference = check_shards(root)
+    if problems:
+        raise ValueError("\n".join(problems))
+    totals = {split: sum(count for _, _, count in split_ranges) for split, split_ranges in ranges.items()}
+
+    if index_only:
+        index = {
+            "plan": reference["plan"],
+            "ext": reference["ext"],
+            "splits": {split: [[d, first_id, count] for d, first_id, count in r] for split, r in ranges.items()},
+        }
+        with open(os.path.join(root, "index.json"), "w") as f:
+            json.dump(index, f, indent=1)
+        return totals
+
+    merged_path = os.path.join(root, "merged.json")
+    if os.path.exists(merged_path):
+        with open(merged_path) as f:
+            if json.load(f)["plan"] == reference["plan"]:
+                raise ValueError(f"plan {reference['plan']} was already merged ({merged_path})")
+
+    ext = reference["ext"]
+    starts = {}
+    for split, split_ranges in ranges.items():
+        images_dir, labels_dir = f"{images_root}/{split}", f"{labels_root}/{split}"
+        set_layout(labels_dir, set_layout(images_dir, nested))
+        set_image_ext(images_dir, ext)
+        start = IdAllocator(images_dir).reserve(totals[split])
+        offset = start - reference["splits"][split]["ids"][0]
+        starts[split] = start
+        appender = None
+        if label_index:
+            from label_index import LabelIndexAppender
+
+            appender = LabelIndexAppender(split)
+        for directory, first_id, count in split_ranges:
+            for image_id in range(first_id, first_id + count):
+                new_id = image_id + offset
+                ensure_sample_dir(images_dir, new_id)
+                ensure_sample_dir(labels_dir, new_id)
+                _link_or_copy(sample_path(f"{directory}/images/{split}", image_id, ext), sample_path(images_dir, new_id, ext))
+                label_path = sample_path(labels_dir, new_id, "txt")
+                _link_or_copy(sample_path(f"{directory}/labels/{split}", image_id, "txt"), label_path)
+                if appender:
+                    with open(label_path) as f:
+                        appender.add(new_id, f.read().splitlines())
+        if appender:
+            appender.flush()
+            from label_index import compact_index
+
+            compact_index(split)
+
+    with open(merged_path, "w") as f:
+        json.dump({"plan": reference["plan"], "first_ids": starts, "samples": totals}, f, indent=1)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["check", "merge"])
+    parser.add_argument("--shards-dir", default=SHARDS_DIR, help=f"Directory holding the shard directories (default: {SHARDS_DIR})")
+    parser.add_argument("--nested", action="store_true", help="Create new final splits with the nested layout")
+    parser.add_argument("--index-only", action="store_true", help="Write index.json instead of assembling the YOLO tree")
+    parser.add_argument("--label-index", action="store_true", help="Also add the merged samples to the label index")
+    args = parser.parse_args()
+
+    if args.command == "check":
+        problems, ranges, reference = check_shards(args.shards_dir)
+        for problem in problems:
+            print(problem)
+        if problems:
+            sys.exit(1)
+        for split, split_ranges in ranges.items():
+            print(f"{split}: {sum(count for _, _, count in split_ranges)} samples in {len(split_ranges)} ranges")
+        print(f"All {reference['shards']} shards of plan {reference['plan']} are complete.")
+        return
+
+    try:
+        totals = merge_shards(args.shards_dir, nested=args.nested, index_only=args.index_only, label_index=args.label_index)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    for split, total in totals.items():
+        print(f"{split}: {'indexed' if args.index_only else 'merged'} {total} samples")
+
+
+if __name__ == "__main__":
+    main()
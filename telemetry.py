@@ -0,0 +1,253 @@
+"""
+Live throughput telemetry of a generation run.
+
+Workers count every sample they write (and its bytes) and every task they start
+and finish in counters in shared memory, created in the parent before the pool
+forks, so the parent sees all workers without any messages. The parent then:
+  - logs a summary line every TELEMETRY_LOG_INTERVAL seconds,
+        [telemetry] 12345/40000 (30.9%) | train 10000/32000, val 2345/8000 |
+        41.2 img/s | ETA 0h11m11s | 1.05 GB written | 3 tasks queued | 16 busy, 0 stalled
+  - serves the same numbers at http://127.0.0.1:<TELEMETRY_PORT>/metrics in the
+    Prometheus text format when a port is set.
+
+Images/sec is measured over the last RATE_WINDOW seconds, and the ETA divides
+the samples still to write by it. Generation has no pipelined stages, so the
+only queue is the pool's: tasks submitted but not yet picked up. A busy worker
+that has not written a sample for STALL_SECONDS counts as stalled.
+
+A worker's samples are pending until its task finishes: a task that raises (or
+whose worker dies) drops them, so a chunk the pool re-runs is counted once.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Sequence
+
+RATE_WINDOW = 60.0  # seconds
+STALL_SECONDS = 120.0
+MAX_WORKERS = 512  # worker slots; recycled workers reuse the slots of dead ones
+
+# shared array layout: per split [planned, written, bytes], then [tasks submitted, tasks done,
+# failed attempts, tasks given up], then per worker slot [pid, busy, last sample time, samples,
+# pending split, pending samples, pending bytes] (pending: written by the running task)
+_SPLIT_FIELDS, _TASK_FIELDS, _SLOT_FIELDS = 3, 4, 7
+
+_local = threading.local()  # the calling worker's slot, claimed on its first report
+
+
+def _alive(tid: int) -> bool:
+    return os.path.exists(f"/proc/{tid}")
+
+
+def _duration(seconds: float) -> str:
+    hours, rest = divmod(int(round(seconds)), 3600)
+    return f"{hours}h{rest // 60:02d}m{rest % 60:02d}s"
+
+
+class Telemetry:
+    def __init__(self, splits: Sequence[str] = ("train", "val")):
+        self.splits = list(splits)
+        self._tasks = len(self.splits) * _SPLIT_FIELDS
+        self._slots = self._tasks + _TASK_FIELDS
+        self.values = multiprocessing.RawArray("d", self._slots + MAX_WORKERS * _SLOT_FIELDS)
+        self.lock = multiprocessing.Lock()
+        self.started = time.time()
+        self._history = deque()  # (time, samples written) within the rate window
+        self._history_lock = threading.Lock()  # snapshots come from the log thread and the HTTP handlers
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    # -- parent side ---------------------------------------------------------
+    def plan(self, split: str, samples: int):
+        """Adds `samples` to the samples the run will write to `split`."""
+        with self.lock:
+            self.values[self.splits.index(split) * _SPLIT_FIELDS] += samples
+
+    def submit(self, tasks: int):
+        with self.lock:
+            self.values[self._tasks] += tasks
+
+    def given_up(self, tasks: int):
+        """`tasks` failed every attempt and will not run again."""
+        with self.lock:
+            self.values[self._tasks + 3] += tasks
+
+    # -- worker side ---------------------------------------------------------
+    def _claim_slot(self) -> int:
+        # workers are keyed by their OS thread id: the pid of a process worker, a tid in the thread engine
+        tid = threading.get_native_id()
+        slot = getattr(_local, "slot", None)
+        if slot is not None and self.values[self._slots + slot * _SLOT_FIELDS] == tid:
+            return slot
+        with self.lock:
+            for slot in range(MAX_WORKERS):
+                base = self._slots + slot * _SLOT_FIELDS
+                owner = int(self.values[base])
+                if owner == 0 or owner == tid or not _alive(owner):
+                    self.values[base : base + _SLOT_FIELDS] = [tid, 0, time.time(), 0, -1, 0, 0]
+                    _local.slot = slot
+                    return slot
+        raise RuntimeError(f"more than {MAX_WORKERS} live workers")
+
+    def task_started(self):
+        base = self._slots + self._claim_slot() * _SLOT_FIELDS
+        self.values[base + 1 : base + 3] = [1, time.time()]
+        self.values[base + 4 : base + 7] = [-1, 0, 0]
+
+    def task_done(self, ok: bool = True):
+        """Ends the worker's task: its pending samples count as written if it succeeded, else they are dropped."""
+        base = self._slots + self._claim_slot() * _SLOT_FIELDS
+        with self.lock:
+            split, samples, nbytes = self.values[base + 4 : base + 7]
+            if ok and split >= 0:
+                offset = int(split) * _SPLIT_FIELDS
+                self.values[offset + 1] += samples
+                self.values[offset + 2] += nbytes
+            self.values[self._tasks + (1 if ok else 2)] += 1
+            self.values[base + 1] = 0
+            self.values[base + 4 : base + 7] = [-1, 0, 0]
+
+    def sample_written(self, split: str, nbytes: int):
+        base = self._slots + self._claim_slot() * _SLOT_FIELDS
+        self.values[base + 2] = time.time()
+        self.values[base + 3] += 1
+        # a task writes to one split; the slot is only written by its own worker
+        self.values[base + 4] = self.splits.index(split)
+        self.values[base + 5] += 1
+        self.values[base + 6] += nbytes
+
+    # -- reporting -----------------------------------------------------------
+    def snapshot(self) -> dict:
+        now = time.time()
+        with self.lock:
+            values = list(self.values)
+        splits = {
+            split: dict(zip(("planned", "written", "bytes"), values[i * _SPLIT_FIELDS : (i + 1) * _SPLIT_FIELDS]))
+            for i, split in enumerate(self.splits)
+        }
+        workers = {}
+        for slot in range(MAX_WORKERS):
+            base = self._slots + slot * _SLOT_FIELDS
+            tid, busy, last, samples, pending_split, pending, pending_bytes = values[base : base + _SLOT_FIELDS]
+            if tid and _alive(int(tid)):
+                workers[int(tid)] = {"busy": bool(busy), "idle_seconds": now - last, "samples": samples}
+                # samples of running tasks show up live; a dead worker's never will
+                if busy and pending_split >= 0:
+                    split = splits[self.splits[int(pending_split)]]
+                    split["written"] += pending
+                    split["bytes"] += pending_bytes
+        busy = [w for w in workers.values() if w["busy"]]
+        planned = sum(split["planned"] for split in splits.values())
+        written = sum(split["written"] for split in splits.values())
+
+        with self._history_lock:
+            self._history.append((now, written))
+            while len(self._history) > 2 and now - self._history[1][0] >= RATE_WINDOW:
+                self._history.popleft()
+            first_time, first_written = self._history[0]
+        rate = max(0.0, written - first_written) / (now - first_time) if now > first_time else 0.0
+        return {
+            "elapsed": now - self.started,
+            "splits": splits,
+            "planned": planned,
+            "written": written,
+            "bytes": sum(split["bytes"] for split in splits.values()),
+            "rate": rate,
+            "eta": (planned - written) / rate if rate > 0 else None,
+            "tasks_queued": max(0, values[self._tasks] - values[self._tasks + 1] - values[self._tasks + 3] - len(busy)),
+            "tasks_done": values[self._tasks + 1],
+            "tasks_failed": values[self._tasks + 2],
+            "workers": workers,
+            "busy": len(busy),
+            "stalled": sum(w["idle_seconds"] > STALL_SECONDS for w in busy),
+        }
+
+    def log_line(self, snapshot: Optional[dict] = None) -> str:
+        s = snapshot or self.snapshot()
+        percent = 100 * s["written"] / s["planned"] if s["planned"] else 0.0
+        per_split = ", ".join(f"{name} {v['written']:.0f}/{v['planned']:.0f}" for name, v in s["splits"].items())
+        eta = _duration(s["eta"]) if s["eta"] is not None else "-"
+        return (
+            f"[telemetry] {s['written']:.0f}/{s['planned']:.0f} ({percent:.1f}%) | {per_split} | "
+            f"{s['rate']:.1f} img/s | ETA {eta} | {s['bytes'] / 1e9:.2f} GB written | "
+            f"{s['tasks_queued']:.0f} tasks queued | {s['busy']} busy, {s['stalled']} stalled"
+        )
+
+    def prometheus(self, snapshot: Optional[dict] = None) -> str:
+        s = snapshot or self.snapshot()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP chessgen_{name} {help_text}")
+            lines.append(f"# TYPE chessgen_{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{val}"' for key, val in labels.items())
+                lines.append(f"chessgen_{name}{{{label_text}}} {value}" if label_text else f"chessgen_{name} {value}")
+
+        splits = s["splits"].items()
+        metric("samples_planned", "gauge", "Samples the run will write.", [({"split": n}, v["planned"]) for n, v in splits])
+        # gauges: the samples of a task that fails are taken back out
+        metric("samples_written", "gauge", "Samples written.", [({"split": n}, v["written"]) for n, v in splits])
+        metric("bytes_written", "gauge", "Encoded image and label bytes written.", [({"split": n}, v["bytes"]) for n, v in splits])
+        metric("images_per_second", "gauge", f"Samples written per second over the last {RATE_WINDOW:.0f}s.", [({}, s["rate"])])
+        metric("eta_seconds", "gauge", "Estimated seconds until every planned sample is written.", [({}, s["eta"] if s["eta"] is not None else "NaN")])
+        metric("elapsed_seconds", "gauge", "Seconds since the run started.", [({}, s["elapsed"])])
+        metric("tasks_queued", "gauge", "Pool tasks submitted but not started.", [({}, s["tasks_queued"])])
+        metric("tasks_done_total", "counter", "Pool tasks finished.", [({}, s["tasks_done"])])
+        metric("task_failures_total", "counter", "Task attempts that raised (re-run or given up by the pool).", [({}, s["tasks_failed"])])
+        metric("workers_busy", "gauge", "Workers running a task.", [({}, s["busy"])])
+        metric("workers_stalled", "gauge", f"Busy workers without a sample for {STALL_SECONDS:.0f}s.", [({}, s["stalled"])])
+        metric(
+            "worker_idle_seconds", "gauge", "Seconds since the worker last started a task or wrote a sample.",
+            [({"worker": tid}, w["idle_seconds"]) for tid, w in s["workers"].items()],
+        )
+        return "\n".join(lines) + "\n"
+
+    def start(self, log_interval: Optional[float] = None, port: Optional[int] = None):
+        """Starts the log thread and/or the /metrics endpoint on 127.0.0.1:`port`."""
+        self.snapshot()
+        if log_interval:
+            thread = threading.Thread(target=self._log_loop, args=(log_interval,), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        if port is not None:
+            telemetry = self
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split("?")[0] != "/metrics":
+                        self.send_error(404)
+                        return
+                    body = telemetry.prometheus().encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+
+            self._server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+            thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+            print(f"Telemetry: http://127.0.0.1:{self._server.server_address[1]}/metrics")
+
+    def _log_loop(self, interval: float):
+        while not self._stop.wait(interval):
+            print(self.log_line(), flush=True)
+
+    def stop(self):
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        for thread in self._threads:
+            thread.join()
+        print(self.log_line())
@@ -0,0 +1,252 @@
+"""
+Fixed-shape memory-mapped tensor export of a dataset split.
+
+Each split lives in `datasets/tensors/<split>/`:
+  - images.u8    raw (N, H, W, 3) uint8 array, row i = sample i
+  - labels.npy   float32 (M, 5) YOLO rows [class, xc, yc, w, h] of all samples
+  - offsets.npy  int64 (N + 1,), labels of sample i are labels[offsets[i]:offsets[i + 1]]
+  - ids.npy      uint32 (N,), the sample's image id in the JPEG tree
+  - meta.json    {"count", "height", "width"}
+
+A training loader slices batches straight out of the images memmap: no JPEG
+decoding and no per-sample file opens. Pixels are stored after the same
+JPEG round trip the JPEG tree goes through (quality 92, or the sample's own
+degraded bytes when JPEG compression was its last augmentation), so the
+stored images look exactly like what a loader would have decoded from disk.
+
+`generate_datasets.py` (TENSOR_EXPORT) writes here instead of the JPEG tree;
+`convert` builds a split from an existing `datasets/images` + `datasets/labels`
+tree.
+
+Usage:
+    python tensor_export.py convert
+    python tensor_export.py convert --split val --workers 8
+    python tensor_export.py info
+"""
+
+import argparse
+import io
+import json
+import multiprocessing
+import os
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from dataset_layout import IMAGE_EXTS, image_path, iter_sample_entries, sample_path
+
+DATASETS_IMAGES_DIR = "datasets/images"
+DATASETS_LABELS_DIR = "datasets/labels"
+DATASETS_TENSORS_DIR = "datasets/tensors"
+SPLITS = ["train", "val"]
+
+IMAGE_SIZE = 640
+JPEG_QUALITY = 92  # quality of the JPEG tree's final save
+SAMPLES_PER_CHUNK = 256
+
+
+def split_dir(split: str, root: str = DATASETS_TENSORS_DIR) -> str:
+    return os.path.join(root, split)
+
+
+def jpeg_roundtrip(image: Image.Image, quality: int = JPEG_QUALITY) -> np.ndarray:
+    """Encodes and decodes `image` as the final JPEG save would, returning HxWx3 uint8."""
+    if getattr(image, "encoded_jpeg", None) is not None:
+        # already JPEG-degraded as its last step: the final save writes these bytes as they are
+        return np.asarray(image.convert("RGB"))
+    buffer = io.BytesIO()
+    image.convert("RGB").save(buffer, "JPEG", quality=quality)
+    buffer.seek(0)
+    with Image.open(buffer) as decoded:
+        return np.asarray(decoded.convert("RGB"))
+
+
+def label_rows(lines: Iterable[str]) -> np.ndarray:
+    """Parses YOLO label lines into a float32 (K, 5) array, skipping malformed ones."""
+    rows = []
+    for line in lines:
+        tokens = line.split()
+        if len(tokens) != 5:
+            continue
+        try:
+            rows.append([float(t) for t in tokens])
+        except ValueError:
+            continue
+    return np.array(rows, dtype=np.float32).reshape(-1, 5)
+
+
+def load_meta(directory: str) -> dict:
+    path = os.path.join(directory, "meta.json")
+    if not os.path.exists(path):
+        return {"count": 0, "height": IMAGE_SIZE, "width": IMAGE_SIZE}
+    with open(path) as f:
+        return json.load(f)
+
+
+def open_images(directory: str, mode: str = "r") -> np.memmap:
+    """Memory-maps the whole images file (including reserved, not yet committed rows)."""
+    meta = load_meta(directory)
+    row_bytes = meta["height"] * meta["width"] * 3
+    rows = os.path.getsize(os.path.join(directory, "images.u8")) // row_bytes
+    return np.memmap(
+        os.path.join(directory, "images.u8"), dtype=np.uint8, mode=mode,
+        shape=(rows, meta["height"], meta["width"], 3),
+    )
+
+
+def load_split(split: str, root: str = DATASETS_TENSORS_DIR) -> Tuple[np.memmap, np.ndarray, np.ndarray, np.ndarray]:
+    """Returns (images memmap, labels, offsets, ids) of an exported split."""
+    directory = split_dir(split, root)
+    count = load_meta(directory)["count"]
+    images = open_images(directory)[:count]
+    labels = np.load(os.path.join(directory, "labels.npy"))
+    offsets = np.load(os.path.join(directory, "offsets.npy"))
+    ids = np.load(os.path.join(directory, "ids.npy"))
+    return images, labels, offsets, ids
+
+
+class TensorSplitWriter:
+    """
+    Parent-process side of an export: reserves rows in the images file for a
+    batch of samples and commits their labels once the batch is written.
+    Workers fill reserved rows through `TensorRowWriter`.
+    """
+
+    def __init__(self, directory: str, height: int = IMAGE_SIZE, width: int = IMAGE_SIZE):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        meta = load_meta(directory)
+        if meta["count"] and (meta["height"], meta["width"]) != (height, width):
+            raise ValueError(f"{directory} holds {meta['width']}x{meta['height']} images, not {width}x{height}")
+        self.height, self.width = height, width
+        self.count = meta["count"]
+        if self.count:
+            self.labels = [np.load(os.path.join(directory, "labels.npy"))]
+            self.offsets = np.load(os.path.join(directory, "offsets.npy"))
+            self.ids = np.load(os.path.join(directory, "ids.npy"))
+        else:
+            self.labels = []
+            self.offsets = np.zeros(1, dtype=np.int64)
+            self.ids = np.zeros(0, dtype=np.uint32)
+        self._write_meta()
+
+    @property
+    def row_bytes(self) -> int:
+        return self.height * self.width * 3
+
+    def reserve(self, n: int) -> int:
+        """Preallocates `n` rows after the committed ones and returns the first row index."""
+        with open(os.path.join(self.directory, "images.u8"), "ab") as f:
+            f.truncate((self.count + n) * self.row_bytes)
+        return self.count
+
+    def commit(self, samples: Iterable[Tuple[int, int, np.ndarray]]):
+        """Commits (row, image id, labels) of rows filled since the last commit, in any order."""
+        samples = sorted(samples, key=lambda sample: sample[0])
+        rows = np.array([row for row, _, _ in samples], dtype=np.int64)
+        if len(rows) and not np.array_equal(rows, np.arange(self.count, self.count + len(rows))):
+            raise ValueError("committed rows must be exactly the next reserved rows")
+        counts = np.array([len(labels) for _, _, labels in samples], dtype=np.int64)
+        self.labels.extend(labels for _, _, labels in samples)
+        self.offsets = np.concatenate([self.offsets, self.offsets[-1] + np.cumsum(counts)])
+        self.ids = np.concatenate([self.ids, np.array([image_id for _, image_id, _ in samples], dtype=np.uint32)])
+        self.count += len(samples)
+        self._flush()
+
+    def _flush(self):
+        labels = np.concatenate(self.labels) if self.labels else np.zeros((0, 5), dtype=np.float32)
+        self.labels = [labels]
+        for name, array in (("labels", labels), ("offsets", self.offsets), ("ids", self.ids)):
+            path = os.path.join(self.directory, f"{name}.npy")
+            np.save(f"{path}.tmp.npy", array)
+            os.replace(f"{path}.tmp.npy", path)
+        with open(os.path.join(self.directory, "images.u8"), "ab") as f:
+            f.truncate(self.count * self.row_bytes)  # drop reserved rows that were never committed
+        self._write_meta()
+
+    def _write_meta(self):
+        path = os.path.join(self.directory, "meta.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump({"count": self.count, "height": self.height, "width": self.width}, f)
+        os.replace(f"{path}.tmp", path)
+
+
+class TensorRowWriter:
+    """Worker-process side: writes samples into reserved rows and collects their labels."""
+
+    def __init__(self, directory: str):
+        self.images = open_images(directory, mode="r+")
+        self.samples: List[Tuple[int, int, np.ndarray]] = []
+
+    def write(self, row: int, image: Image.Image, lines: Iterable[str], image_id: Optional[int] = None):
+        self.images[row] = jpeg_roundtrip(image)
+        self.samples.append((row, row if image_id is None else image_id, label_rows(lines)))
+
+    def close(self) -> List[Tuple[int, int, np.ndarray]]:
+        self.images.flush()
+        return self.samples
+
+
+def _convert_chunk(args) -> List[Tuple[int, int, np.ndarray]]:
+    directory, split, rows_and_ids = args
+    images = open_images(directory, mode="r+")
+    height, width = images.shape[1:3]
+    samples = []
+    for row, image_id in rows_and_ids:
+        with Image.open(image_path(f"{DATASETS_IMAGES_DIR}/{split}", image_id)) as img:
+            img = img.convert("RGB")
+            if img.size != (width, height):
+                img = img.resize((width, height), Image.BILINEAR)
+            images[row] = np.asarray(img)  # already JPEG-degraded, stored as decoded
+        with open(sample_path(f"{DATASETS_LABELS_DIR}/{split}", image_id, "txt")) as f:
+            samples.append((row, image_id, label_rows(f)))
+    images.flush()
+    return samples
+
+
+def convert_split(split: str, root: str = DATASETS_TENSORS_DIR, workers: Optional[int] = None) -> int:
+    """Rebuilds a split's tensors from the JPEG tree (samples with both image and label)."""
+    image_ids = {image_id for image_id, _ in iter_sample_entries(f"{DATASETS_IMAGES_DIR}/{split}", IMAGE_EXTS)}
+    label_ids = {image_id for image_id, _ in iter_sample_entries(f"{DATASETS_LABELS_DIR}/{split}", "txt")}
+    ids = sorted(image_ids & label_ids)
+
+    directory = split_dir(split, root)
+    for name in ("images.u8", "labels.npy", "offsets.npy", "ids.npy", "meta.json"):
+        if os.path.exists(os.path.join(directory, name)):
+            os.remove(os.path.join(directory, name))
+    writer = TensorSplitWriter(directory)
+    start = writer.reserve(len(ids))
+    rows = list(enumerate(ids, start))
+    chunks = [(directory, split, rows[i:i + SAMPLES_PER_CHUNK]) for i in range(0, len(rows), SAMPLES_PER_CHUNK)]
+
+    samples = []
+    if chunks:
+        num_workers = workers or max(1, multiprocessing.cpu_count())
+        with multiprocessing.Pool(num_workers) as pool:
+            for chunk_samples in pool.imap_unordered(_convert_chunk, chunks):
+                samples.extend(chunk_samples)
+    writer.commit(samples)
+    return writer.count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["convert", "info"])
+    parser.add_argument("--split", choices=SPLITS, default=None, help="Only this split (default: all)")
+    parser.add_argument("--out", default=DATASETS_TENSORS_DIR, help=f"Tensor root directory (default: {DATASETS_TENSORS_DIR})")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes for convert (default: cpu count)")
+    args = parser.parse_args()
+
+    splits = [args.split] if args.split else SPLITS
+    for split in splits:
+        if args.command == "convert":
+            print(f"{split}: converted {convert_split(split, args.out, args.workers)} samples")
+        else:
+            images, labels, offsets, _ = load_split(split, args.out)
+            size_gb = images.size / 1e9
+            print(f"{split}: {len(images)} samples {images.shape[1:]} ({size_gb:.2f} GB), {len(labels)} label rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+Texture ingestion and a memory-mappable mip pyramid cache.
+
+Finds the albedo/diffuse/color map of every texture pack (plain image files or
+`.zip` downloads), decodes them in parallel and stores each one as a pyramid
+of raw uint8 `.npy` levels (full size, 1/2, 1/4, ... down to MIN_LEVEL_SIZE)
+under `assets/texture_cache/`. Board generation memory-maps the levels, so a
+crop only reads the pages it touches and no PNG is decoded at generation time;
+the page cache is shared by every worker process.
+
+Textures whose source file is unchanged since the last run are skipped.
+`assets/a.sh` still extracts packs through 7z (any archive format it reads)
+into a `picked/` directory, optionally downscaled with RESIZE=<px>; point this
+script at that directory to ingest them.
+
+Usage:
+    python texture_cache.py                       # ingest assets/textures
+    python texture_cache.py ~/Downloads/*.zip --extract-to assets/textures
+    python texture_cache.py --rebuild
+"""
+
+import argparse
+import io
+import json
+import math
+import multiprocessing
+import os
+import random
+import re
+import shutil
+import zipfile
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+TEXTURES_DIR = "assets/textures"
+TEXTURE_CACHE_DIR = "assets/texture_cache"
+MIN_BASE_SIZE = 640  # level 0 is upscaled to at least a full board
+MIN_LEVEL_SIZE = 256
+
+IMAGE_EXTS = (".png", ".jpg", ".jpeg")
+ALBEDO_RE = re.compile(r"diffuse|albedo|_color|basecolor", re.IGNORECASE)
+NOT_ALBEDO_RE = re.compile(r"normal|_ao|ambient|displace|specular|rough|metal|height|bump", re.IGNORECASE)
+
+Job = Tuple[str, str, Optional[str]]  # (texture name, source path, zip member)
+
+
+def pick_albedo(names: List[str]) -> Optional[str]:
+    """Picks the diffuse/albedo/color map out of a texture pack's file names."""
+    for name in sorted(names):
+        if name.lower().endswith(IMAGE_EXTS) and ALBEDO_RE.search(name) and not NOT_ALBEDO_RE.search(name):
+            return name
+    return None
+
+
+def find_textures(sources: List[str]) -> List[Job]:
+    """Expands image files, directories and .zip packs into ingestion jobs."""
+    jobs: List[Job] = []
+    for source in sources:
+        if os.path.isdir(source):
+            paths = sorted(os.path.join(source, name) for name in os.listdir(source))
+        else:
+            paths = [source]
+        for path in paths:
+            if path.lower().endswith(".zip"):
+                try:
+                    with zipfile.ZipFile(path) as zf:
+                        member = pick_albedo(zf.namelist())
+                except zipfile.BadZipFile:
+                    print(f"  Bad zip, skipping: {path}")
+                    continue
+                if member is None:
+                    print(f"  No diffuse/albedo map found in {path}, skipping.")
+                    continue
+                stem = os.path.splitext(os.path.basename(path))[0]
+                jobs.append((stem + os.path.splitext(member)[1].lower(), path, member))
+            elif path.lower().endswith(IMAGE_EXTS):
+                jobs.append((os.path.basename(path), path, None))
+    return jobs
+
+
+def _signature(path: str) -> List[int]:
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _level_dir(cache_dir: str, name: str) -> str:
+    return os.path.join(cache_dir, re.sub(r"[^\w.-]", "_", name))
+
+
+def build_pyramid(image: Image.Image, min_base: int = MIN_BASE_SIZE, min_level: int = MIN_LEVEL_SIZE) -> List[np.ndarray]:
+    image = image.convert("RGB")
+    if min(image.size) < min_base:
+        scale = min_base / min(image.size)
+        image = image.resize((math.ceil(image.width * scale), math.ceil(image.height * scale)), Image.BICUBIC)
+    levels = [np.asarray(image)]
+    while min(image.size) // 2 >= min_level:
+        image = image.reduce(2)
+        levels.append(np.asarray(image))
+    return levels
+
+
+def _ingest_one(args) -> Tuple[str, Optional[dict], Optional[str]]:
+    """Pool worker: decodes one texture and writes its pyramid levels."""
+    (name, path, member), cache_dir, extract_to = args
+    try:
+        if member is None:
+            image = Image.open(path)
+        else:
+            with zipfile.ZipFile(path) as zf:
+                data = zf.read(member)
+            image = Image.open(io.BytesIO(data))
+            if extract_to:
+                with open(os.path.join(extract_to, name), "wb") as f:
+                    f.write(data)
+        with image:
+            levels = build_pyramid(image)
+    except (OSError, zipfile.BadZipFile) as e:
+        return name, None, str(e)
+
+    level_dir = _level_dir(cache_dir, name)
+    os.makedirs(level_dir, exist_ok=True)
+    for k, level in enumerate(levels):
+        np.save(os.path.join(level_dir, f"L{k}.npy"), level)
+    entry = {
+        "dir": os.path.basename(level_dir),
+        "source": path,
+        "member": member,
+        "signature": _signature(path),
+        "levels": [list(level.shape[:2]) for level in levels],
+    }
+    return name, entry, None
+
+
+def ingest_textures(
+    sources: List[str],
+    cache_dir: str = TEXTURE_CACHE_DIR,
+    extract_to: Optional[str] = None,
+    rebuild: bool = False,
+    workers: Optional[int] = None,
+) -> Dict[str, int]:
+    """Adds new or changed textures from `sources` to the cache."""
+    os.makedirs(cache_dir, exist_ok=True)
+    if extract_to:
+        os.makedirs(extract_to, exist_ok=True)
+    index = {} if rebuild else TextureCache(cache_dir).index
+
+    todo = []
+    for job in find_textures(sources):
+        name, path, member = job
+        entry = index.get(name)
+        if entry is not None and entry["source"] == path and entry["member"] == member and entry["signature"] == _signature(path):
+            continue
+        todo.append((job, cache_dir, extract_to))
+
+    failed = 0
+    if todo:
+        num_workers = workers or max(1, multiprocessing.cpu_count())
+        with multiprocessing.Pool(min(num_workers, len(todo))) as pool:
+            for name, entry, error in pool.imap_unordered(_ingest_one, todo):
+                if entry is None:
+                    print(f"  Failed to decode {name}: {error}")
+                    failed += 1
+                    continue
+                index[name] = entry
+                print(f"  {name}: {len(entry['levels'])} levels, base {entry['levels'][0][1]}x{entry['levels'][0][0]}")
+
+    index_path = os.path.join(cache_dir, "index.json")
+    with open(f"{index_path}.tmp", "w") as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+    os.replace(f"{index_path}.tmp", index_path)
+    return {"ingested": len(todo) - failed, "failed": failed, "total": len(index)}
+
+
+class TextureCache:
+    """Read side of the cache: memory-mapped pyramid levels, opened lazily per process."""
+
+    def __init__(self, cache_dir: str = TEXTURE_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.index: Dict[str, dict] = {}
+        index_path = os.path.join(cache_dir, "index.json")
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                self.index = json.load(f)
+        self._levels: Dict[Tuple[str, int], np.ndarray] = {}
+
+    def __getstate__(self):
+        # sent to pool workers with every task: pass the index, not the mapped arrays
+        state = self.__dict__.copy()
+        state["_levels"] = {}
+        return state
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def names(self) -> List[str]:
+        return sorted(self.index)
+
+    def level(self, name: str, k: int) -> np.ndarray:
+        array = self._levels.get((name, k))
+        if array is None:
+            path = os.path.join(self.cache_dir, self.index[name]["dir"], f"L{k}.npy")
+            array = np.load(path, mmap_mode="r")
+            self._levels[(name, k)] = array
+        return array
+
+    def crop(self, name: str, size: int, scale: float = 1.0, rng=random) -> np.ndarray:
+        """
+        Random (size, size, 3) crop covering `size * scale` full-resolution texels,
+        read from the smallest pyramid level that still has enough detail; the
+        position is drawn from `rng`.
+        """
+        levels = self.index[name]["levels"]
+        span = size * max(scale, 1e-6)
+        base_h, base_w = levels[0]
+        span = min(span, base_h, base_w)
+        k = 0
+        while k + 1 < len(levels) and span / 2 ** (k + 1) >= size:
+            k += 1
+        h, w = levels[k]
+        region = min(h, w, max(1, round(span / 2 ** k)))
+        x = rng.randint(0, w - region)
+        y = rng.randint(0, h - region)
+        patch = np.ascontiguousarray(self.level(name, k)[y:y + region, x:x + region])
+        if region != size:
+            patch = np.asarray(Image.fromarray(patch).resize((size, size), Image.BILINEAR))
+        return patch
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sources", nargs="*", default=[TEXTURES_DIR], help=f"Image files, directories or .zip packs (default: {TEXTURES_DIR})")
+    parser.add_argument("--cache-dir", default=TEXTURE_CACHE_DIR, help=f"Pyramid cache directory (default: {TEXTURE_CACHE_DIR})")
+    parser.add_argument("--extract-to", default=None, help="Also copy the albedo maps picked from .zip packs to this directory")
+    parser.add_argument("--rebuild", action="store_true", help="Re-ingest every texture and drop cache entries not in sources")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: cpu count)")
+    args = parser.parse_args()
+
+    if args.rebuild and os.path.isdir(args.cache_dir):
+        shutil.rmtree(args.cache_dir)
+    result = ingest_textures(args.sources, args.cache_dir, args.extract_to, args.rebuild, args.workers)
+    print(f"Ingested {result['ingested']} textures ({result['failed']} failed), {result['total']} in {args.cache_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Thread-local stand-ins for the `random` module and `numpy.random`.
+
+The generator draws everything from the module-level RNGs (`random.randint`,
+`np.random.normal`, ...) and `render_sample` reseeds them per sample, which
+only works while one thread renders per process. `random` and `np_random`
+below are drop-in proxies for those module-level functions that dispatch to an
+RNG of the calling thread:
+  - the main thread gets the process-wide instances (`random`'s hidden
+    `Random` and numpy's global `RandomState`), so single-threaded code and
+    the process pool behave exactly as with the plain modules;
+  - every other thread gets its own `random.Random` / `np.random.RandomState`,
+    seeded from os.urandom when the thread first uses it.
+
+Only generate_datasets.py imports them, for the thread engine. The helper
+modules it draws through (random_fen_gen, procedural_boards, texture_cache,
+noise_bank) keep the plain modules as their default and take the proxies as
+an `rng` argument from it.
+"""
+
+import os
+import random as _random
+import threading
+
+import numpy as np
+
+
+class _ThreadLocalRNG(threading.local):
+    def __init__(self, main, factory):
+        self._main = main
+        self._factory = factory
+        self._rng = None
+
+    def get(self):
+        if self._rng is None:
+            if threading.current_thread() is threading.main_thread():
+                self._rng = self._main
+            else:
+                self._rng = self._factory(int.from_bytes(os.urandom(4), "little"))
+        return self._rng
+
+
+class _Proxy:
+    def __init__(self, main, factory):
+        object.__setattr__(self, "_local", _ThreadLocalRNG(main, factory))
+
+    def __getattr__(self, name):
+        return getattr(self._local.get(), name)
+
+
+random = _Proxy(_random._inst, _random.Random)
+np_random = _Proxy(np.random.mtrand._rand, np.random.RandomState)
@@ -0,0 +1,279 @@
+"""
+Validates a generated YOLO dataset tree and lints its labels.
+
+Checks, per sample id:
+  - orphan images (no label file) and orphan labels (no image)
+  - images that no longer decode
+  - empty label files, malformed lines, unknown class ids
+  - out-of-range coordinates and zero-area boxes
+  - piece boxes that fall outside the board-class ("12") box
+
+Splits are scanned in parallel, labels are parsed and checked as whole numpy
+arrays per chunk of samples, and results are cached by file mtime so re-runs
+only re-check files that changed.
+
+Usage:
+    python validate_dataset.py
+    python validate_dataset.py --split val --report val_report.json
+    python validate_dataset.py --no-cache --skip-decode
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from dataset_layout import IMAGE_EXTS, image_path, iter_sample_entries, sample_path
+
+DATASETS_IMAGES_DIR = "datasets/images"
+DATASETS_LABELS_DIR = "datasets/labels"
+VALIDATION_CACHE_DIR = "datasets/.validation_cache"
+VALIDATION_REPORT = "datasets/validation_report.json"
+SPLITS = ["train", "val"]
+
+NUM_CLASSES = 13
+BOARD_CLASS = 12
+COORD_TOLERANCE = 1e-4
+ENCLOSURE_TOLERANCE = 2e-3
+SAMPLES_PER_CHUNK = 2000
+
+
+def scan_split(split: str) -> Dict[str, list]:
+    """Maps every sample id of a split to [image_mtime_ns, label_mtime_ns] (None if missing)."""
+    samples: Dict[str, list] = {}
+    for kind, root, ext in ((0, DATASETS_IMAGES_DIR, IMAGE_EXTS), (1, DATASETS_LABELS_DIR, "txt")):
+        for image_id, entry in iter_sample_entries(f"{root}/{split}", ext):
+            samples.setdefault(str(image_id), [None, None])[kind] = entry.stat().st_mtime_ns
+    return samples
+
+
+def _check_labels(ids: List[str], texts: List[str], issues: Dict[str, list]):
+    """Vectorized lint of the label files of one chunk."""
+    file_idx, line_no, rows = [], [], []
+    for i, text in enumerate(texts):
+        lines = [l for l in text.splitlines() if l.strip()]
+        if not lines:
+            issues[ids[i]].append({"code": "empty_label"})
+            continue
+        for n, line in enumerate(lines):
+            tokens = line.split()
+            if len(tokens) != 5:
+                issues[ids[i]].append({"code": "malformed_line", "line": n, "text": line})
+                continue
+            file_idx.append(i)
+            line_no.append(n)
+            rows.append(tokens)
+
+    if not rows:
+        return
+
+    try:
+        values = np.array(rows, dtype=np.float64)
+    except ValueError:
+        # fall back to row-by-row parsing to pinpoint the bad lines
+        parsed, keep = [], []
+        for k, tokens in enumerate(rows):
+            try:
+                parsed.append([float(t) for t in tokens])
+                keep.append(k)
+            except ValueError:
+                issues[ids[file_idx[k]]].append(
+                    {"code": "malformed_line", "line": line_no[k], "text": " ".join(tokens)}
+                )
+        if not parsed:
+            return
+        values = np.array(parsed, dtype=np.float64)
+        file_idx = [file_idx[k] for k in keep]
+        line_no = [line_no[k] for k in keep]
+
+    file_idx = np.asarray(file_idx)
+    line_no = np.asarray(line_no)
+    cls, xc, yc, w, h = values.T
+    x1, y1, x2, y2 = xc - w / 2, yc - h / 2, xc + w / 2, yc + h / 2
+
+    bad_class = (cls != np.round(cls)) | (cls < 0) | (cls >= NUM_CLASSES)
+    zero_area = (w <= 0) | (h <= 0)
+    lo, hi = -COORD_TOLERANCE, 1 + COORD_TOLERANCE
+    out_of_range = (
+        (xc < lo) | (xc > hi) | (yc < lo) | (yc > hi) | (w > hi) | (h > hi)
+        | (x1 < lo) | (y1 < lo) | (x2 > hi) | (y2 > hi)
+    )
+
+    # board box per file (first one wins), NaN where a file has none
+    n_files = len(texts)
+    board = np.full((n_files, 4), np.nan)
+    is_board = cls == BOARD_CLASS
+    board_rows = np.flatnonzero(is_board)[::-1]  # reversed so the first row is written last
+    board[file_idx[board_rows]] = np.stack([x1, y1, x2, y2], axis=1)[board_rows]
+    piece_board = board[file_idx]
+    has_board = ~np.isnan(piece_board[:, 0])
+    t = ENCLOSURE_TOLERANCE
+    outside = has_board & ~is_board & (
+        (x1 < piece_board[:, 0] - t) | (y1 < piece_board[:, 1] - t)
+        | (x2 > piece_board[:, 2] + t) | (y2 > piece_board[:, 3] + t)
+    )
+
+    for code, mask in (
+        ("bad_class", bad_class),
+        ("zero_area", zero_area),
+        ("out_of_range", out_of_range),
+        ("outside_board", outside & ~zero_area),
+    ):
+        for k in np.flatnonzero(mask):
+            issues[ids[file_idx[k]]].append({"code": code, "line": int(line_no[k])})
+
+
+def validate_chunk(args) -> Dict[str, list]:
+    """Pool worker: validates one chunk of samples and returns {id: [issue, ...]}."""
+    split, chunk, check_decode = args
+    issues: Dict[str, list] = {sample_id: [] for sample_id, _, _ in chunk}
+    label_ids, label_texts = [], []
+
+    for sample_id, has_image, has_label in chunk:
+        img_path = image_path(f"{DATASETS_IMAGES_DIR}/{split}", sample_id)
+        lbl_path = sample_path(f"{DATASETS_LABELS_DIR}/{split}", sample_id, "txt")
+        if not has_label:
+            issues[sample_id].append({"code": "orphan_image"})
+        if not has_image:
+            issues[sample_id].append({"code": "orphan_label"})
+        elif check_decode:
+            try:
+                with Image.open(img_path) as img:
+                    img.draft("RGB", (img.width // 8, img.height // 8))
+                    img.load()
+            except Exception as e:
+                issues[sample_id].append({"code": "undecodable_image", "error": str(e)})
+        if has_label:
+            try:
+                with open(lbl_path) as f:
+                    label_texts.append(f.read())
+                label_ids.append(sample_id)
+            except OSError as e:
+                issues[sample_id].append({"code": "unreadable_label", "error": str(e)})
+
+    _check_labels(label_ids, label_texts, issues)
+    return issues
+
+
+def _load_cache(split: str) -> dict:
+    path = os.path.join(VALIDATION_CACHE_DIR, f"{split}.json")
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(split: str, cache: dict):
+    os.makedirs(VALIDATION_CACHE_DIR, exist_ok=True)
+    path = os.path.join(VALIDATION_CACHE_DIR, f"{split}.json")
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(cache, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def validate_splits(
+    splits: List[str],
+    use_cache: bool = True,
+    check_decode: bool = True,
+    workers: Optional[int] = None,
+) -> dict:
+    """Validates the given splits and returns the machine-readable report."""
+    report = {"splits": {}, "totals": {}}
+    per_split: Dict[str, Tuple[dict, dict, list]] = {}
+    tasks = []
+
+    for split in splits:
+        samples = scan_split(split)
+        cache = _load_cache(split) if use_cache else {}
+        fresh = {}
+        stale = []
+        for sample_id, mtimes in samples.items():
+            cached = cache.get(sample_id)
+            if cached is not None and cached[0] == mtimes and (cached[2] or not check_decode):
+                fresh[sample_id] = cached
+            else:
+                stale.append((sample_id, mtimes[0] is not None, mtimes[1] is not None))
+        per_split[split] = (samples, fresh, stale)
+        for start in range(0, len(stale), SAMPLES_PER_CHUNK):
+            tasks.append((split, stale[start:start + SAMPLES_PER_CHUNK], check_decode))
+
+    num_workers = workers or max(1, multiprocessing.cpu_count())
+    results = {split: {} for split in splits}
+    if tasks:
+        with multiprocessing.Pool(num_workers) as pool:
+            for split_issues, (split, _, _) in zip(pool.imap(validate_chunk, tasks), tasks):
+                results[split].update(split_issues)
+
+    for split in splits:
+        samples, fresh, stale = per_split[split]
+        # cache entry: [[image_mtime, label_mtime], issues, decode_checked]
+        cache = dict(fresh)
+        for sample_id, issue_list in results[split].items():
+            cache[sample_id] = [samples[sample_id], issue_list, check_decode]
+        if use_cache:
+            _save_cache(split, cache)
+
+        by_code: Dict[str, list] = {}
+        details: Dict[str, list] = {}
+        for sample_id, (_, issue_list, _) in cache.items():
+            if not issue_list:
+                continue
+            details[sample_id] = issue_list
+            for code in sorted({issue["code"] for issue in issue_list}):
+                by_code.setdefault(code, []).append(sample_id)
+        for ids in by_code.values():
+            ids.sort(key=int)
+
+        report["splits"][split] = {
+            "samples": len(samples),
+            "checked": len(stale),
+            "cached": len(fresh),
+            "bad_samples": len(details),
+            "issue_counts": {code: len(ids) for code, ids in sorted(by_code.items())},
+            "issue_ids": dict(sorted(by_code.items())),
+            "details": dict(sorted(details.items(), key=lambda item: int(item[0]))),
+        }
+        for code, ids in by_code.items():
+            report["totals"][code] = report["totals"].get(code, 0) + len(ids)
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--split", choices=SPLITS, default=None, help="Only validate this split (default: all)")
+    parser.add_argument("--report", default=VALIDATION_REPORT, help=f"Where to write the JSON report (default: {VALIDATION_REPORT})")
+    parser.add_argument("--no-cache", action="store_true", help="Re-check every file instead of only changed ones")
+    parser.add_argument("--skip-decode", action="store_true", help="Don't check that images still decode")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: cpu count)")
+    args = parser.parse_args()
+
+    splits = [args.split] if args.split else SPLITS
+    report = validate_splits(splits, use_cache=not args.no_cache, check_decode=not args.skip_decode, workers=args.workers)
+
+    os.makedirs(os.path.dirname(args.report) or ".", exist_ok=True)
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=1)
+
+    for split, summary in report["splits"].items():
+        print(
+            f"{split}: {summary['samples']} samples ({summary['checked']} checked, {summary['cached']} cached), "
+            f"{summary['bad_samples']} with issues"
+        )
+        for code, count in summary["issue_counts"].items():
+            print(f"  {code}: {count}")
+    print(f"Report written to {args.report}")
+
+    if report["totals"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
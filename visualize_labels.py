@@ -8,19 +8,30 @@ Usage:
     python visualize_labels.py /path/to/123.jpg /path/to/123.txt
     python visualize_labels.py --random               # pick a random train image
     python visualize_labels.py --random --split val --count 5
+    python visualize_labels.py --sheet --count 640             # 10 8x8 contact sheets
+    python visualize_labels.py --sheet --class wK,bK --id-range 1000-5000 --grid 6
 
 Output image(s) are saved next to a "_labeled" suffix, e.g. 123_labeled.jpg,
-and opened for viewing if possible.
+and opened for viewing if possible. With --sheet, labeled thumbnails are drawn
+across a process pool and tiled into contact-sheet mosaics under
+datasets/contact_sheets (or --out-dir).
 """
 
 import argparse
+import multiprocessing
 import os
 import random
 
 from PIL import Image, ImageDraw, ImageFont
 
+from dataset_layout import IMAGE_EXTS, image_path, iter_sample_entries, sample_path
+
 DATASETS_IMAGES_DIR = "datasets/images"
 DATASETS_LABELS_DIR = "datasets/labels"
+CONTACT_SHEETS_DIR = "datasets/contact_sheets"
+
+SHEET_GRID = 8
+THUMB_SIZE = 160
 
 CLASS_NAMES = {
     "0": "bP", "1": "bR", "2": "bN", "3": "bB", "4": "bQ", "5": "bK",
@@ -38,26 +49,18 @@ def get_color(class_id):
     return CLASS_COLORS[class_id]
 
 
-def draw_labels(image_path, label_path, out_path):
-    image = Image.open(image_path).convert("RGB")
-    draw = ImageDraw.Draw(image)
-    img_w, img_h = image.size
-
-    try:
-        font = ImageFont.load_default()
-    except Exception:
-        font = None
-
+def read_label_lines(label_path):
     if not os.path.exists(label_path):
-        print(f"  No label file found at {label_path}")
-        return
-
+        return None
     with open(label_path) as f:
-        lines = [l.strip() for l in f if l.strip()]
+        return [l.strip() for l in f if l.strip()]
 
-    if not lines:
-        print("  Label file is empty.")
-        return
+
+def draw_boxes(image, lines, font=None, thin=False):
+    """Draws YOLO label lines onto `image` in place, returns the number of boxes drawn."""
+    draw = ImageDraw.Draw(image)
+    img_w, img_h = image.size
+    drawn = 0
 
     for line in lines:
         tokens = line.split()
@@ -76,9 +79,12 @@ def draw_labels(image_path, label_path, out_path):
         color = get_color(class_id)
         # Draw the board box thinner/dashed-ish (just thinner) so it doesn't
         # obscure piece boxes underneath it.
-        width = 1 if class_id == "12" else 2
+        width = 1 if class_id == "12" or thin else 2
         draw.rectangle([x1, y1, x2, y2], outline=color, width=width)
+        drawn += 1
 
+        if thin:
+            continue  # labels are unreadable at thumbnail size
         label_text = CLASS_NAMES.get(class_id, class_id)
         text_pos = (x1 + 2, max(0, y1 - 12))
         if font:
@@ -86,38 +92,176 @@ def draw_labels(image_path, label_path, out_path):
         else:
             draw.text(text_pos, label_text, fill=color)
 
+    return drawn
+
+
+def draw_labels(image_path, label_path, out_path):
+    image = Image.open(image_path).convert("RGB")
+
+    try:
+        font = ImageFont.load_default()
+    except Exception:
+        font = None
+
+    lines = read_label_lines(label_path)
+    if lines is None:
+        print(f"  No label file found at {label_path}")
+        return
+
+    if not lines:
+        print("  Label file is empty.")
+        return
+
+    draw_boxes(image, lines, font)
+
     image.save(out_path)
     print(f"  Saved: {out_path}  ({len(lines)} boxes)")
 
 
 def resolve_paths(image_id, split):
-    img_path = f"{DATASETS_IMAGES_DIR}/{split}/{image_id}.jpg"
-    lbl_path = f"{DATASETS_LABELS_DIR}/{split}/{image_id}.txt"
+    """Image and label paths of a sample id, in a flat or nested (ab/cd/<id>) split."""
+    img_path = image_path(f"{DATASETS_IMAGES_DIR}/{split}", image_id)
+    lbl_path = sample_path(f"{DATASETS_LABELS_DIR}/{split}", image_id, "txt")
     return img_path, lbl_path
 
 
 def pick_random_ids(split, count):
     img_dir = f"{DATASETS_IMAGES_DIR}/{split}"
-    ids = [f.split(".")[0] for f in os.listdir(img_dir) if f.endswith(".jpg")]
+    ids = [str(image_id) for image_id, _ in iter_sample_entries(img_dir, IMAGE_EXTS)]
     if not ids:
         raise SystemExit(f"No images found in {img_dir}")
     return random.sample(ids, min(count, len(ids)))
 
 
+def list_ids(split, id_range=None):
+    """Lists the numeric image ids of a split, optionally limited to an inclusive id range."""
+    ids = []
+    for image_id, _ in iter_sample_entries(f"{DATASETS_IMAGES_DIR}/{split}", IMAGE_EXTS):
+        if id_range and not (id_range[0] <= image_id <= id_range[1]):
+            continue
+        ids.append(str(image_id))
+    return ids
+
+
+def parse_class_filter(value):
+    if not value:
+        return None
+    name_to_id = {name: class_id for class_id, name in CLASS_NAMES.items()}
+    return {name_to_id.get(token.strip(), token.strip()) for token in value.split(",") if token.strip()}
+
+
+def parse_id_range(value):
+    if not value:
+        return None
+    start, _, end = value.partition("-")
+    return int(start), int(end or start)
+
+
+def render_thumbnail(args):
+    """Pool worker: returns (image_id, RGB bytes) of a labeled thumbnail, or None if filtered out."""
+    image_id, img_path, lbl_path, thumb_size, class_filter = args
+    lines = read_label_lines(lbl_path) or []
+    if class_filter and not any(line.split()[0] in class_filter for line in lines):
+        return None
+    try:
+        with Image.open(img_path) as img:
+            # let the JPEG decoder downscale in the DCT domain before we resize
+            img.draft("RGB", (thumb_size, thumb_size))
+            thumb = img.convert("RGB").resize((thumb_size, thumb_size), Image.BILINEAR)
+    except OSError:
+        return None
+
+    draw_boxes(thumb, lines, thin=True)
+    ImageDraw.Draw(thumb).text((2, 2), image_id, fill=(255, 255, 255))
+    return image_id, thumb.tobytes()
+
+
+def write_contact_sheets(split, count, grid=SHEET_GRID, thumb_size=THUMB_SIZE, class_filter=None,
+                         id_range=None, out_dir=None, workers=None):
+    """
+    Streams up to `count` labeled thumbnails from a pool into grid x grid mosaics.
+    Only the sheet being filled is kept in memory.
+    """
+    out_dir = out_dir or CONTACT_SHEETS_DIR
+    os.makedirs(out_dir, exist_ok=True)
+
+    ids = list_ids(split, id_range)
+    if not ids:
+        raise SystemExit(f"No images found in {DATASETS_IMAGES_DIR}/{split}")
+    random.shuffle(ids)
+
+    tasks = ((i, *resolve_paths(i, split), thumb_size, class_filter) for i in ids)
+    per_sheet = grid * grid
+    sheet = None
+    sheet_ids = []
+    sheet_index = 0
+    total = 0
+
+    def save_sheet():
+        nonlocal sheet, sheet_index
+        out_path = os.path.join(out_dir, f"{split}_sheet_{sheet_index:04d}.jpg")
+        sheet.save(out_path, "JPEG", quality=90)
+        print(f"  Saved: {out_path}  (ids {sheet_ids[0]}..{sheet_ids[-1]}, {len(sheet_ids)} images)")
+        sheet = None
+        sheet_ids.clear()
+        sheet_index += 1
+
+    num_workers = workers or max(1, multiprocessing.cpu_count())
+    with multiprocessing.Pool(num_workers) as pool:
+        for result in pool.imap(render_thumbnail, tasks, chunksize=16):
+            if result is None:
+                continue
+            image_id, data = result
+            if sheet is None:
+                sheet = Image.new("RGB", (grid * thumb_size, grid * thumb_size))
+            slot = len(sheet_ids)
+            thumb = Image.frombytes("RGB", (thumb_size, thumb_size), data)
+            sheet.paste(thumb, ((slot % grid) * thumb_size, (slot // grid) * thumb_size))
+            sheet_ids.append(image_id)
+            total += 1
+            if len(sheet_ids) == per_sheet:
+                save_sheet()
+            if total >= count:
+                break
+
+    if sheet is not None:
+        save_sheet()
+    print(f"Wrote {total} thumbnails to {sheet_index} contact sheet(s) in {out_dir}")
+
+
 def main():
     parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
     parser.add_argument("image_ref", nargs="?", help="Image id (e.g. 42) or path to an image file")
     parser.add_argument("label_ref", nargs="?", help="Optional explicit label path (only used with an explicit image path)")
     parser.add_argument("--split", default="train", choices=["train", "val"], help="Which dataset split to look in (default: train)")
     parser.add_argument("--random", action="store_true", help="Pick random image(s) instead of specifying an id")
-    parser.add_argument("--count", type=int, default=1, help="How many random images to visualize (with --random)")
+    parser.add_argument("--count", type=int, default=None, help="How many random images to visualize (with --random: default 1, with --sheet: one full sheet)")
     parser.add_argument("--out-dir", default=None, help="Directory to save labeled images (default: alongside source image)")
+    parser.add_argument("--sheet", action="store_true", help="Batch mode: tile random labeled thumbnails into contact sheets")
+    parser.add_argument("--grid", type=int, default=SHEET_GRID, help=f"Thumbnails per sheet row/column (default: {SHEET_GRID})")
+    parser.add_argument("--thumb-size", type=int, default=THUMB_SIZE, help=f"Thumbnail edge in pixels (default: {THUMB_SIZE})")
+    parser.add_argument("--class", dest="classes", default=None, help="Only sample images containing these classes, e.g. wK,bQ or 11,4")
+    parser.add_argument("--id-range", default=None, help="Only sample ids in this inclusive range, e.g. 1000-2000")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes for --sheet (default: cpu count)")
     args = parser.parse_args()
 
+    if args.sheet:
+        write_contact_sheets(
+            args.split,
+            args.count or args.grid * args.grid,
+            grid=args.grid,
+            thumb_size=args.thumb_size,
+            class_filter=parse_class_filter(args.classes),
+            id_range=parse_id_range(args.id_range),
+            out_dir=args.out_dir,
+            workers=args.workers,
+        )
+        return
+
     if args.random:
-        ids = pick_random_ids(args.split, args.count)
+        ids = pick_random_ids(args.split, args.count or 1)
         pairs = [resolve_paths(i, args.split) for i in ids]
-    elif args.image_ref and (args.image_ref.endswith(".jpg") or os.path.sep in args.image_ref):
+    elif args.image_ref and (args.image_ref.lower().endswith(tuple(f".{ext}" for ext in IMAGE_EXTS)) or os.path.sep in args.image_ref):
         img_path = args.image_ref
         lbl_path = args.label_ref or img_path.rsplit(".", 1)[0] + ".txt"
         # try to infer label path in the mirrored labels dir if not given
@@ -0,0 +1,199 @@
+"""
+Memory-bounded process pool for long generation runs.
+
+`multiprocessing.Pool` keeps every worker for the whole run, so per-worker
+caches and PIL buffers creep, and a single worker taken by the OOM killer
+takes the whole `pool.map` down with it. `BoundedPool.map` instead:
+  - samples each busy worker's RSS from /proc every WATCHDOG_INTERVAL seconds
+    and kills a worker that goes over the hard limit (budget * HARD_LIMIT_FACTOR);
+  - retires a worker after `max_tasks` tasks, or after a task that left it over
+    its budget, and starts a fresh one in its slot;
+  - re-queues the task of a worker that raised, died or was killed, up to
+    `max_attempts` runs per task; a task that fails every attempt maps to None;
+  - keeps tasks, recycles, failures and peak RSS per worker slot for `report()`.
+
+RSS includes the pages a forked worker still shares with the parent (e.g. the
+loaded boards), which is also what the OOM killer looks at. Tasks must be safe
+to re-run: the generator workers write to fixed ids, so a re-run overwrites
+whatever a failed attempt left behind.
+"""
+
+import multiprocessing
+import os
+import resource
+import traceback
+from collections import deque
+from multiprocessing.connection import wait
+from typing import Any, Callable, Iterable, List, Optional
+
+WATCHDOG_INTERVAL = 0.5  # seconds between RSS samples of busy workers
+HARD_LIMIT_FACTOR = 1.5  # a worker is killed mid-task above budget * HARD_LIMIT_FACTOR
+MAX_ATTEMPTS = 3
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def rss_bytes(pid: int) -> int:
+    """Resident set size of a process, 0 where /proc is not available."""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def _peak_rss_bytes() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # KiB on Linux
+
+
+def _worker_loop(conn, fn, initializer, budget, max_tasks):
+    if initializer is not None:
+        initializer()
+    done = 0
+    while True:
+        message = conn.recv()
+        if message is None:
+            return
+        index, task = message
+        try:
+            result, error = fn(task), None
+        except Exception:
+            result, error = None, traceback.format_exc()
+        done += 1
+        rss = rss_bytes(os.getpid())
+        retire = (max_tasks is not None and done >= max_tasks) or (budget is not None and rss > budget)
+        conn.send((index, result, error, _peak_rss_bytes(), retire))
+        if retire:
+            return
+
+
+class _Slot:
+    def __init__(self, number: int):
+        self.number = number
+        self.process: Optional[multiprocessing.Process] = None
+        self.conn = None
+        self.task: Optional[int] = None
+        self.killed = False
+        self.stats = {"tasks": 0, "recycled": 0, "killed": 0, "failed": 0, "peak_rss": 0}
+
+
+class BoundedPool:
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        memory_budget_mb: Optional[float] = None,
+        max_tasks: Optional[int] = None,
+        max_attempts: int = MAX_ATTEMPTS,
+        initializer: Optional[Callable[[], None]] = None,
+    ):
+        self.workers = workers or max(1, multiprocessing.cpu_count())
+        self.budget = int(memory_budget_mb * 2**20) if memory_budget_mb else None
+        self.max_tasks = max_tasks
+        self.max_attempts = max_attempts
+        self.initializer = initializer
+        self.slots: List[_Slot] = []
+        self.failed: List[int] = []
+
+    def _start(self, slot: _Slot, fn: Callable):
+        parent_conn, child_conn = multiprocessing.Pipe()
+        slot.process = multiprocessing.Process(
+            target=_worker_loop,
+            args=(child_conn, fn, self.initializer, self.budget, self.max_tasks),
+            daemon=True,
+        )
+        slot.process.start()
+        child_conn.close()
+        slot.conn, slot.task, slot.killed = parent_conn, None, False
+
+    def _stop(self, slot: _Slot):
+        slot.conn.close()
+        slot.process.join()
+        slot.process = slot.conn = None
+
+    def map(self, fn: Callable[[Any], Any], tasks: Iterable[Any]) -> List[Any]:
+        """Like Pool.map, but results of tasks that failed every attempt are None (indices in `self.failed`)."""
+        tasks = list(tasks)
+        results: List[Any] = [None] * len(tasks)
+        attempts = [0] * len(tasks)
+        pending = deque(range(len(tasks)))
+        remaining = len(tasks)
+        self.slots = [_Slot(number) for number in range(min(self.workers, len(tasks)))]
+        self.failed = []
+
+        def retry_or_fail(slot: _Slot, reason: str):
+            nonlocal remaining
+            index, slot.task = slot.task, None
+            slot.stats["failed"] += 1
+            if attempts[index] < self.max_attempts:
+                print(f"Task {index} {reason} (attempt {attempts[index]}/{self.max_attempts}), re-queued.")
+                pending.append(index)
+            else:
+                print(f"Task {index} {reason} on its last attempt, giving up.")
+                self.failed.append(index)
+                remaining -= 1
+
+        try:
+            while remaining:
+                for slot in self.slots:
+                    if slot.process is None and pending:
+                        self._start(slot, fn)
+                    if slot.process is not None and slot.task is None and pending:
+                        slot.task = pending.popleft()
+                        attempts[slot.task] += 1
+                        slot.conn.send((slot.task, tasks[slot.task]))
+
+                busy = [slot for slot in self.slots if slot.task is not None]
+                ready = wait([slot.conn for slot in busy] + [slot.process.sentinel for slot in busy], WATCHDOG_INTERVAL)
+                for slot in busy:
+                    if slot.conn in ready or slot.process.sentinel in ready:
+                        try:
+                            index, result, error, peak, retire = slot.conn.recv()
+                        except (EOFError, OSError):
+                            # died without answering: OOM killer, our watchdog or a hard crash
+                            slot.process.join()
+                            reason = "was killed over the memory limit" if slot.killed else f"lost its worker (exit code {slot.process.exitcode})"
+                            slot.stats["killed"] += slot.killed
+                            retry_or_fail(slot, reason)
+                            self._stop(slot)
+                            continue
+                        slot.stats["peak_rss"] = max(slot.stats["peak_rss"], peak)
+                        if error is not None:
+                            retry_or_fail(slot, f"raised {error.strip().splitlines()[-1]}")
+                        else:
+                            results[index] = result
+                            slot.stats["tasks"] += 1
+                            slot.task = None
+                            remaining -= 1
+                        if retire:
+                            slot.stats["recycled"] += 1
+                            self._stop(slot)
+                    else:
+                        rss = rss_bytes(slot.process.pid)
+                        slot.stats["peak_rss"] = max(slot.stats["peak_rss"], rss)
+                        if self.budget is not None and rss > self.budget * HARD_LIMIT_FACTOR and not slot.killed:
+                            slot.killed = True
+                            slot.process.kill()
+        finally:
+            for slot in self.slots:
+                if slot.process is not None:
+                    try:
+                        slot.conn.send(None)
+                    except OSError:
+                        pass
+                    if slot.task is not None:
+                        slot.process.kill()
+                    self._stop(slot)
+        return results
+
+    def report(self) -> str:
+        """Per-slot summary of the last map: tasks, recycled workers, failures and peak RSS."""
+        lines = []
+        for slot in self.slots:
+            stats = slot.stats
+            lines.append(
+                f"Worker {slot.number}: {stats['tasks']} tasks, {stats['recycled']} recycled, "
+                f"{stats['failed']} failed ({stats['killed']} killed), peak RSS {stats['peak_rss'] / 2**20:.0f} MB"
+            )
+        if self.failed:
+            lines.append(f"Tasks that failed every attempt: {sorted(self.failed)}")
+        return "\n".join(lines)